@@ -0,0 +1,138 @@
+import bisect
+import functools
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional, Tuple
+
+from models import TaskFlag, from_micros, to_micros
+from search import ACTIVE, DELETED, COMPLETED
+from timezones import localize
+
+# Счётчики вклада одной активной задачи
+FIELDS = ('ready', 'not_going', 'checklist_items', 'checklist_completed', 'preparation_completed')
+
+_HOUR = 3600 * 10**6
+
+
+@functools.lru_cache(maxsize=16384)
+def _kyiv_offset(hour: int) -> int:
+    """Смещение киевского времени от UTC (мкс) для часа настенного времени"""
+    wall = from_micros(hour * _HOUR)
+    return hour * _HOUR - to_micros(localize(wall))
+
+
+def _utc_micros(micros: int, aware: bool) -> int:
+    """Дата задачи -> микросекунды UTC (наивные даты - киевское время, как в utils)"""
+    if aware:
+        return micros
+    return micros - _kyiv_offset(micros // _HOUR)
+
+
+class TaskStats:
+    """Агрегаты для дашборда, обновляемые по одной задаче.
+
+    Для каждой задачи запоминается её вклад (секция, счётчики, даты);
+    add/remove вычитают старый вклад и добавляют новый, так что итоги
+    всегда готовы. Статус зависит от текущего времени, поэтому хранятся
+    отсортированные даты начала подготовки и события: число задач в
+    каждом статусе считается двоичным поиском по ним.
+    """
+
+    def __init__(self):
+        self.totals = dict.fromkeys(FIELDS, 0)
+        self.sections = dict.fromkeys((ACTIVE, DELETED, COMPLETED), 0)
+        # id задачи -> (секция, вклад, ключи дат или None)
+        self._tasks: Dict[str, Tuple[str, tuple, Optional[tuple]]] = {}
+        # (дата, id) активных задач без завершённой подготовки; both - позднейшая из двух дат
+        self._preparations = []
+        self._events = []
+        self._both = []
+
+    @classmethod
+    def build(cls, sections: Iterable[Tuple[str, Iterable]]) -> 'TaskStats':
+        stats = cls()
+        for where, tasks in sections:
+            for task in tasks:
+                stats._insert(task, where, sort=False)
+        stats._preparations.sort()
+        stats._events.sort()
+        stats._both.sort()
+        return stats
+
+    def add(self, task, where: str = ACTIVE):
+        """Учитывает задачу (заново, если она уже учтена)"""
+        self.remove(task.id)
+        self._insert(task, where)
+
+    def remove(self, task_id: str):
+        entry = self._tasks.pop(task_id, None)
+        if entry is None:
+            return
+        where, contribution, dates = entry
+        self.sections[where] -= 1
+        for field, value in zip(FIELDS, contribution):
+            self.totals[field] -= value
+        if dates is not None:
+            for order, key in zip((self._preparations, self._events, self._both), dates):
+                i = bisect.bisect_left(order, key)
+                del order[i]
+
+    def _insert(self, task, where: str, sort: bool = True):
+        # Задача с флагом удаления в активной секции в списки не попадает - считаем удалённой
+        if where == ACTIVE and task.has(TaskFlag.DELETED):
+            where = DELETED
+        self.sections[where] += 1
+        contribution, dates = (), None
+        if where == ACTIVE:
+            prepared = task.has(TaskFlag.PREPARATION_COMPLETED)
+            contribution = (
+                len(task.ready_users),
+                len(task.not_going_users),
+                len(task.checklist),
+                sum(1 for item in task.checklist.values() if item.is_completed),
+                int(prepared),
+            )
+            for field, value in zip(FIELDS, contribution):
+                self.totals[field] += value
+            if not prepared:
+                preparation = _utc_micros(task.preparation_date, task.has(TaskFlag.PREPARATION_DATE_AWARE))
+                event = _utc_micros(task.event_date, task.has(TaskFlag.EVENT_DATE_AWARE))
+                dates = ((preparation, task.id), (event, task.id), (max(preparation, event), task.id))
+                for order, key in zip((self._preparations, self._events, self._both), dates):
+                    if sort:
+                        bisect.insort(order, key)
+                    else:
+                        order.append(key)
+        self._tasks[task.id] = (where, contribution, dates)
+
+    def status_counts(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Число активных задач в каждом статусе (как utils.get_task_status)"""
+        now_us = to_micros(now or datetime.now(timezone.utc))
+        key = (now_us, '\uffff')  # все задачи с датой <= now
+        urgent = bisect.bisect_right(self._events, key)
+        preparation = bisect.bisect_right(self._preparations, key) - bisect.bisect_right(self._both, key)
+        return {
+            'future': len(self._events) - urgent - preparation,
+            'preparation': preparation,
+            'urgent': urgent,
+            'preparation_completed': self.totals['preparation_completed'],
+        }
+
+    def summary(self, now: Optional[datetime] = None) -> dict:
+        active = self.sections[ACTIVE]
+        totals = self.totals
+        return {
+            'tasks': dict(self.sections),
+            'status': self.status_counts(now),
+            'attendance': {
+                'ready': totals['ready'],
+                'not_going': totals['not_going'],
+                'ready_per_task': round(totals['ready'] / active, 2) if active else 0.0,
+                'not_going_per_task': round(totals['not_going'] / active, 2) if active else 0.0,
+            },
+            'checklist': {
+                'items': totals['checklist_items'],
+                'completed': totals['checklist_completed'],
+                'completion_ratio': (round(totals['checklist_completed'] / totals['checklist_items'], 4)
+                                     if totals['checklist_items'] else 0.0),
+            },
+        }
@@ -0,0 +1,62 @@
+"""Сравнение кодеков снимков: время записи/чтения и размер файла секции tasks.
+
+    python benchmarks/bench_snapshot.py --tasks 1000 10000 100000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import snapshot
+from datasets import make_tasks
+
+
+def measure(fn, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return round(best * 1000, 2)
+
+
+def bench(count: int, codecs, repeat: int) -> list:
+    tasks = make_tasks(count)
+    results = []
+    for name in codecs:
+        codec = snapshot.get_codec(name)
+        payload = codec.encode('tasks', tasks)
+        assert len(codec.decode('tasks', payload)) == count
+        results.append({
+            'tasks': count,
+            'codec': name,
+            'bytes': len(payload),
+            'encode_ms': measure(lambda: codec.encode('tasks', tasks), repeat),
+            'decode_ms': measure(lambda: codec.decode('tasks', payload), repeat),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tasks', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--codecs', nargs='+', default=sorted(snapshot.CODECS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--json', action='store_true', help='Print raw results as JSON')
+    args = parser.parse_args()
+
+    results = [row for count in args.tasks for row in bench(count, args.codecs, args.repeat)]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'tasks':>8} {'codec':<12} {'size, KB':>10} {'encode, ms':>11} {'decode, ms':>11}")
+    for row in results:
+        print(f"{row['tasks']:>8} {row['codec']:<12} {row['bytes'] / 1024:>10.0f} "
+              f"{row['encode_ms']:>11} {row['decode_ms']:>11}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""Бенчмарки горячих путей Database и API на синтетических данных.
+
+Результаты пишутся в JSON и сравниваются с прогоном на другом коммите:
+
+    python benchmarks/bench_suite.py --sizes 1000 10000 100000 --output before.json
+    python benchmarks/bench_suite.py --sizes 1000 10000 100000 --compare before.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import snapshot
+from database import Database
+from datasets import SIZES, make_dataset, write_dataset
+
+
+def timed(fn, repeat: int, setup=None) -> dict:
+    """Запускает fn repeat раз (setup перед каждым запуском не учитывается)"""
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        'runs': len(samples),
+        'min_ms': round(samples[0], 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3),
+        'mean_ms': round(statistics.fmean(samples), 3),
+    }
+
+
+class Bench:
+    """Набор замеров для одного размера данных"""
+
+    def __init__(self, size: int, workdir: str, codec: str, repeat: int):
+        self.size = size
+        self.codec = codec
+        self.repeat = repeat
+        self.source = os.path.join(workdir, f"source-{size}")
+        self.target = os.path.join(workdir, f"db-{size}")
+        self.results = []
+        dataset = make_dataset(size)
+        self.counts = {name: len(section) for name, section in dataset.items()}
+        write_dataset(self.source, dataset, codec)
+        self.db = None
+
+    def record(self, name: str, stats: dict, **extra):
+        row = {'size': self.size, 'name': name, **stats, **extra}
+        self.results.append(row)
+        print(f"{self.size:>8} {name:<38} median {row['median_ms']:>10.3f} ms  "
+              f"p95 {row['p95_ms']:>10.3f} ms", flush=True)
+
+    def reset(self):
+        """Свежая копия набора на диске (запись и очистка меняют файлы)"""
+        shutil.rmtree(self.target, ignore_errors=True)
+        shutil.copytree(self.source, self.target)
+
+    def open(self, retention_days: int = 10**5) -> Database:
+        # Срок хранения по умолчанию огромный: очистка при старте ничего не
+        # удаляет и не искажает замер загрузки
+        return Database(os.path.join(self.target, 'data.json'), os.path.join(self.target, 'photos'),
+                        deleted_retention_days=retention_days, codec=self.codec)
+
+    def run_database(self):
+        def load():
+            self.db = self.open()
+        self.record('database.load', timed(load, self.repeat, self.reset),
+                    load_stats=self.db.load_stats)
+
+        db = self.db
+
+        def save(*sections):
+            with db._lock.write():
+                db._save(*sections)
+            db._flush()
+        self.record('database.save_tasks', timed(lambda: save('tasks'), self.repeat))
+        self.record('database.save_all', timed(lambda: save(*Database.SECTIONS), self.repeat))
+        self.record('database.get_tasks', timed(db.get_tasks, self.repeat))
+        self.record('database.get_tasks_for_notification',
+                    timed(db.get_tasks_for_notification, self.repeat))
+
+        def open_for_cleanup():
+            self.reset()
+            self.db = self.open()
+            self.db.deleted_retention_days = 30
+        self.record('database.cleanup_old_tasks',
+                    timed(lambda: self.db.cleanup_old_tasks(), self.repeat, open_for_cleanup))
+
+    def run_api(self, main):
+        self.reset()
+        main.db = db = self.open()
+        main.response_cache.clear()
+        client = main.app.test_client()
+
+        def get(url):
+            response = client.get(url)
+            assert response.status_code == 200, (url, response.status_code)
+
+        self.record('api.get_tasks_cold', timed(lambda: get('/api/tasks'), self.repeat,
+                                                main.response_cache.clear))
+        self.record('api.get_tasks_warm', timed(lambda: get('/api/tasks'), self.repeat))
+
+        now = datetime.now()
+        search = (f"/api/tasks/search?date_from={(now - timedelta(days=7)).isoformat()}"
+                  f"&date_to={(now + timedelta(days=30)).isoformat()}")
+        self.record('api.search_tasks', timed(lambda: get(search), self.repeat))
+
+        db.build_search_index()
+        self.record('api.search_text', timed(lambda: get('/api/tasks/search?q=подія%2012'), self.repeat))
+        self.record('api.search_text_common', timed(lambda: get('/api/tasks/search?q=опис'), self.repeat))
+        get('/api/stats')
+        self.record('api.stats', timed(lambda: get('/api/stats'), self.repeat))
+
+        task = next(task for task in db.get_tasks() if task['checklist'])
+        item_id = task['checklist'][0]['id']
+        users = iter(range(10**9, 2 * 10**9))
+
+        def mark_ready():
+            response = client.post(f"/api/tasks/{task['id']}/ready", json={'user_id': next(users)})
+            assert response.status_code == 200, response.status_code
+        self.record('api.mark_ready', timed(mark_ready, self.repeat))
+
+        def toggle_item():
+            response = client.put(f"/api/tasks/{task['id']}/checklist/{item_id}",
+                                  json={'toggle_user': 10**8})
+            assert response.status_code == 200, response.status_code
+        self.record('api.update_checklist_item', timed(toggle_item, self.repeat))
+
+
+def import_app(workdir: str):
+    """Импортирует main.py в пустом каталоге (его собственная база там же)"""
+    # Замеры шлют изменяющие запросы подряд - ограничение частоты их бы искажало
+    os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        import main
+    finally:
+        os.chdir(cwd)
+    return main
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=os.path.dirname(__file__)).stdout.strip()
+    except OSError:
+        return ''
+
+
+def compare(results: list, baseline_path: str, threshold: float):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {(row['size'], row['name']): row for row in json.load(f)['results']}
+    print(f"\nvs {baseline_path} (median, ratio > {1 + threshold:.2f} marked)")
+    for row in results:
+        before = baseline.get((row['size'], row['name']))
+        if not before or not before['median_ms']:
+            continue
+        ratio = row['median_ms'] / before['median_ms']
+        mark = '  <-- slower' if ratio > 1 + threshold else ''
+        print(f"{row['size']:>8} {row['name']:<38} {before['median_ms']:>10.3f} -> "
+              f"{row['median_ms']:>10.3f} ms  x{ratio:.2f}{mark}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--codec', default='json', choices=sorted(snapshot.CODECS))
+    parser.add_argument('--skip-api', action='store_true')
+    parser.add_argument('--output', help='Write results to this JSON file')
+    parser.add_argument('--compare', help='Baseline JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    results = []
+    try:
+        app = None if args.skip_api else import_app(workdir)
+        for size in args.sizes:
+            bench = Bench(size, workdir, args.codec, args.repeat)
+            print(f"-- {size} tasks: {bench.counts}", flush=True)
+            bench.run_database()
+            if app:
+                bench.run_api(app)
+            results.extend(bench.results)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'codec': args.codec,
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if args.compare:
+        compare(results, args.compare, args.threshold)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""Синтетические наборы данных для бенчмарков.
+
+Генерация детерминирована (seed), даты событий отсчитываются от дня
+генерации, чтобы часть задач всегда попадала в окно уведомлений.
+
+    python benchmarks/datasets.py /tmp/bench-10k --tasks 10000
+"""
+import argparse
+import os
+import random
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import snapshot
+from models import Task, User, ChecklistItem, TaskFlag, to_micros
+
+# Размеры наборов по умолчанию: архивы и пользователи растут вместе с задачами
+SIZES = (1000, 10000, 100000)
+
+
+def make_users(count: int, seed: int = 1) -> dict:
+    rng = random.Random(seed)
+    users = {}
+    for i in range(count):
+        telegram_id = 10**8 + i
+        user = User(telegram_id, f"user{i}", f"Користувач {i}",
+                    language=rng.choice(('uk', 'uk', 'en')),
+                    created_at=to_micros(datetime(2024, 1, 1) + timedelta(minutes=i)))
+        users[str(telegram_id)] = user
+    return users
+
+
+def make_tasks(count: int, user_ids=None, seed: int = 1, checklist_size: int = 6,
+               now: datetime = None) -> dict:
+    """Задачи с событиями от -30 до +90 дней от now и чек-листами до checklist_size пунктов"""
+    rng = random.Random(seed)
+    now = (now or datetime.now()).replace(minute=0, second=0, microsecond=0)
+    user_ids = list(user_ids or range(10**8, 10**8 + 50))
+    tasks = {}
+    for i in range(count):
+        event = now + timedelta(hours=rng.randrange(-24 * 30, 24 * 90))
+        task = Task(str(uuid.UUID(int=rng.getrandbits(128))), f"Подія {i}",
+                    to_micros(event), to_micros(event - timedelta(days=3)),
+                    rng.choice(user_ids), f"user{rng.randrange(len(user_ids))}",
+                    description='Опис події ' * rng.randrange(1, 8),
+                    created_at=to_micros(event - timedelta(days=rng.randrange(1, 60))),
+                    flags=rng.choice((0, TaskFlag.NOTIFIED_WEEK_BEFORE)))
+        task.photos = [f"/photos/{uuid.UUID(int=rng.getrandbits(128)).hex}.jpg"
+                       for _ in range(rng.randrange(3))]
+        for j in range(rng.randrange(checklist_size + 1)):
+            item = ChecklistItem(str(uuid.UUID(int=rng.getrandbits(128))), f"Пункт {j}",
+                                 rng.sample(user_ids, min(rng.randrange(3), len(user_ids))))
+            task.checklist[item.id] = item
+        task.ready_users = dict.fromkeys(rng.sample(user_ids, min(rng.randrange(10), len(user_ids))))
+        task.not_going_users = dict.fromkeys(rng.sample(user_ids, min(rng.randrange(4), len(user_ids))))
+        tasks[task.id] = task
+    return tasks
+
+
+def make_dataset(tasks: int, users: int = None, deleted: int = None, completed: int = 10,
+                 checklist_size: int = 6, seed: int = 1) -> dict:
+    """Секции хранилища: активные задачи, пользователи и архивы.
+
+    Треть удалённых задач старше срока хранения (их убирает очистка).
+    """
+    users = max(tasks // 20, 50) if users is None else users
+    deleted = tasks // 2 if deleted is None else deleted
+    user_section = make_users(users, seed)
+    user_ids = [user.telegram_id for user in user_section.values()]
+    active = make_tasks(tasks, user_ids, seed, checklist_size)
+
+    now = datetime.now()
+    deleted_section = make_tasks(deleted, user_ids, seed + 1, checklist_size)
+    for i, task in enumerate(deleted_section.values()):
+        age = timedelta(days=45 + i % 30) if i % 3 == 0 else timedelta(hours=i % 500)
+        task.deleted_at = to_micros(now - age)
+        task.set_flag(TaskFlag.DELETED, True)
+
+    completed_section = list(make_tasks(completed, user_ids, seed + 2, checklist_size).values())
+    for i, task in enumerate(completed_section):
+        task.completed_at = to_micros(now - timedelta(hours=i))
+        task.set_flag(TaskFlag.PREPARATION_COMPLETED, True)
+
+    return {'tasks': active, 'users': user_section,
+            'deleted_tasks': deleted_section, 'completed_tasks': completed_section}
+
+
+def write_dataset(directory: str, dataset: dict, codec: str = 'json', db_file: str = 'data.json'):
+    """Записывает секции в файлы, которые читает Database(db_file=...)"""
+    os.makedirs(directory, exist_ok=True)
+    encoder = snapshot.get_codec(codec)
+    root, _ = os.path.splitext(os.path.join(directory, db_file))
+    for name, section in dataset.items():
+        with open(f"{root}.{name}{encoder.extension}", 'wb') as f:
+            f.write(encoder.encode(name, section))
+    return os.path.join(directory, db_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic datastore')
+    parser.add_argument('directory')
+    parser.add_argument('--tasks', type=int, default=1000)
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--deleted', type=int)
+    parser.add_argument('--completed', type=int, default=10)
+    parser.add_argument('--checklist-size', type=int, default=6)
+    parser.add_argument('--codec', default='json', choices=sorted(snapshot.CODECS))
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    dataset = make_dataset(args.tasks, args.users, args.deleted, args.completed,
+                           args.checklist_size, args.seed)
+    path = write_dataset(args.directory, dataset, args.codec)
+    print(f"{path}: " + ', '.join(f"{name}={len(section)}" for name, section in dataset.items()))
+
+
+if __name__ == '__main__':
+    main()
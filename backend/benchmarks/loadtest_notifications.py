@@ -0,0 +1,241 @@
+"""Нагрузочный тест рассылки уведомлений на локальной заглушке Telegram Bot API.
+
+Заглушка принимает sendMessage с настраиваемой задержкой, долей ответов
+429 и отказов. Тест прогоняет check_notifications из main.py на
+синтетических пользователях и задачах и сверяет доставленное с ожидаемым.
+
+    python benchmarks/loadtest_notifications.py --users 2000 --tasks 500 \\
+        --latency-ms 30 --jitter-ms 20 --rate-429 0.02 --fail-rate 0.01
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from database import Database
+from shards import ShardedDatabase
+from datasets import make_dataset, write_dataset
+from notifications import TelegramNotifier
+from bench_suite import import_app
+
+TOKEN = 'loadtest'
+
+
+class TelegramStub:
+    """Минимальный Bot API: sendMessage и answerCallbackQuery на localhost"""
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, rate_429: float = 0,
+                 fail_rate: float = 0, retry_after: int = 1, seed: int = 1):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.rate_429 = rate_429
+        self.fail_rate = fail_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.delivered = []  # принятые сообщения (запрос JSON)
+        self.responses = Counter()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name='telegram-stub', daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _decide(self) -> str:
+        with self.lock:
+            roll = self.rng.random()
+            delay = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+        if roll < self.rate_429:
+            return '429', delay
+        if roll < self.rate_429 + self.fail_rate:
+            return 'fail', delay
+        return 'ok', delay
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, code: int, body: dict):
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                data = json.loads(self.rfile.read(length) or b'{}')
+                method = self.path.rsplit('/', 1)[-1]
+                outcome, delay = stub._decide()
+                time.sleep(delay)
+                with stub.lock:
+                    stub.responses[outcome] += 1
+                if outcome == '429':
+                    self._reply(429, {'ok': False, 'error_code': 429,
+                                      'description': 'Too Many Requests: retry later',
+                                      'parameters': {'retry_after': stub.retry_after}})
+                    return
+                if outcome == 'fail':
+                    self._reply(500, {'ok': False, 'error_code': 500, 'description': 'Internal Server Error'})
+                    return
+                with stub.lock:
+                    if method == 'sendMessage':
+                        stub.delivered.append(data)
+                    message_id = len(stub.delivered)
+                self._reply(200, {'ok': True, 'result': {'message_id': message_id}})
+
+        return Handler
+
+
+class TimedNotifier(TelegramNotifier):
+    """Notifier, запоминающий длительность каждого вызова sendMessage"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.durations = []
+        self._lock = threading.Lock()
+
+    def send_notification(self, chat_id, message, buttons=None):
+        started = time.perf_counter()
+        try:
+            return super().send_notification(chat_id, message, buttons)
+        finally:
+            with self._lock:
+                self.durations.append(time.perf_counter() - started)
+
+
+def message_keys(data: dict, digest: bool = False) -> list:
+    """Напоминания в теле sendMessage: (chat_id, task_id, тип), для дайджестов - (chat_id, task_id)"""
+    rows = data.get('reply_markup', {}).get('inline_keyboard', [])
+    task_ids = [button['callback_data'].split('_', 1)[1] for row in rows for button in row
+                if button.get('callback_data', '').startswith('ready_')]
+    if digest:
+        return [(data.get('chat_id'), task_id) for task_id in task_ids]
+    kind = 'week_before' if data.get('text', '').startswith('📅') else 'day_before'
+    return [(data.get('chat_id'), task_ids[0] if task_ids else None, kind)]
+
+
+def expected_messages(db: Database, digest: bool = False) -> Counter:
+    """Что должна разослать check_notifications при текущей логике отправки"""
+    users = db.get_all_users()
+    tasks = db.get_tasks_for_notification()
+    expected = Counter()
+    if digest:
+        # Дайджест: каждой задаче - одна строка кнопок у каждого пользователя
+        for user in users:
+            for task_id in dict.fromkeys(task['id'] for task in tasks):
+                expected[(user['telegram_id'], task_id)] += 1
+        return expected
+    for task in tasks:
+        for user in users:
+            # send_task_notification шлёт только пользователям с языком 'uk'
+            if user.get('language', 'uk') == 'uk':
+                expected[(user['telegram_id'], task['id'], task['notification_type'])] += 1
+    return expected
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix='loadtest-')
+    stub = TelegramStub(args.latency_ms, args.jitter_ms, args.rate_429, args.fail_rate,
+                        seed=args.seed).start()
+    try:
+        dataset = make_dataset(args.tasks, users=args.users, deleted=0, completed=0, seed=args.seed)
+        db_file = write_dataset(os.path.join(workdir, 'db'), dataset)
+        main = import_app(workdir)
+        main.db = ShardedDatabase(db_file, os.path.join(workdir, 'shards'),
+                                  os.path.join(workdir, 'db', 'photos'))
+        main.notifier = notifier = TimedNotifier(TOKEN, stub.url)
+        main.DIGEST_DEFAULT = args.digest
+
+        expected = expected_messages(main.db, args.digest)
+        started = time.perf_counter()
+        main.check_notifications()
+        elapsed = time.perf_counter() - started
+    finally:
+        stub.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    delivered = Counter(key for data in stub.delivered for key in message_keys(data, args.digest))
+    duplicates = sum(count - 1 for count in delivered.values() if count > 1)
+    lost = sum(max(count - delivered.get(key, 0), 0) for key, count in expected.items())
+    unexpected = sum(count for key, count in delivered.items() if key not in expected)
+    durations_ms = [d * 1000 for d in notifier.durations]
+    return {
+        'config': vars(args),
+        'expected': sum(expected.values()),
+        'requests': len(durations_ms),
+        'messages': len(stub.delivered),
+        'delivered': sum(delivered.values()),
+        'duplicates': duplicates,
+        'lost': lost,
+        'unexpected': unexpected,
+        'stub_responses': dict(stub.responses),
+        'elapsed_s': round(elapsed, 3),
+        'throughput_msg_s': round(len(stub.delivered) / elapsed, 1) if elapsed else 0,
+        'latency_ms': {
+            'p50': round(percentile(durations_ms, 0.50), 2),
+            'p95': round(percentile(durations_ms, 0.95), 2),
+            'p99': round(percentile(durations_ms, 0.99), 2),
+            'max': round(max(durations_ms, default=0), 2),
+            'mean': round(statistics.fmean(durations_ms), 2) if durations_ms else 0,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--tasks', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--jitter-ms', type=float, default=10)
+    parser.add_argument('--rate-429', type=float, default=0.0)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--digest', action='store_true', help='Send reminders as per-user digests')
+    parser.add_argument('--output', help='Write the report to this JSON file')
+    args = parser.parse_args()
+
+    report = run(args)
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+import threading
+import time
+from typing import Callable, Optional, Tuple
+
+
+class CachedResponse:
+    __slots__ = ('version', 'expires_at', 'body', 'etag')
+
+    def __init__(self, version: int, expires_at: float, body: bytes):
+        self.version = version
+        self.expires_at = expires_at
+        self.body = body
+        self.etag = f"{version}-{int(expires_at) if expires_at != float('inf') else 0}"
+
+
+class ResponseCache:
+    """Кэш готовых (сериализованных) ответов для списков задач.
+
+    Запись действительна, пока не изменилась версия данных Database
+    (она растёт с каждым сохранённым изменением) и не наступил ближайший
+    момент смены статуса какой-либо задачи (начало подготовки/события).
+    Сборка идёт под блокировкой ключа, чтобы при промахе ответ строил
+    один поток (ответы разных ключей, например групп, строятся параллельно).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._entries = {}
+
+    def get(self, key: str, version: int,
+            build: Callable[[], Tuple[bytes, Optional[float]]]) -> CachedResponse:
+        """Вернуть запись для key или собрать её через build() -> (body, expires_at)"""
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            entry = self._entries.get(key)
+            if entry and entry.version == version and time.time() < entry.expires_at:
+                return entry
+
+            body, expires_at = build()
+            entry = CachedResponse(version, float('inf') if expires_at is None else expires_at, body)
+            self._entries[key] = entry
+            return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -1,250 +1,1287 @@
 import json
 import os
-from datetime import datetime, timedelta
-from typing import List, Optional, Dict
+import time
+import base64
+import bisect
+import functools
+import threading
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Dict, Tuple
 import shutil
 from pathlib import Path
 
+from locks import RWLock, FileLock
+from models import Task, User, ChecklistItem, TaskFlag, encode_datetime, to_micros, now_micros
+import snapshot
+import mmapstore
+from search import SearchIndex, ACTIVE, DELETED, COMPLETED
+from analytics import TaskStats
+from images import thumbnail_path
+from timezones import KYIV, DEFAULT_TIMEZONE, localize
+from metrics import DB_SAVE_SECONDS, DB_FLUSH_SECONDS, DB_WRITTEN_BYTES, DB_WRITES
+
+def _clone(value):
+    """Копия результата в JSON-виде (dict/list), отдаваемая наружу"""
+    if isinstance(value, (Task, User)):
+        return value.to_json()
+    if isinstance(value, dict):
+        return {k: _clone(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_clone(v) for v in value]
+    return value
+
+def _locked(mode: str):
+    """Выполняет метод Database под блокировкой чтения или записи.
+    
+    Внешний вызов (поток ещё не держал блокировку) получает копию
+    результата, чтобы вызывающий код не видел и не менял живые данные
+    вне блокировки. После внешнего вызова с записью снимок данных
+    сбрасывается на диск уже без блокировки данных.
+    
+    С общим снимком (shared_snapshot) внешний вызов сперва подхватывает
+    изменения других процессов, а запись целиком, вместе со сбросом на
+    диск, идёт под межпроцессной блокировкой писателя.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self._lock.held():
+                with getattr(self._lock, mode)():
+                    return method(self, *args, **kwargs)
+            with self._writer_path() if mode == 'write' else nullcontext():
+                self._sync()
+                with getattr(self._lock, mode)():
+                    result = _clone(method(self, *args, **kwargs))
+                if mode == 'write':
+                    self._flush()
+            return result
+        return wrapper
+    return decorator
+
+_reads = _locked('read')
+_writes = _locked('write')
+
+class BatchError(Exception):
+    """Пакет операций прерван ошибкой; results - результаты до неё включительно"""
+    def __init__(self, results: List[dict]):
+        super().__init__(results[-1].get('error'))
+        self.results = results
+
 class Database:
-    def __init__(self, db_file='data.json', photos_dir='photos'):
+    # Секции хранятся в отдельных файлах (data.tasks.json, data.users.json, ...),
+    # расширение зависит от кодека снимков (см. snapshot.py)
+    SECTIONS = ('tasks', 'users', 'deleted_tasks', 'completed_tasks')
+    # В ленивом режиме при старте читаются только активные задачи
+    # (с общим снимком - не читаются вовсе, см. mmapstore.py)
+    LAZY_SECTIONS = ('users', 'deleted_tasks', 'completed_tasks')
+    # Секции с задачами: только их изменения затрагивают поиск и статистику
+    TASK_SECTIONS = ('tasks', 'deleted_tasks', 'completed_tasks')
+    # Журнал изменённых задач в data.generation: сколько последних сохранений
+    # в нём хранится и сколько задач помещается в одну запись (крупное
+    # изменение, например импорт, записывается как "перестроить всё")
+    CHANGE_LOG_SIZE = 64
+    CHANGE_LOG_MAX_TASKS = 1000
+    
+    def __init__(self, db_file='data.json', photos_dir='photos',
+                 completed_limit=10, deleted_retention_days=30, lazy_load=False,
+                 codec='json', shared_snapshot=False):
+        started = time.perf_counter()
         self.db_file = db_file
         self.photos_dir = photos_dir
+        self.completed_limit = completed_limit
+        self.deleted_retention_days = deleted_retention_days
+        self.codec = snapshot.get_codec(codec)
         Path(photos_dir).mkdir(exist_ok=True)
-        self.data = self._load()
-        self._cleanup_old_tasks()
+        self._lock = RWLock()
+        # Снимки секций для записи на диск: секция -> сериализованные данные,
+        # в порядке фиксации (см. _save)
+        self._file_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending = {}
+        # Файлы фото, убранных из задач: удаляются только после записи снимка,
+        # который на них уже не ссылается (откат транзакции их сохраняет)
+        self._removed_photos: List[str] = []
+        self._pending_photos: List[str] = []
+        # Версия данных; стартует от текущего времени, чтобы не повторяться
+        # между перезапусками (используется в ETag)
+        self._version = time.time_ns() // 1000
+        self._tx_depth = 0
+        self._tx_dirty = {}
+        self._section_lock = threading.RLock()
+        self.load_stats = {}
+        # Общий снимок для нескольких процессов: задачи читаются из
+        # отображённого data.tasks.idx, пишет один процесс за раз
+        self._shared = shared_snapshot
+        root, _ = os.path.splitext(db_file)
+        self._index_file = f"{root}.tasks.idx"
+        self._generation_file = f"{root}.generation"
+        self._writer = FileLock(f"{root}.lock") if shared_snapshot else None
+        self._mapped = None
+        # Версии секций, которые видит процесс (для сверки с data.generation)
+        self._section_versions = {}
+        self._generation_stat = None
+        # Полнотекстовый индекс и статистика строятся при первом обращении
+        # (см. search.py, analytics.py) и дальше обновляются по одной задаче
+        self._search = None
+        self._stats = None
+        self._derived_lock = threading.Lock()
+        # С общим снимком: задачи, изменённые с последнего сохранения (id ->
+        # секция, None - удалена насовсем), и журнал последних сохранений
+        # всех процессов - по нему индекс и статистика обновляются по задаче
+        self._changed = {}
+        self._change_log = []
+        
+        self._open_storage()
+        names = ('tasks',) if lazy_load else self.SECTIONS
+        if shared_snapshot:
+            self._open_shared()
+            names = [name for name in names if name != 'tasks']
+        for name in names:
+            self._section(name)
+        self.load_stats['startup_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        
+        # Очистка архива требует загрузки архивов: в ленивом режиме её
+        # запускает вызывающий код (в main.py - задание cleanup_archive при
+        # старте воркера). Поток из конструктора не пережил бы fork, если база
+        # создаётся в мастере gunicorn (--preload)
+        if not lazy_load:
+            self.cleanup_old_tasks()
     
-    def _load(self):
-        if os.path.exists(self.db_file):
-            with open(self.db_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {
-            'users': {},
-            'tasks': {},
-            'deleted_tasks': {},
-            'completed_tasks': []
+    @property
+    def version(self) -> int:
+        """Версия данных: растёт с каждым сохранённым изменением"""
+        if not self._lock.held():
+            self._sync()
+        return self._version
+    
+    # === STORAGE ===
+    def _section_file(self, name: str, extension: Optional[str] = None) -> str:
+        root, _ = os.path.splitext(self.db_file)
+        return f"{root}.{name}{extension or self.codec.extension}"
+    
+    def _existing_section_file(self, name: str) -> Optional[str]:
+        """Файл секции на диске в любом формате; при смене кодека мог
+        остаться файл старого формата - берётся более свежий"""
+        paths = [self._section_file(name, ext) for ext in snapshot.EXTENSIONS]
+        paths = [path for path in paths if os.path.exists(path)]
+        return max(paths, key=os.path.getmtime, default=None)
+    
+    def _open_storage(self):
+        """Готовит хранилище; старый единый data.json читается целиком и
+        переносится в файлы секций при первом сохранении"""
+        self.data = {}
+        if self._existing_section_file('tasks') or not os.path.exists(self.db_file):
+            return
+        
+        started = time.perf_counter()
+        with open(self.db_file, 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+        for name in self.SECTIONS:
+            self._publish_section(name, snapshot.records_from_json(name, raw.get(name)))
+        self.load_stats['legacy_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        
+        for name in self.SECTIONS:
+            self._pending[name] = self._encode_section(name)
+        self._flush()
+        os.replace(self.db_file, f"{self.db_file}.migrated")
+    
+    def _open_shared(self):
+        """Отображает общий снимок задач; если его ещё нет - публикует"""
+        with self._writer.hold():
+            self._sync()
+            if self._mapped is not None:
+                return
+            with self._lock.write():
+                self._section('tasks')
+                self._save('tasks')
+            self._flush()
+            self._sync()
+            # Разобранные задачи больше не нужны - читаем из снимка
+            with self._lock.write():
+                self.data.pop('tasks', None)
+    
+    def _writer_path(self):
+        return self._writer.hold() if self._shared else nullcontext()
+    
+    def _sync(self):
+        """Подхватывает изменения, записанные другими процессами.
+        
+        Изменённые секции выгружаются (и читаются заново при обращении),
+        снимок задач отображается заново. Проверка - один stat файла
+        data.generation.
+        
+        Индекс поиска и статистика не перестраиваются: изменённые задачи
+        берутся из журнала data.generation (см. _apply_changes).
+        """
+        if not self._shared:
+            return
+        try:
+            stat = os.stat(self._generation_file)
+        except FileNotFoundError:
+            return
+        signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if signature == self._generation_stat:
+            return
+        with open(self._generation_file, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+        with self._lock.write():
+            first_sync = self._generation_stat is None
+            self._generation_stat = signature
+            tasks_changed = False
+            for name, version in state['sections'].items():
+                # Свои же изменения (версия не новее) перечитывать не нужно
+                if version <= self._section_versions.get(name, -1):
+                    continue
+                self._section_versions[name] = version
+                self.data.pop(name, None)
+                tasks_changed = tasks_changed or name in self.TASK_SECTIONS
+                if name == 'tasks':
+                    mapped, self._mapped = self._mapped, mmapstore.open_snapshot(self._index_file)
+                    if mapped is not None:
+                        mapped.close()
+            self._change_log = state.get('changes', [])
+            if tasks_changed:
+                if first_sync:
+                    self._search = self._stats = None
+                else:
+                    self._apply_changes(self._version, state['version'])
+            # Версия общая для всех процессов (одинаковые ETag в любом воркере)
+            self._version = state['version'] if first_sync else max(self._version, state['version'])
+    
+    def _active_tasks(self):
+        """Активные задачи: из памяти, а если секция не загружена - из
+        отображённого снимка (без разбора всей секции)"""
+        tasks = self.data.get('tasks')
+        if tasks is None and self._mapped is not None:
+            return self._mapped
+        return self._section('tasks')
+    
+    def _section(self, name: str):
+        """Секция данных; при первом обращении читается с диска"""
+        section = self.data.get(name)
+        if section is None:
+            with self._section_lock:
+                section = self.data.get(name)
+                if section is None:
+                    section = self._load_section(name)
+        return section
+    
+    def _load_section(self, name: str):
+        started = time.perf_counter()
+        path = self._existing_section_file(name)
+        mapped = self._mapped
+        if name == 'tasks' and mapped is not None and mapped.version == self._section_versions.get('tasks'):
+            # Снимок актуален: декодировать записи быстрее, чем читать секцию
+            section = {task.id: task for task in mapped.values()}
+        elif path:
+            with open(path, 'rb') as f:
+                payload = f.read()
+            # Формат определяется по содержимому, а не по текущему кодеку
+            section = snapshot.codec_for(payload).decode(name, payload)
+        else:
+            section = snapshot.records_from_json(name, None)
+        
+        if name != 'tasks':
+            # Задача может оказаться в двух секциях, если процесс упал между
+            # записью файлов; активная копия главнее (см. порядок в _save)
+            active = self._active_tasks()
+            if name == 'completed_tasks':
+                section = [task for task in section if task.id not in active]
+            elif name == 'deleted_tasks':
+                section = {task_id: task for task_id, task in section.items() if task_id not in active}
+        
+        self._publish_section(name, section)
+        self.load_stats[name] = {
+            'ms': round((time.perf_counter() - started) * 1000, 1),
+            'records': len(section)
         }
+        return self.data[name]
     
-    def _save(self):
-        with open(self.db_file, 'w', encoding='utf-8') as f:
-            json.dump(self.data, f, ensure_ascii=False, indent=2, default=str)
+    def _publish_section(self, name: str, section):
+        """Строит индексы секции и делает её видимой"""
+        if name == 'deleted_tasks':
+            self._index_deleted(section)
+        elif name == 'completed_tasks':
+            self._index_completed(section)
+        self.data[name] = section
+        if name == 'completed_tasks':
+            self._sync_completed_list()
+    
+    def _encode_section(self, name: str) -> bytes:
+        """Записи секции -> содержимое файла в формате текущего кодека"""
+        return self.codec.encode(name, self.data[name])
+    
+    def _save(self, *sections: str):
+        """Фиксирует изменения: делает снимки изменённых секций под блокировкой записи.
+        
+        Секции перечисляются так, что та, куда задача переходит, идёт первой:
+        файлы пишутся в этом порядке, и при сбое между записями задача
+        окажется в двух секциях, но не потеряется. Сами файлы пишет _flush
+        после снятия блокировки данных.
+        """
+        # Внутри транзакции запись откладывается до её завершения
+        if self._tx_depth:
+            for name in sections:
+                self._tx_dirty.pop(name, None)
+                self._tx_dirty[name] = True
+            return
+        with DB_SAVE_SECONDS.time():
+            snapshots = [(name, self._encode_section(name)) for name in sections]
+            self._version += 1
+            if self._shared:
+                # Снимок задач для чтения и версии секций - после самих секций
+                if 'tasks' in sections:
+                    snapshots.append(('index', mmapstore.build(self.data['tasks'].values(), self._version)))
+                for name in sections:
+                    self._section_versions[name] = self._version
+                changed, self._changed = self._changed, {}
+                entry = list(changed.items()) if len(changed) <= self.CHANGE_LOG_MAX_TASKS else None
+                self._change_log = [*self._change_log, [self._version, entry]][-self.CHANGE_LOG_SIZE:]
+                generation = {'version': self._version, 'sections': self._section_versions,
+                              'changes': self._change_log}
+                snapshots.append(('generation', json.dumps(generation).encode('utf-8')))
+        removed, self._removed_photos = self._removed_photos, []
+        with self._pending_lock:
+            for name, payload in snapshots:
+                self._pending.pop(name, None)
+                self._pending[name] = payload
+            self._pending_photos.extend(removed)
+    
+    def _flush(self):
+        """Записывает последние снимки секций на диск (атомарно, через временный файл)"""
+        with self._file_lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+                photos, self._pending_photos = self._pending_photos, []
+            if pending:
+                with DB_FLUSH_SECONDS.time():
+                    self._write_pending(pending)
+            self._unlink_photos(photos)
+    
+    def _write_pending(self, pending: dict):
+        for name, payload in pending.items():
+            if name == 'index':
+                path = self._index_file
+            elif name == 'generation':
+                path = self._generation_file
+            else:
+                path = self._section_file(name)
+            tmp_file = f"{path}.tmp"
+            with open(tmp_file, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_file, path)
+            DB_WRITES.inc(file=name)
+            DB_WRITTEN_BYTES.inc(len(payload), file=name)
+            if name not in self.SECTIONS:
+                continue
+            # Файл секции в другом формате (до смены кодека) устарел
+            for ext in snapshot.EXTENSIONS:
+                stale = self._section_file(name, ext)
+                if stale != path and os.path.exists(stale):
+                    os.remove(stale)
+    
+    @contextmanager
+    def transaction(self):
+        """Группирует изменения в одно сохранение под одной блокировкой записи.
+        
+        При исключении состояние откатывается к последнему сохранённому
+        снимку (внутри транзакции снимки не делаются).
+        """
+        outermost = not self._lock.held()
+        with self._writer_path() if outermost else nullcontext():
+            if outermost:
+                self._sync()
+            with self._lock.write():
+                self._tx_depth += 1
+                try:
+                    yield self
+                except BaseException:
+                    self._tx_depth -= 1
+                    if self._tx_depth == 0:
+                        self._tx_dirty = {}
+                        self._removed_photos = []
+                        # Дописываем на диск последние зафиксированные снимки и
+                        # перечитываем загруженные секции
+                        self._flush()
+                        loaded = [name for name in self.SECTIONS if name in self.data]
+                        self.data = {}
+                        self._search = self._stats = None
+                        self._changed = {}
+                        for name in loaded:
+                            self._section(name)
+                    raise
+                self._tx_depth -= 1
+                if self._tx_depth == 0 and self._tx_dirty:
+                    dirty, self._tx_dirty = self._tx_dirty, {}
+                    self._save(*dirty)
+            if outermost:
+                self._flush()
     
-    def _cleanup_old_tasks(self):
+    @_writes
+    def cleanup_old_tasks(self):
         """Удаляет задачи старше месяца из архива"""
-        now = datetime.now()
-        one_month_ago = now - timedelta(days=30)
-        
-        # Очистка удалённых
-        to_remove = []
-        for task_id, task in self.data['deleted_tasks'].items():
-            deleted_at = datetime.fromisoformat(task.get('deleted_at', task['created_at']))
-            if deleted_at < one_month_ago:
-                to_remove.append(task_id)
-        
-        for task_id in to_remove:
-            # Удаляем фото
-            for photo in self.data['deleted_tasks'][task_id].get('photos', []):
-                photo_path = os.path.join(self.photos_dir, os.path.basename(photo))
-                if os.path.exists(photo_path):
-                    os.remove(photo_path)
-            del self.data['deleted_tasks'][task_id]
-        
-        # Очистка завершённых (оставляем только последние 10)
-        self.data['completed_tasks'].sort(
-            key=lambda x: x.get('completed_at', x['created_at']), 
-            reverse=True
-        )
+        cutoff = to_micros(datetime.now() - timedelta(days=self.deleted_retention_days))
+        deleted_tasks = self._section('deleted_tasks')
+        self._section('completed_tasks')
         
-        # Удаляем фото из старых завершённых задач
-        for old_task in self.data['completed_tasks'][10:]:
-            for photo in old_task.get('photos', []):
-                photo_path = os.path.join(self.photos_dir, os.path.basename(photo))
-                if os.path.exists(photo_path):
-                    os.remove(photo_path)
+        # Очистка удалённых: самые старые лежат в начале индекса
+        stale = bisect.bisect_left(self._deleted_order, (cutoff,))
+        for _, task_id in self._deleted_order[:stale]:
+            self._remove_photos(deleted_tasks.pop(task_id).photos)
+            self._unindex(task_id)
+        del self._deleted_order[:stale]
         
-        self.data['completed_tasks'] = self.data['completed_tasks'][:10]
+        # Очистка завершённых (оставляем только последние completed_limit)
+        trimmed = self._trim_completed()
+        if stale or trimmed:
+            self._save('deleted_tasks', 'completed_tasks')
+    
+    def _trim_completed(self) -> bool:
+        """Удаляет завершённые задачи сверх completed_limit вместе с фото"""
+        overflow = max(len(self._completed_order) - self.completed_limit, 0)
+        for _, task_id in self._completed_order[:overflow]:
+            self._remove_photos(self._completed_by_id.pop(task_id).photos)
+            self._unindex(task_id)
+        del self._completed_order[:overflow]
+        self._sync_completed_list()
+        return overflow > 0
+    
+    def _remove_photos(self, photos: List[str]):
+        """Помечает файлы фото к удалению при следующем сохранении (см. _flush)"""
+        self._removed_photos.extend(photos)
+    
+    def _unlink_photos(self, photos: List[str]):
+        for photo in photos:
+            photo_path = os.path.join(self.photos_dir, os.path.basename(photo))
+            # Вместе с фото - его превью (images.make_thumbnail)
+            for path in (photo_path, thumbnail_path(photo_path)):
+                if os.path.exists(path):
+                    os.remove(path)
+    
+    # === ARCHIVE INDEXES ===
+    @staticmethod
+    def _deleted_key(task: Task) -> tuple:
+        return (task.created_at if task.deleted_at is None else task.deleted_at, task.id)
+    
+    @staticmethod
+    def _completed_key(task: Task) -> tuple:
+        return (task.created_at if task.completed_at is None else task.completed_at, task.id)
+    
+    def _index_deleted(self, deleted_tasks: dict):
+        """Строит отсортированный индекс (ключ, id) удалённых задач.
         
-        if to_remove or len(self.data['completed_tasks']) > 10:
-            self._save()
+        Индексы хранятся по возрастанию, новые задачи - в конце.
+        """
+        self._deleted_order = sorted(self._deleted_key(task) for task in deleted_tasks.values())
+    
+    def _index_completed(self, completed_tasks: list):
+        self._completed_by_id = {task.id: task for task in completed_tasks}
+        self._completed_order = sorted(
+            self._completed_key(task) for task in self._completed_by_id.values()
+        )
+    
+    def _sync_completed_list(self):
+        """Обновляет список completed_tasks (новые первыми) по индексу"""
+        self.data['completed_tasks'] = [
+            self._completed_by_id[task_id] for _, task_id in reversed(self._completed_order)
+        ]
+    
+    @staticmethod
+    def _index_remove(order: list, key: tuple):
+        i = bisect.bisect_left(order, key)
+        if i < len(order) and order[i] == key:
+            del order[i]
+    
+    @staticmethod
+    def _encode_cursor(key: tuple) -> str:
+        raw = json.dumps(list(key), ensure_ascii=False).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii')
+    
+    @staticmethod
+    def _decode_cursor(cursor: str) -> tuple:
+        try:
+            key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        except (ValueError, UnicodeError) as e:
+            raise ValueError('Invalid cursor') from e
+        # Ключ индекса архива: (микросекунды, id задачи)
+        if (not isinstance(key, list) or len(key) != 2 or type(key[0]) is not int
+                or not isinstance(key[1], str)):
+            raise ValueError('Invalid cursor')
+        return tuple(key)
+    
+    def _page(self, order: list, lookup: dict, limit: int, cursor: Optional[str]) -> dict:
+        """Страница задач от новых к старым, начиная после cursor"""
+        end = bisect.bisect_left(order, self._decode_cursor(cursor)) if cursor else len(order)
+        start = max(0, end - limit)
+        return {
+            'items': [lookup[task_id] for _, task_id in reversed(order[start:end])],
+            'next_cursor': self._encode_cursor(order[start]) if start > 0 else None
+        }
+    
+    # === MEMBERSHIP ===
+    # Множества участников хранятся как dict без значений: O(1) проверка,
+    # добавление и удаление с сохранением порядка
+    @staticmethod
+    def _add_member(members: dict, user_id) -> bool:
+        if user_id in members:
+            return False
+        members[user_id] = None
+        return True
+    
+    @staticmethod
+    def _discard_member(members: dict, user_id) -> bool:
+        if user_id not in members:
+            return False
+        del members[user_id]
+        return True
+    
+    # === SEARCH INDEX ===
+    def _search_index(self) -> SearchIndex:
+        """Полнотекстовый индекс по всем секциям задач; строится при первом поиске"""
+        index = self._search
+        if index is None:
+            with self._derived_lock:
+                index = self._search
+                if index is None:
+                    deleted_tasks = self._section('deleted_tasks')
+                    self._section('completed_tasks')
+                    index = SearchIndex.build([
+                        (ACTIVE, self._active_tasks().values()),
+                        (DELETED, deleted_tasks.values()),
+                        (COMPLETED, self._completed_by_id.values()),
+                    ])
+                    self._search = index
+        return index
+    
+    def _task_stats(self) -> TaskStats:
+        """Агрегаты для /api/stats; считаются с нуля при первом обращении"""
+        stats = self._stats
+        if stats is None:
+            with self._derived_lock:
+                stats = self._stats
+                if stats is None:
+                    stats = self._stats = self._build_stats()
+        return stats
+    
+    def _build_stats(self) -> TaskStats:
+        deleted_tasks = self._section('deleted_tasks')
+        self._section('completed_tasks')
+        return TaskStats.build([
+            (ACTIVE, self._active_tasks().values()),
+            (DELETED, deleted_tasks.values()),
+            (COMPLETED, self._completed_by_id.values()),
+        ])
+    
+    def _reindex(self, task: Task, where: str = ACTIVE, text: bool = True):
+        """Обновляет задачу в статистике и, если менялся текст или секция, в индексе поиска"""
+        if self._shared:
+            self._changed[task.id] = where
+        if text and self._search is not None:
+            self._search.add(task, where)
+        if self._stats is not None:
+            self._stats.add(task, where)
+    
+    def _unindex(self, task_id: str):
+        if self._shared:
+            self._changed[task_id] = None
+        if self._search is not None:
+            self._search.remove(task_id)
+        if self._stats is not None:
+            self._stats.remove(task_id)
+    
+    def _apply_changes(self, since: int, until: int):
+        """Переносит в индекс и статистику задачи, изменённые другими
+        процессами в версиях (since, until].
+        
+        Если журнал покрывает не все эти версии (процесс долго не
+        синхронизировался) или в нём крупное изменение - индекс и
+        статистика перестраиваются при следующем обращении.
+        """
+        if self._search is None and self._stats is None:
+            return
+        entries = {version: tasks for version, tasks in self._change_log if since < version <= until}
+        if len(entries) != until - since or None in entries.values():
+            self._search = self._stats = None
+            return
+        changes = {}
+        for version in sorted(entries):
+            changes.update(entries[version])
+        for task_id, where in changes.items():
+            if where == ACTIVE:
+                task = self._active_tasks().get(task_id)
+            elif where == DELETED:
+                task = self._section('deleted_tasks').get(task_id)
+            elif where == COMPLETED:
+                self._section('completed_tasks')
+                task = self._completed_by_id.get(task_id)
+            else:
+                task = None
+            for derived in (self._search, self._stats):
+                if derived is None:
+                    continue
+                if task is None:
+                    derived.remove(task_id)
+                else:
+                    derived.add(task, where)
     
     # === USERS ===
+    @_writes
     def add_user(self, user_data: dict):
+        users = self._section('users')
         user_key = str(user_data['telegram_id'])
-        if user_key not in self.data['users']:
-            self.data['users'][user_key] = {
-                'telegram_id': user_data['telegram_id'],
-                'username': user_data['username'],
-                'first_name': user_data['first_name'],
-                'photo_url': user_data.get('photo_url'),
-                'timezone': user_data.get('timezone', 'Europe/Kiev'),
-                'language': user_data.get('language', 'uk'),
-                'created_at': datetime.now().isoformat()
-            }
-            self._save()
-        return self.data['users'][user_key]
+        if user_key not in users:
+            users[user_key] = User(
+                telegram_id=user_data['telegram_id'],
+                username=user_data['username'],
+                first_name=user_data['first_name'],
+                photo_url=user_data.get('photo_url'),
+                timezone=user_data.get('timezone', DEFAULT_TIMEZONE),
+                language=user_data.get('language', 'uk')
+            )
+            self._save('users')
+        return users[user_key]
     
+    @_reads
     def get_user(self, telegram_id: int):
-        return self.data['users'].get(str(telegram_id))
+        return self._section('users').get(str(telegram_id))
     
+    @_writes
     def update_user(self, telegram_id: int, updates: dict):
+        users = self._section('users')
         user_key = str(telegram_id)
-        if user_key in self.data['users']:
-            self.data['users'][user_key].update(updates)
-            self._save()
-            return self.data['users'][user_key]
+        if user_key in users:
+            users[user_key].update(updates)
+            self._save('users')
+            return users[user_key]
         return None
     
+    @_reads
     def get_all_users(self):
-        return list(self.data['users'].values())
+        return list(self._section('users').values())
     
     # === TASKS ===
+    @_writes
     def add_task(self, task_data: dict) -> dict:
         import uuid
         task_id = str(uuid.uuid4())
         
-        task = {
-            'id': task_id,
-            'title': task_data['title'],
-            'description': task_data.get('description', ''),
+        task = Task(
+            id=task_id,
+            title=task_data['title'],
+            description=task_data.get('description', ''),
+            event_date=0,
+            preparation_date=0,
+            created_by=task_data['created_by'],
+            created_by_username=task_data['created_by_username']
+        )
+        task.update({
             'event_date': task_data['event_date'],
             'preparation_date': task_data['preparation_date'],
             'photos': task_data.get('photos', []),
-            'checklist': task_data.get('checklist', []),
-            'created_by': task_data['created_by'],
-            'created_by_username': task_data['created_by_username'],
-            'created_at': datetime.now().isoformat(),
-            'is_deleted': False,
-            'is_preparation_completed': False,
-            'notified_week_before': False,
-            'notified_day_before': False,
-            'ready_users': [],
-            'not_going_users': []
-        }
+            'checklist': task_data.get('checklist', [])
+        })
         
-        self.data['tasks'][task_id] = task
-        self._save()
+        self._section('tasks')[task_id] = task
+        self._reindex(task)
+        self._save('tasks')
         return task
     
-    def get_tasks(self, include_deleted=False) -> List[dict]:
-        """Получить активные задачи, отсортированные по дате события"""
+    @_reads
+    def get_tasks(self, include_deleted=False, date_from: Optional[datetime] = None,
+                  date_to: Optional[datetime] = None) -> List[dict]:
+        """Получить активные задачи, отсортированные по дате события.
+        
+        date_from/date_to ограничивают дату события (наивные - киевское время).
+        """
         if include_deleted:
-            tasks = list(self.data['tasks'].values())
+            tasks = list(self._active_tasks().values())
         else:
-            tasks = [t for t in self.data['tasks'].values() if not t['is_deleted']]
+            tasks = [t for t in self._active_tasks().values() if not t.has(TaskFlag.DELETED)]
+        if date_from is not None or date_to is not None:
+            lower, upper = self._date_bound(date_from), self._date_bound(date_to)
+            tasks = [t for t in tasks if self._in_range(t, lower, upper)]
         
-        tasks.sort(key=lambda x: x['event_date'])
+        tasks.sort(key=lambda x: x.event_date)
         return tasks
     
+    @staticmethod
+    def _date_bound(value: Optional[datetime]) -> Optional[Tuple[int, int]]:
+        """Граница по дате события -> микросекунды (для дат с поясом, для наивных)"""
+        if value is None:
+            return None
+        if value.tzinfo is None:
+            value = localize(value)
+        return to_micros(value), to_micros(value.astimezone(KYIV).replace(tzinfo=None))
+    
+    @staticmethod
+    def _in_range(task: Task, lower: Optional[tuple], upper: Optional[tuple]) -> bool:
+        # Даты с часовым поясом хранятся в UTC, наивные - по киевскому времени
+        scale = 0 if task.has(TaskFlag.EVENT_DATE_AWARE) else 1
+        return ((lower is None or task.event_date >= lower[scale]) and
+                (upper is None or task.event_date <= upper[scale]))
+    
+    @_reads
     def get_task(self, task_id: str) -> Optional[dict]:
-        return self.data['tasks'].get(task_id)
+        return self._active_tasks().get(task_id)
     
+    @_writes
     def update_task(self, task_id: str, updates: dict) -> Optional[dict]:
-        if task_id in self.data['tasks']:
-            self.data['tasks'][task_id].update(updates)
-            self._save()
-            return self.data['tasks'][task_id]
+        if not isinstance(updates, dict):
+            raise ValueError('updates must be an object')
+        tasks = self._section('tasks')
+        if task_id in tasks:
+            tasks[task_id].update(updates)
+            self._reindex(tasks[task_id])
+            self._save('tasks')
+            return tasks[task_id]
         return None
     
+    @_writes
     def delete_task(self, task_id: str) -> bool:
         """Мягкое удаление - переносит в deleted_tasks"""
-        if task_id in self.data['tasks']:
-            task = self.data['tasks'][task_id]
-            task['deleted_at'] = datetime.now().isoformat()
-            self.data['deleted_tasks'][task_id] = task
-            del self.data['tasks'][task_id]
-            self._save()
+        tasks = self._section('tasks')
+        if task_id in tasks:
+            task = tasks[task_id]
+            task.deleted_at = now_micros()
+            self._section('deleted_tasks')[task_id] = task
+            bisect.insort(self._deleted_order, self._deleted_key(task))
+            del tasks[task_id]
+            self._reindex(task, DELETED)
+            self._save('deleted_tasks', 'tasks')
             return True
         return False
     
+    @_writes
     def restore_task(self, task_id: str) -> Optional[dict]:
         """Восстановление из удалённых"""
-        if task_id in self.data['deleted_tasks']:
-            task = self.data['deleted_tasks'][task_id]
-            task.pop('deleted_at', None)
-            task['is_deleted'] = False
-            self.data['tasks'][task_id] = task
-            del self.data['deleted_tasks'][task_id]
-            self._save()
+        deleted_tasks = self._section('deleted_tasks')
+        if task_id in deleted_tasks:
+            task = deleted_tasks[task_id]
+            self._index_remove(self._deleted_order, self._deleted_key(task))
+            task.deleted_at = None
+            task.set_flag(TaskFlag.DELETED, False)
+            self._section('tasks')[task_id] = task
+            del deleted_tasks[task_id]
+            self._reindex(task)
+            self._save('tasks', 'deleted_tasks')
             return task
         return None
     
+    @_writes
     def complete_task(self, task_id: str) -> Optional[dict]:
         """Завершить задачу - переносит в completed_tasks"""
-        if task_id in self.data['tasks']:
-            task = self.data['tasks'][task_id]
-            task['completed_at'] = datetime.now().isoformat()
-            task['is_preparation_completed'] = True
+        tasks = self._section('tasks')
+        if task_id in tasks:
+            task = tasks[task_id]
+            task.completed_at = now_micros()
+            task.set_flag(TaskFlag.PREPARATION_COMPLETED, True)
             
-            # Добавляем в начало списка завершённых
-            self.data['completed_tasks'].insert(0, task)
+            # Добавляем в индекс завершённых (новые - в конце)
+            self._section('completed_tasks')
+            self._completed_by_id[task_id] = task
+            bisect.insort(self._completed_order, self._completed_key(task))
+            self._reindex(task, COMPLETED)
             
-            # Оставляем только последние 10
-            self.data['completed_tasks'] = self.data['completed_tasks'][:10]
+            # Оставляем только последние completed_limit
+            self._trim_completed()
             
-            del self.data['tasks'][task_id]
-            self._save()
+            del tasks[task_id]
+            self._save('completed_tasks', 'tasks')
             return task
         return None
     
+    @_writes
     def restore_completed_task(self, task_id: str) -> Optional[dict]:
         """Восстановление из завершённых"""
-        for i, task in enumerate(self.data['completed_tasks']):
-            if task['id'] == task_id:
-                task.pop('completed_at', None)
-                task['is_preparation_completed'] = False
-                self.data['tasks'][task_id] = task
-                del self.data['completed_tasks'][i]
-                self._save()
-                return task
-        return None
+        self._section('completed_tasks')
+        task = self._completed_by_id.pop(task_id, None)
+        if task is None:
+            return None
+        self._index_remove(self._completed_order, self._completed_key(task))
+        self._sync_completed_list()
+        task.completed_at = None
+        task.set_flag(TaskFlag.PREPARATION_COMPLETED, False)
+        self._section('tasks')[task_id] = task
+        self._reindex(task)
+        self._save('tasks', 'completed_tasks')
+        return task
+    
+    # === READY / NOT GOING ===
+    @_writes
+    def mark_ready(self, task_id: str, user_id: int) -> Optional[dict]:
+        """Отметить пользователя готовым (и убрать из "не иду")"""
+        return self._set_attendance(task_id, user_id, 'ready_users', 'not_going_users')
+    
+    @_writes
+    def mark_not_going(self, task_id: str, user_id: int) -> Optional[dict]:
+        """Отметить, что пользователь не идёт (и убрать из "готов")"""
+        return self._set_attendance(task_id, user_id, 'not_going_users', 'ready_users')
+    
+    def _set_attendance(self, task_id: str, user_id: int, add_field: str, remove_field: str) -> Optional[dict]:
+        task = self._section('tasks').get(task_id)
+        if task is None:
+            return None
+        changed = self._discard_member(getattr(task, remove_field), user_id)
+        changed = self._add_member(getattr(task, add_field), user_id) or changed
+        if changed:
+            self._reindex(task, text=False)
+            self._save('tasks')
+        return task
+    
+    # === CHECKLIST ===
+    @_writes
+    def add_checklist_item(self, task_id: str, text: str) -> Optional[dict]:
+        """Добавить пункт в чек-лист задачи"""
+        task = self._section('tasks').get(task_id)
+        if task is None:
+            return None
+        self._append_checklist_item(task, text)
+        self._reindex(task)
+        self._save('tasks')
+        return task
+    
+    def _append_checklist_item(self, task: Task, text: str) -> ChecklistItem:
+        import uuid
+        item = ChecklistItem(str(uuid.uuid4()), text)
+        task.checklist[item.id] = item
+        return item
+    
+    @_writes
+    def update_checklist_item(self, task_id: str, item_id: str, text: Optional[str] = None,
+                              toggle_user: Optional[int] = None) -> Optional[dict]:
+        """Изменить текст пункта и/или переключить отметку пользователя.
+        
+        Возвращает задачу или None, если задачи нет; если нет пункта -
+        LookupError.
+        """
+        task = self._section('tasks').get(task_id)
+        if task is None:
+            return None
+        item = task.checklist.get(item_id)
+        if item is None:
+            raise LookupError('Checklist item not found')
+        
+        if text is not None:
+            item.text = text
+        
+        if toggle_user is not None:
+            if not self._discard_member(item.completed_by, toggle_user):
+                self._add_member(item.completed_by, toggle_user)
+        
+        self._reindex(task, text=text is not None)
+        self._save('tasks')
+        return task
+    
+    @_writes
+    def delete_checklist_item(self, task_id: str, item_id: str) -> Optional[dict]:
+        """Удалить пункт чек-листа"""
+        task = self._section('tasks').get(task_id)
+        if task is None:
+            return None
+        if self._remove_checklist_item(task, item_id):
+            self._reindex(task)
+            self._save('tasks')
+        return task
+    
+    def _remove_checklist_item(self, task: Task, item_id: str) -> bool:
+        return task.checklist.pop(item_id, None) is not None
+    
+    # === FIELD OPERATIONS ===
+    SET_OPS = {'add_to_set', 'remove_from_set', 'toggle_in_set'}
+    LIST_OPS = {'list_append', 'list_remove'}
+    TASK_SET_FIELDS = {'ready_users', 'not_going_users'}
+    TASK_LIST_FIELDS = {'photos', 'checklist'}
+    TASK_SCALAR_FIELDS = {
+        'title', 'description', 'event_date', 'preparation_date',
+        'is_preparation_completed', 'notified_week_before', 'notified_day_before'
+    }
+    ITEM_SET_FIELDS = {'completed_by'}
+    ITEM_SCALAR_FIELDS = {'text'}
+    
+    @_writes
+    def apply_ops(self, task_id: str, ops: List[dict]) -> Optional[dict]:
+        """Атомарно применить к задаче список операций над полями.
+        
+        Операция: {'op': ..., 'path': ..., 'value': ...}, где op - одна из
+        add_to_set, remove_from_set, toggle_in_set, list_append, list_remove,
+        set_field, а path - поле задачи ('ready_users', 'photos', 'title')
+        или поле пункта чек-листа ('checklist/<item_id>/completed_by').
+        Сначала проверяются все операции (ValueError - ничего не изменено),
+        затем они применяются с одним сохранением.
+        """
+        task = self._section('tasks').get(task_id)
+        if task is None:
+            return None
+        if not isinstance(ops, list):
+            raise ValueError('ops must be a list')
+        
+        resolved = [self._resolve_op(task, op) for op in ops]
+        
+        changed = False
+        for op in resolved:
+            changed = self._apply_op(task, *op) or changed
+        if changed:
+            self._reindex(task)
+            self._save('tasks')
+        return task
+    
+    def _resolve_op(self, task: Task, op: dict) -> tuple:
+        """Проверяет операцию и возвращает (op, владелец поля, поле, значение)"""
+        if not isinstance(op, dict):
+            raise ValueError('Operation must be an object')
+        name = op.get('op')
+        if name not in self.SET_OPS | self.LIST_OPS | {'set_field'}:
+            raise ValueError(f"Unknown op: {name}")
+        if 'value' not in op:
+            raise ValueError(f"Missing value for {name}")
+        
+        parts = str(op.get('path', '')).strip('/').split('/')
+        if len(parts) == 3 and parts[0] == 'checklist':
+            item_id, field = parts[1], parts[2]
+            owner = task.checklist.get(item_id)
+            if owner is None:
+                raise ValueError(f"Checklist item not found: {item_id}")
+            set_fields, list_fields, scalar_fields = self.ITEM_SET_FIELDS, set(), self.ITEM_SCALAR_FIELDS
+        elif len(parts) == 1:
+            owner, field = task, parts[0]
+            set_fields, list_fields, scalar_fields = self.TASK_SET_FIELDS, self.TASK_LIST_FIELDS, self.TASK_SCALAR_FIELDS
+        else:
+            raise ValueError(f"Invalid path: {op.get('path')}")
+        
+        allowed = set_fields if name in self.SET_OPS else list_fields if name in self.LIST_OPS else scalar_fields
+        if field not in allowed:
+            raise ValueError(f"{name} is not allowed on {op.get('path')}")
+        if name in self.SET_OPS and not isinstance(op['value'], (int, str)):
+            raise ValueError(f"{name} value must be a user id")
+        if name in self.LIST_OPS and field == 'checklist':
+            if name == 'list_append' and not isinstance(op['value'], str):
+                raise ValueError('Checklist item value must be text')
+            if name == 'list_remove' and op['value'] not in task.checklist:
+                raise ValueError(f"Checklist item not found: {op['value']}")
+        if name == 'list_append' and field == 'photos' and not isinstance(op['value'], str):
+            raise ValueError('Photo value must be a URL')
+        if name == 'set_field':
+            self._check_field_value(field, op['value'])
+        return name, owner, field, op['value']
+    
+    @staticmethod
+    def _check_field_value(field: str, value):
+        """Проверяет значение set_field до изменения задачи: ошибка в середине
+        списка операций не должна оставить задачу изменённой наполовину"""
+        if field in ('event_date', 'preparation_date'):
+            if not isinstance(value, str):
+                raise ValueError(f"{field} must be an ISO date")
+            encode_datetime(value)  # ValueError для неверной даты
+        elif field in ('title', 'description', 'text') and not isinstance(value, str):
+            raise ValueError(f"{field} must be text")
+    
+    def _apply_op(self, task: Task, name: str, owner, field: str, value) -> bool:
+        if name == 'set_field':
+            if owner is task:
+                task.update({field: value})
+            else:
+                setattr(owner, field, value)
+            return True
+        
+        if name in self.SET_OPS:
+            members = getattr(owner, field)
+            if name == 'add_to_set':
+                return self._add_member(members, value)
+            if name == 'remove_from_set':
+                return self._discard_member(members, value)
+            return self._discard_member(members, value) or self._add_member(members, value)
+        
+        # Списки: для checklist значение - текст нового пункта / id удаляемого
+        if field == 'checklist':
+            if name == 'list_append':
+                return self._append_checklist_item(task, value) is not None
+            return self._remove_checklist_item(task, value)
+        
+        if name == 'list_append':
+            task.photos.append(value)
+            return True
+        if value in task.photos:
+            task.photos.remove(value)
+            return True
+        return False
+    
+    # === BATCH ===
+    # Методы Database, доступные как операции пакетного запроса
+    BATCH_OPS = {
+        'update_task', 'delete_task', 'restore_task', 'complete_task',
+        'restore_completed_task', 'mark_ready', 'mark_not_going',
+        'add_checklist_item', 'update_checklist_item', 'delete_checklist_item',
+        'remove_photo', 'apply_ops'
+    }
+    
+    @_writes
+    def run_batch(self, ops: List[dict], atomic: bool = False) -> List[dict]:
+        """Выполнить список операций {'op': <метод>, 'args': {...}} с одной записью на диск.
+        
+        Возвращает результат по каждой операции. Упавшая операция не
+        оставляет частичных изменений. Если atomic=True, первая ошибка
+        откатывает весь пакет и выбрасывает BatchError.
+        """
+        if not isinstance(ops, list):
+            raise ValueError('ops must be a list')
+        
+        results = []
+        with self.transaction() if atomic else nullcontext():
+            for op in ops:
+                results.append(self._run_batch_op(op))
+                if atomic and not results[-1]['ok']:
+                    raise BatchError(_clone(results))
+        return results
+    
+    def _run_batch_op(self, op) -> dict:
+        if not isinstance(op, dict) or op.get('op') not in self.BATCH_OPS:
+            name = op.get('op') if isinstance(op, dict) else None
+            return {'ok': False, 'error': f"Unknown op: {name}"}
+        try:
+            # Без atomic операция - отдельная транзакция: ошибка откатывает
+            # только её изменения (внутри пакета atomic откатывается весь пакет)
+            with self.transaction():
+                result = getattr(self, op['op'])(**op.get('args', {}))
+        except (TypeError, ValueError, LookupError) as e:
+            return {'ok': False, 'error': str(e)}
+        if result is None or result is False:
+            return {'ok': False, 'error': 'Not found'}
+        return {'ok': True, 'result': result}
     
+    @_reads
     def get_deleted_tasks(self) -> List[dict]:
-        """Получить удалённые задачи"""
-        tasks = list(self.data['deleted_tasks'].values())
-        tasks.sort(key=lambda x: x.get('deleted_at', x['created_at']), reverse=True)
-        return tasks
+        """Получить удалённые задачи (новые первыми)"""
+        deleted_tasks = self._section('deleted_tasks')
+        return [deleted_tasks[task_id] for _, task_id in reversed(self._deleted_order)]
     
+    @_reads
     def get_completed_tasks(self) -> List[dict]:
-        """Получить завершённые задачи (последние 10)"""
-        return self.data['completed_tasks']
+        """Получить завершённые задачи (последние completed_limit)"""
+        return self._section('completed_tasks')
+    
+    @_reads
+    def get_deleted_tasks_page(self, limit: int = 20, cursor: Optional[str] = None) -> dict:
+        """Страница удалённых задач по курсору"""
+        return self._page(self._deleted_order, self._section('deleted_tasks'), limit, cursor)
+    
+    @_reads
+    def get_completed_tasks_page(self, limit: int = 20, cursor: Optional[str] = None) -> dict:
+        """Страница завершённых задач по курсору"""
+        self._section('completed_tasks')
+        return self._page(self._completed_order, self._completed_by_id, limit, cursor)
+    
+    @_reads
+    def get_archive_summary(self) -> dict:
+        """Количество задач в архивах без выборки самих задач"""
+        self._section('deleted_tasks')
+        self._section('completed_tasks')
+        return {
+            'deleted': len(self._deleted_order),
+            'completed': len(self._completed_order)
+        }
     
+    @_reads
     def get_tasks_for_notification(self) -> List[dict]:
         """Получить задачи, требующие уведомления"""
-        from pytz import timezone as pytz_timezone
-        now = datetime.now(pytz_timezone('Europe/Kiev'))
+        now = datetime.now(KYIV)
+        # Даты с часовым поясом хранятся в UTC, наивные - по киевскому времени
+        now_aware = to_micros(now)
+        now_naive = to_micros(now.replace(tzinfo=None))
+        week = timedelta(days=7) // timedelta(microseconds=1)
+        day = timedelta(days=1) // timedelta(microseconds=1)
         tasks_to_notify = []
         
-        for task in self.data['tasks'].values():
-            if task['is_deleted']:
+        for task in self._active_tasks().values():
+            if task.has(TaskFlag.DELETED):
                 continue
             
-            event_date = datetime.fromisoformat(task['event_date'])
-            if event_date.tzinfo is None:
-                event_date = pytz_timezone('Europe/Kiev').localize(event_date)
+            now_us = now_aware if task.has(TaskFlag.EVENT_DATE_AWARE) else now_naive
             
             # За неделю до события
-            week_before = event_date - timedelta(days=7)
-            if not task['notified_week_before'] and now >= week_before:
+            if not task.has(TaskFlag.NOTIFIED_WEEK_BEFORE) and now_us >= task.event_date - week:
                 tasks_to_notify.append({
-                    **task,
+                    **task.to_json(),
                     'notification_type': 'week_before'
                 })
             
             # За день до события
-            day_before = event_date - timedelta(days=1)
-            if not task['notified_day_before'] and now >= day_before:
+            if not task.has(TaskFlag.NOTIFIED_DAY_BEFORE) and now_us >= task.event_date - day:
                 tasks_to_notify.append({
-                    **task,
+                    **task.to_json(),
                     'notification_type': 'day_before'
                 })
         
         return tasks_to_notify
     
-    def save_photo(self, photo_file, filename: str) -> str:
-        """Сохранить фото и вернуть URL"""
+    @_reads
+    def search_tasks(self, query: str, include_archived: bool = False, limit: int = 50,
+                     date_from: Optional[datetime] = None, date_to: Optional[datetime] = None) -> List[dict]:
+        """Полнотекстовый поиск по названию, описанию и пунктам чек-листа.
+        
+        Возвращает до limit задач, содержащих все слова query (последние
+        буквы можно не дописывать), самые релевантные первыми. Даты - как
+        в get_tasks.
+        """
+        index = self._search_index()
+        places = (ACTIVE, DELETED, COMPLETED) if include_archived else (ACTIVE,)
+        active = self._active_tasks()
+        deleted_tasks = self._section('deleted_tasks') if include_archived else {}
+        lower, upper = self._date_bound(date_from), self._date_bound(date_to)
+        found = {}
+        
+        def accept(task_id: str) -> bool:
+            task = active.get(task_id) or deleted_tasks.get(task_id) or self._completed_by_id.get(task_id)
+            if task is None or (task.has(TaskFlag.DELETED) and not include_archived):
+                return False
+            if not self._in_range(task, lower, upper):
+                return False
+            found[task_id] = task
+            return True
+        
+        return [found[task_id] for task_id, _ in index.top(query, places, limit, accept)]
+    
+    # === EXPORT / IMPORT ===
+    @_reads
+    def export_keys(self) -> Dict[str, List[str]]:
+        """Ключи записей каждой секции на текущий момент (для выгрузки пачками)"""
+        self._section('completed_tasks')
+        return {
+            'users': list(self._section('users')),
+            'tasks': list(self._section('tasks')),
+            'deleted_tasks': [task_id for _, task_id in self._deleted_order],
+            'completed_tasks': [task_id for _, task_id in self._completed_order],
+        }
+    
+    @_reads
+    def export_records(self, section: str, keys: List[str]) -> List[dict]:
+        """Записи секции по ключам; удалённые после export_keys пропускаются"""
+        if section == 'completed_tasks':
+            self._section(section)
+            records = self._completed_by_id
+        elif section in self.SECTIONS:
+            records = self._section(section)
+        else:
+            raise ValueError(f"Unknown section: {section}")
+        return [records[key] for key in keys if key in records]
+    
+    def _detach_task(self, task_id: str) -> set:
+        """Убирает задачу из всех секций; возвращает изменённые секции"""
+        touched = set()
+        tasks = self._section('tasks')
+        deleted_tasks = self._section('deleted_tasks')
+        self._section('completed_tasks')
+        if tasks.pop(task_id, None) is not None:
+            touched.add('tasks')
+        task = deleted_tasks.pop(task_id, None)
+        if task is not None:
+            self._index_remove(self._deleted_order, self._deleted_key(task))
+            touched.add('deleted_tasks')
+        task = self._completed_by_id.pop(task_id, None)
+        if task is not None:
+            self._index_remove(self._completed_order, self._completed_key(task))
+            touched.add('completed_tasks')
+        self._unindex(task_id)
+        return touched
+    
+    @_writes
+    def import_records(self, records: List[dict]) -> Dict[str, int]:
+        """Применяет записи выгрузки ({'type': ..., 'data': ...}, см. transfer.py).
+        
+        Пользователи и задачи с теми же id заменяются (задача - в любой
+        секции). Пачка применяется целиком или не применяется: ошибка в
+        записи откатывает её и выбрасывает ValueError.
+        """
+        counts = {}
+        touched = set()
+        with self.transaction():
+            for record in records:
+                record_type, data = record['type'], record['data']
+                try:
+                    if record_type == 'user':
+                        user = User.from_json(data)
+                        self._section('users')[str(user.telegram_id)] = user
+                        touched.add('users')
+                    else:
+                        task = Task.from_json(data)
+                        touched |= self._detach_task(task.id)
+                        if record_type == 'task':
+                            self._section('tasks')[task.id] = task
+                            self._reindex(task)
+                            touched.add('tasks')
+                        elif record_type == 'deleted_task':
+                            self._section('deleted_tasks')[task.id] = task
+                            bisect.insort(self._deleted_order, self._deleted_key(task))
+                            self._reindex(task, DELETED)
+                            touched.add('deleted_tasks')
+                        elif record_type == 'completed_task':
+                            self._completed_by_id[task.id] = task
+                            bisect.insort(self._completed_order, self._completed_key(task))
+                            self._reindex(task, COMPLETED)
+                            touched.add('completed_tasks')
+                        else:
+                            raise ValueError(f"Unknown record type: {record_type}")
+                except (KeyError, TypeError, ValueError) as e:
+                    raise ValueError(f"Invalid {record_type} record: {e}") from e
+                counts[record_type] = counts.get(record_type, 0) + 1
+            if 'completed_tasks' in touched:
+                self._trim_completed()
+            if touched:
+                self._save(*(name for name in self.SECTIONS if name in touched))
+        return counts
+    
+    @_reads
+    def get_stats(self) -> dict:
+        """Статистика для дашборда: посещаемость, чек-листы, статусы, размеры архивов"""
+        return self._task_stats().summary()
+    
+    @_writes
+    def rebuild_stats(self) -> dict:
+        """Пересчитывает статистику с нуля (проверка поддерживаемых агрегатов).
+        
+        Возвращает свежую статистику и расхождения с прежней: путь -> [было, стало].
+        """
+        now = datetime.now(timezone.utc)
+        before = self._task_stats().summary(now)
+        self._stats = self._build_stats()
+        after = self._stats.summary(now)
+        mismatches = {
+            f"{group}.{name}": [value, after[group][name]]
+            for group, values in before.items() for name, value in values.items()
+            if after[group][name] != value
+        }
+        return {'stats': after, 'mismatches': mismatches}
+    
+    @_reads
+    def build_search_index(self) -> int:
+        """Строит полнотекстовый индекс заранее; возвращает число задач в нём"""
+        return len(self._search_index())
+    
+    @_writes
+    def remove_photo(self, task_id: str, photo_index: int) -> Optional[dict]:
+        """Удалить фото задачи по индексу вместе с файлом"""
+        task = self._section('tasks').get(task_id)
+        if task is None:
+            return None
+        if not 0 <= photo_index < len(task.photos):
+            raise IndexError('Photo not found')
+        
+        photo = task.photos[photo_index]
+        # Файл удаляется после записи снимка с изменённой задачей (см. _flush)
+        self._remove_photos([photo])
+        self.apply_ops(task_id, [{'op': 'list_remove', 'path': 'photos', 'value': photo}])
+        return task
+    
+    def new_photo_path(self, filename: str) -> Tuple[str, str]:
+        """Путь для нового фото в каталоге фото и его URL"""
         import uuid
         unique_filename = f"{uuid.uuid4()}_{filename}"
-        filepath = os.path.join(self.photos_dir, unique_filename)
+        return os.path.join(self.photos_dir, unique_filename), f"/photos/{unique_filename}"
+    
+    def save_photo(self, photo_file, filename: str) -> str:
+        """Сохранить фото и вернуть URL"""
+        filepath, url = self.new_photo_path(filename)
         
         photo_file.save(filepath)
         
-        return f"/photos/{unique_filename}"
\ No newline at end of file
+        return url
\ No newline at end of file
@@ -0,0 +1,10 @@
+"""Хуки gunicorn (подключаются в render.yaml: --config gunicorn.conf.py)"""
+
+
+def post_worker_init(worker):
+    # С --preload приложение загружается в мастере, а потоки мастера в
+    # форкнутый воркер не переходят: обработчики очереди заданий и прогрев
+    # поискового индекса запускаются в каждом воркере сразу, не дожидаясь
+    # первого запроса
+    import main
+    main.start_workers()
@@ -0,0 +1,33 @@
+"""Обработка фото задач. Выполняется в пуле процессов фоновых заданий (jobs.py)"""
+import os
+
+# Превью лежит рядом с фото: photos/thumb_<имя фото>, URL /photos/thumb_<имя фото>
+THUMBNAIL_PREFIX = 'thumb_'
+THUMBNAIL_SIZE = 512
+
+
+def thumbnail_path(photo_path: str) -> str:
+    directory, filename = os.path.split(photo_path)
+    return os.path.join(directory, THUMBNAIL_PREFIX + filename)
+
+
+def make_thumbnail(payload: dict) -> dict:
+    """Превью фото payload['path']: не больше size точек по длинной стороне,
+    с учётом поворота из EXIF, в формате оригинала"""
+    from PIL import Image, ImageOps  # Pillow нужен только рабочим процессам
+
+    source = payload['path']
+    size = int(payload.get('size', THUMBNAIL_SIZE))
+    target = thumbnail_path(source)
+    if not os.path.exists(source):
+        # Фото удалили раньше, чем до него дошла очередь
+        return {'skipped': 'missing'}
+    with Image.open(source) as image:
+        image_format = image.format
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.save(f"{target}.tmp", format=image_format)
+    os.replace(f"{target}.tmp", target)
+    return {'thumbnail': os.path.basename(target), 'width': image.width, 'height': image.height}
@@ -0,0 +1,370 @@
+"""Фоновые задания: постоянная очередь в SQLite и пулы исполнителей.
+
+Задание - имя обработчика, JSON-параметры, приоритет и группа. Очередь
+лежит в файле SQLite, поэтому её видят все воркеры gunicorn и она
+переживает перезапуск: задание забирает тот процесс, что первым
+захватил его в транзакции.
+
+Обработчики регистрируются через JobQueue.register. Задания для ввода-
+вывода (база, Telegram, файлы) выполняются в пуле потоков процесса,
+вычислительные (cpu=True, например обработка фото) - в пуле процессов,
+так что не держат GIL воркера. Обработчик cpu-задания должен быть
+функцией уровня модуля, не зависящей от состояния приложения.
+
+Упавшее задание повторяется с растущей задержкой до max_attempts раз.
+Пока задание выполняется, процесс продлевает его аренду; задания
+процесса, который умер, возвращаются в очередь по истечении аренды.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from metrics import REGISTRY
+from shards import DEFAULT_GROUP, current_group
+
+logger = logging.getLogger(__name__)
+
+JOBS = REGISTRY.counter(
+    'jobs_total', 'Background jobs by name and outcome', ('job', 'outcome'))
+JOB_SECONDS = REGISTRY.histogram(
+    'job_duration_seconds', 'Background job run time', ('job',))
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = 'queued', 'running', 'done', 'failed', 'cancelled'
+STATUSES = (QUEUED, RUNNING, DONE, FAILED, CANCELLED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    grp TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    dedupe_key TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_at REAL NOT NULL,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, priority DESC, run_at);
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_dedupe ON jobs (dedupe_key)
+    WHERE dedupe_key IS NOT NULL AND status IN ('queued', 'running');
+"""
+
+
+class JobError(ValueError):
+    """Неизвестное задание или некорректные параметры"""
+
+
+def _row(row: sqlite3.Row) -> dict:
+    job = dict(row)
+    job['group'] = job.pop('grp')
+    job['key'] = job.pop('dedupe_key')
+    job['payload'] = json.loads(job['payload'])
+    job['result'] = json.loads(job['result']) if job['result'] is not None else None
+    return job
+
+
+class JobQueue:
+    """Очередь заданий в SQLite-файле path с пулами потоков и процессов"""
+
+    def __init__(self, path: str = 'jobs.db', io_workers: int = 4, cpu_workers: int = 2,
+                 poll_interval: float = 1.0, lease: float = 300, retry_delay: float = 30,
+                 keep_finished: float = 7 * 24 * 3600):
+        self.path = path
+        self.io_workers = io_workers
+        self.cpu_workers = cpu_workers
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.retry_delay = retry_delay
+        self.keep_finished = keep_finished
+        # имя -> (обработчик, cpu, max_attempts)
+        self._handlers: Dict[str, tuple] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._wakeup = threading.Event()
+        self._running: Dict[str, str] = {}  # id -> имя выполняющихся в этом процессе
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._db() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _db(self) -> sqlite3.Connection:
+        """Соединение потока (sqlite3 не разделяет соединения между потоками)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def register(self, name: str, cpu: bool = False, max_attempts: int = 3) -> Callable:
+        """Декоратор обработчика: handler(payload) -> результат (JSON)"""
+        def decorator(handler):
+            self._handlers[name] = (handler, cpu, max_attempts)
+            return handler
+        return decorator
+
+    # === ОЧЕРЕДЬ ===
+    def submit(self, name: str, payload: Optional[dict] = None, priority: int = 0,
+               key: Optional[str] = None, delay: float = 0, group: Optional[str] = None) -> dict:
+        """Ставит задание в очередь.
+
+        key - ключ дедупликации: пока задание с тем же key ждёт или
+        выполняется, вместо нового возвращается оно.
+        """
+        if name not in self._handlers:
+            raise JobError(f"Unknown job: {name}")
+        if payload is not None and not isinstance(payload, dict):
+            raise JobError('payload must be an object')
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        conn = self._db()
+        try:
+            conn.execute(
+                "INSERT INTO jobs (id, name, payload, grp, priority, status, dedupe_key, max_attempts,"
+                " run_at, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, name, json.dumps(payload or {}, ensure_ascii=False),
+                 group or current_group.get(), int(priority), QUEUED, key,
+                 self._handlers[name][2], now + delay, now))
+        except sqlite3.IntegrityError:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE dedupe_key = ? AND status IN (?, ?)", (key, QUEUED, RUNNING)).fetchone()
+            if row is not None:
+                return _row(row)
+            raise
+        self._wakeup.set()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        row = self._db().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row(row) if row is not None else None
+
+    def list(self, status: Optional[str] = None, name: Optional[str] = None, limit: int = 100) -> List[dict]:
+        """Последние задания (новые сначала) с фильтром по статусу и имени"""
+        where, params = [], []
+        if status:
+            where.append("status = ?")
+            params.append(status)
+        if name:
+            where.append("name = ?")
+            params.append(name)
+        sql = "SELECT * FROM jobs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        rows = self._db().execute(sql + " ORDER BY created_at DESC LIMIT ?", (*params, limit)).fetchall()
+        return [_row(row) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._db().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {**dict.fromkeys(STATUSES, 0), **{status: count for status, count in rows}}
+
+    def cancel(self, job_id: str) -> bool:
+        """Отменяет ждущее задание; выполняющееся не прерывается"""
+        cursor = self._db().execute(
+            "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+            (CANCELLED, time.time(), job_id, QUEUED))
+        return cursor.rowcount > 0
+
+    def amend(self, job_id: str, payload: dict) -> bool:
+        """Заменяет параметры ждущего задания; False, если оно уже выполняется или завершено"""
+        cursor = self._db().execute(
+            "UPDATE jobs SET payload = ? WHERE id = ? AND status = ?",
+            (json.dumps(payload, ensure_ascii=False), job_id, QUEUED))
+        return cursor.rowcount > 0
+
+    def _claim(self, cpu: bool) -> Optional[dict]:
+        """Захватывает самое приоритетное готовое задание своего пула"""
+        names = [name for name, (_, is_cpu, _) in self._handlers.items() if is_cpu == cpu]
+        if not names:
+            return None
+        now = time.time()
+        conn = self._db()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                f"SELECT * FROM jobs WHERE status = ? AND run_at <= ? AND name IN ({','.join('?' * len(names))})"
+                " ORDER BY priority DESC, run_at LIMIT 1", (QUEUED, now, *names)).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, attempts = attempts + 1, started_at = ?, lease_until = ?"
+                    " WHERE id = ?", (RUNNING, now, now + self.lease, row['id']))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        job = _row(row)
+        job['attempts'] += 1
+        return job
+
+    def _finish(self, job: dict, result=None, error: Optional[str] = None):
+        now = time.time()
+        conn = self._db()
+        if error is None:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, lease_until = NULL, result = ?, error = NULL"
+                " WHERE id = ?", (DONE, now, json.dumps(result, ensure_ascii=False, default=str), job['id']))
+        elif job['attempts'] < job['max_attempts']:
+            # Повтор с растущей задержкой: retry_delay, 2*retry_delay, 4*retry_delay...
+            delay = self.retry_delay * 2 ** (job['attempts'] - 1)
+            conn.execute(
+                "UPDATE jobs SET status = ?, run_at = ?, lease_until = NULL, error = ? WHERE id = ?",
+                (QUEUED, now + delay, error, job['id']))
+        else:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, lease_until = NULL, error = ? WHERE id = ?",
+                (FAILED, now, error, job['id']))
+
+    def _maintain(self):
+        """Продлевает аренду своих заданий, возвращает в очередь брошенные, чистит старые"""
+        now = time.time()
+        conn = self._db()
+        running = list(self._running)
+        if running:
+            conn.execute(
+                f"UPDATE jobs SET lease_until = ? WHERE id IN ({','.join('?' * len(running))})",
+                (now + self.lease, *running))
+        # Процесс умер посреди задания - попытка считается неудачной
+        conn.execute(
+            "UPDATE jobs SET status = CASE WHEN attempts < max_attempts THEN ? ELSE ? END,"
+            " run_at = ?, lease_until = NULL, error = 'Lease expired',"
+            " finished_at = CASE WHEN attempts < max_attempts THEN NULL ELSE ? END"
+            " WHERE status = ? AND lease_until < ?", (QUEUED, FAILED, now, now, RUNNING, now))
+        conn.execute(
+            "DELETE FROM jobs WHERE status IN (?, ?, ?) AND finished_at < ?",
+            (DONE, FAILED, CANCELLED, now - self.keep_finished))
+
+    # === ИСПОЛНЕНИЕ ===
+    def _ensure_worker(self):
+        # Пулы и диспетчер создаются в каждом процессе отдельно (gunicorn --preload форкает воркеры)
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._running = {}
+                self._io_slots = threading.BoundedSemaphore(self.io_workers)
+                self._cpu_slots = threading.BoundedSemaphore(self.cpu_workers)
+                self._io_pool = ThreadPoolExecutor(self.io_workers, thread_name_prefix='job-io')
+                self._cpu_pool = None  # создаётся диспетчером при первом cpu-задании
+                threading.Thread(target=self._dispatch, name='jobs', daemon=True).start()
+                self._pid = os.getpid()
+
+    def _new_cpu_pool(self):
+        # multiprocessing импортируется только при запуске пулов, не при старте приложения
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # forkserver: рабочие процессы не наследуют потоки и блокировки воркера
+        return ProcessPoolExecutor(self.cpu_workers, mp_context=multiprocessing.get_context('forkserver'))
+
+    def start(self):
+        """Запускает обработку очереди в текущем процессе"""
+        self._ensure_worker()
+
+    def _dispatch(self):
+        last_maintenance = 0.0
+        while True:
+            try:
+                if time.monotonic() - last_maintenance >= self.poll_interval * 10:
+                    self._maintain()
+                    last_maintenance = time.monotonic()
+                started = self._start_jobs(False, self._io_slots) + self._start_jobs(True, self._cpu_slots)
+            except Exception:
+                logger.exception("Error dispatching jobs")
+                started = 0
+            if not started:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    def _start_jobs(self, cpu: bool, slots: threading.BoundedSemaphore) -> int:
+        """Запускает задания, пока в пуле есть свободные места"""
+        started = 0
+        while slots.acquire(blocking=False):
+            try:
+                job = self._claim(cpu)
+            except BaseException:
+                slots.release()
+                raise
+            if job is None:
+                slots.release()
+                break
+            self._running[job['id']] = job['name']
+            handler = self._handlers[job['name']][0]
+            if cpu:
+                pool, future = self._submit_cpu(handler, job['payload'])
+            else:
+                pool, future = None, self._io_pool.submit(self._run_in_group, handler, job)
+            future.add_done_callback(
+                lambda f, job=job, slots=slots, pool=pool, t=time.monotonic(): self._done(job, f, slots, pool, t))
+            started += 1
+        return started
+
+    def _submit_cpu(self, handler, payload):
+        """Отправляет задание в пул процессов; возвращает пул и future"""
+        from concurrent.futures.process import BrokenProcessPool
+        with self._lock:
+            if self._cpu_pool is None:
+                self._cpu_pool = self._new_cpu_pool()
+            try:
+                return self._cpu_pool, self._cpu_pool.submit(handler, payload)
+            except BrokenProcessPool:
+                # Пул сломался после прошлого задания - повторяем в новом
+                self._replace_cpu_pool(self._cpu_pool)
+                return self._cpu_pool, self._cpu_pool.submit(handler, payload)
+
+    def _replace_cpu_pool(self, broken):
+        """Заменяет сломанный пул процессов новым (если его ещё не заменили); под self._lock"""
+        if self._cpu_pool is broken:
+            self._cpu_pool = self._new_cpu_pool()
+            broken.shutdown(wait=False)
+
+    @staticmethod
+    def _run_in_group(handler, job: dict):
+        token = current_group.set(job['group'] or DEFAULT_GROUP)
+        try:
+            return handler(job['payload'])
+        finally:
+            current_group.reset(token)
+
+    def _done(self, job: dict, future, slots: threading.BoundedSemaphore, pool, started: float):
+        try:
+            error = None
+            try:
+                result = future.result()
+            except Exception as e:
+                result = None
+                error = ''.join(traceback.format_exception_only(type(e), e)).strip()
+                if pool is not None:
+                    from concurrent.futures.process import BrokenProcessPool  # уже загружен пулом
+                    if isinstance(e, BrokenProcessPool):
+                        # Рабочий процесс погиб (OOM, сигнал) - пул непригоден, нужен новый
+                        with self._lock:
+                            self._replace_cpu_pool(pool)
+                logger.warning("Job failed", extra={"job": job['name'], "job_id": job['id'],
+                                                    "attempt": job['attempts'], "error": error})
+            JOB_SECONDS.observe(time.monotonic() - started, job=job['name'])
+            JOBS.inc(job=job['name'], outcome='ok' if error is None else 'error')
+            self._finish(job, result, error)
+        except Exception:
+            logger.exception("Error finishing job", extra={"job_id": job['id']})
+        finally:
+            self._running.pop(job['id'], None)
+            slots.release()
+            self._wakeup.set()
@@ -0,0 +1,117 @@
+import fcntl
+import os
+import threading
+from contextlib import contextmanager
+
+
+class RWLock:
+    """Блокировка "много читателей / один писатель".
+
+    Писатель имеет приоритет: новые читатели ждут, пока очередь
+    писателей не опустеет. Блокировка реентерабельна в пределах потока:
+    писатель может повторно брать и запись, и чтение, читатель - чтение.
+    Повышение чтения до записи запрещено (это верный дедлок).
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._writer_depth = 0
+        self._writers_waiting = 0
+        self._local = threading.local()
+
+    def _read_depth(self) -> int:
+        return getattr(self._local, 'read_depth', 0)
+
+    def held(self) -> bool:
+        """Держит ли текущий поток блокировку (чтение или запись)"""
+        return self._writer == threading.get_ident() or self._read_depth() > 0
+
+    @contextmanager
+    def read(self):
+        me = threading.get_ident()
+        if self._writer == me or self._read_depth() > 0:
+            # Повторный вход: уже держим запись или чтение
+            self._local.read_depth = self._read_depth() + 1
+            try:
+                yield
+            finally:
+                self._local.read_depth -= 1
+            return
+
+        with self._cond:
+            while self._writer is not None or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        self._local.read_depth = 1
+        try:
+            yield
+        finally:
+            self._local.read_depth = 0
+            with self._cond:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        me = threading.get_ident()
+        if self._writer == me:
+            self._writer_depth += 1
+            try:
+                yield
+            finally:
+                self._writer_depth -= 1
+            return
+        if self._read_depth() > 0:
+            raise RuntimeError('Cannot upgrade a read lock to a write lock')
+
+        with self._cond:
+            self._writers_waiting += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = me
+            self._writer_depth = 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writer = None
+                self._writer_depth = 0
+                self._cond.notify_all()
+
+
+class FileLock:
+    """Межпроцессная блокировка на файле (flock), реентерабельная в потоке.
+
+    Дескриптор открывается лениво в каждом процессе: после fork унаследованный
+    дескриптор разделял бы блокировку с родителем.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+        self._pid = None
+
+    @contextmanager
+    def hold(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                self._pid = os.getpid()
+                self._depth = 0
+            if self._depth == 0:
+                fcntl.flock(self._fd, fcntl.LOCK_EX)
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    fcntl.flock(self._fd, fcntl.LOCK_UN)
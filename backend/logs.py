@@ -0,0 +1,178 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+# Идентификатор текущего запроса (ставится в instrument, попадает в каждую запись)
+request_id = contextvars.ContextVar('request_id', default=None)
+
+# Стандартные атрибуты LogRecord: всё остальное в записи - поля из extra=
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class ContextFilter(logging.Filter):
+    """Добавляет request_id к записи"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, 'request_id', None) is None:
+            record.request_id = request_id.get()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """Ограничивает повторяющиеся предупреждения и ошибки.
+
+    Одинаковые (логгер, шаблон сообщения, тип исключения) записи уровня
+    WARNING и выше пропускаются не чаще burst раз за window секунд;
+    число подавленных повторов добавляется к следующей пропущенной записи
+    (поле suppressed).
+    """
+
+    def __init__(self, burst: int = 5, window: float = 60.0):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._lock = threading.Lock()
+        self._state = {}  # ключ -> [начало окна, пропущено, подавлено]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.WARNING:
+            return True
+        exc_type = record.exc_info[0].__name__ if record.exc_info and record.exc_info[0] else None
+        key = (record.name, record.msg if isinstance(record.msg, str) else repr(record.msg), exc_type)
+        now = time.monotonic()
+        with self._lock:
+            state = self._state.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                self._state[key] = [now, 1, 0]
+                if len(self._state) > 1000:
+                    # Не копим ключи бесконечно: выбрасываем самые старые окна
+                    for stale in sorted(self._state, key=lambda k: self._state[k][0])[:500]:
+                        del self._state[stale]
+            elif state[1] < self.burst:
+                state[1] += 1
+                suppressed = 0
+            else:
+                state[2] += 1
+                return False
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Кладёт запись в очередь, не форматируя трейсбек в потоке запроса.
+
+    Поток, который пишет очередь в target, запускается в каждом процессе
+    отдельно при первой записи: после форка (gunicorn --preload) потока
+    родителя в воркере нет, и записи без своего потока копились бы в очереди.
+    """
+
+    def __init__(self, target: logging.Handler, queue_size: int):
+        super().__init__(queue.Queue(queue_size))
+        self.target = target
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Очередь переполнена - запись теряется, но запрос не ждёт
+            pass
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                # Очередь родителя могла остаться с захваченной блокировкой - нужна своя
+                self.queue = queue.Queue(self.queue.maxsize)
+                self._listener = logging.handlers.QueueListener(self.queue, self.target)
+                self._listener.start()
+                self._pid = os.getpid()
+
+    def stop(self):
+        """Дописывает очередь перед выходом процесса"""
+        if self._pid == os.getpid():
+            self._listener.stop()
+
+
+_handler = None
+
+
+def setup_logging(level: str = 'INFO', json_format: bool = True, queue_size: int = 10000,
+                  burst: int = 5, window: float = 60.0):
+    """Перенаправляет корневой логгер в очередь, которую пишет отдельный поток"""
+    global _handler
+    if _handler is not None:
+        return
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(JsonFormatter() if json_format else logging.Formatter(
+        '%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'))
+
+    _handler = _QueueHandler(stream, queue_size)
+    _handler.addFilter(ContextFilter())
+    _handler.addFilter(RateLimitFilter(burst, window))
+
+    root = logging.getLogger()
+    root.handlers[:] = [_handler]
+    root.setLevel(level)
+    atexit.register(_handler.stop)
+
+
+def instrument(app):
+    """Присваивает каждому запросу id (из X-Request-ID или новый) и возвращает его в ответе"""
+    from flask import g, request
+
+    @app.before_request
+    def _assign_request_id():
+        value = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+        g.request_id_token = request_id.set(value[:64])
+
+    @app.after_request
+    def _return_request_id(response):
+        value = request_id.get()
+        if value:
+            response.headers['X-Request-ID'] = value
+        return response
+
+    @app.teardown_request
+    def _reset_request_id(error=None):
+        token = g.pop('request_id_token', None)
+        if token is not None:
+            request_id.reset(token)
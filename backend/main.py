@@ -407,72 +407,336 @@
 
 
 
-from flask import Flask, jsonify, request, send_from_directory
+import time
+_BOOT = time.perf_counter()
+
+from flask import Flask, Response, jsonify, request, send_from_directory, stream_with_context
+import hmac
 from flask_cors import CORS
 from datetime import datetime
-from apscheduler.schedulers.background import BackgroundScheduler
 import os
-import traceback
+import json
+import logging
+import threading
 from dotenv import load_dotenv
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import ClientDisconnected
+from werkzeug.wsgi import get_input_stream
 
-from database import Database
+from database import BatchError
+from shards import ShardedDatabase, DEFAULT_GROUP, current_group
 from notifications import TelegramNotifier
-from utils import get_task_status
+from webhook import CallbackProcessor
+from utils import get_task_status, get_next_status_change
+import timezones
+from cache import ResponseCache
+import metrics
+import profiling
+import logs
+import shards
+import transfer
+import ratelimit
+from uploads import UploadStore, UploadError, UploadNotFound, UploadConflict
+from jobs import JobQueue, JobError, STATUSES
+from locks import FileLock
+import images
 
 load_dotenv()
 
+logs.setup_logging(os.getenv('LOG_LEVEL', 'INFO'), json_format=os.getenv('LOG_FORMAT', 'json') == 'json')
+logger = logging.getLogger('mini-app')
+startup = profiling.StartupTimer(_BOOT)
+startup.mark('imports')
+
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
+logs.instrument(app)
+metrics.instrument(app)
+
+# Админские эндпоинты и профилирование по запросу - по токену из .env
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+
+def is_admin_request():
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+profiler = profiling.Profiler(
+    profiling.ProfileStore(os.getenv('PROFILE_DIR', 'profiles'), int(os.getenv('PROFILE_KEEP', 50))),
+    sample_rate=float(os.getenv('PROFILE_SAMPLE_RATE', 0)),
+    scheduler_rate=float(os.getenv('PROFILE_SCHEDULER_RATE', 0))
+)
+profiling.instrument(app, profiler, is_admin_request)
+
+# Ограничение изменяющих запросов (см. ratelimit.py): корзины жетонов на
+# пользователя Telegram, IP и общая, плюс предел записей в работе во всех
+# воркерах. RATE_LIMIT_PROXY_HOPS - число прокси перед приложением
+rate_limiter = ratelimit.RateLimiter(
+    os.getenv('RATE_LIMIT_FILE', 'ratelimit.map'),
+    limits={
+        'user': (float(os.getenv('RATE_LIMIT_USER_RATE', 5)), float(os.getenv('RATE_LIMIT_USER_BURST', 30))),
+        'ip': (float(os.getenv('RATE_LIMIT_IP_RATE', 20)), float(os.getenv('RATE_LIMIT_IP_BURST', 60))),
+        'global': (float(os.getenv('RATE_LIMIT_GLOBAL_RATE', 50)), float(os.getenv('RATE_LIMIT_GLOBAL_BURST', 200))),
+    },
+    max_inflight=int(os.getenv('WRITE_INFLIGHT_LIMIT', 16))
+)
+if os.getenv('RATE_LIMIT_ENABLED', '1') == '1':
+    # Вебхук Telegram не ограничивается: у обработки нажатий своя очередь (503 при переполнении)
+    ratelimit.instrument(
+        app, rate_limiter,
+        exempt=lambda: is_admin_request() or request.path == '/api/telegram/webhook',
+        # Загрузки фото (до MAX_CONTENT_LENGTH по мобильной сети) не занимают очередь записей
+        streaming=lambda: request.endpoint in ('upload_photo', 'put_upload_chunk'),
+        proxy_hops=int(os.getenv('RATE_LIMIT_PROXY_HOPS', 0))
+    )
 
 # Конфигурация
 UPLOAD_FOLDER = 'photos'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp', 'gif'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max
-
-# Инициализация
-db = Database()
+# Возобновляемые загрузки фото частями (см. uploads.py): незавершённые
+# загрузки лежат в UPLOADS_DIR и удаляются после UPLOAD_TTL_HOURS без активности
+upload_store = UploadStore(
+    os.getenv('UPLOADS_DIR', 'uploads'),
+    max_size=app.config['MAX_CONTENT_LENGTH'],
+    max_chunk=int(float(os.getenv('UPLOAD_CHUNK_MB', 4)) * 1024 * 1024),
+    ttl=float(os.getenv('UPLOAD_TTL_HOURS', 24)) * 3600
+)
+
+# Инициализация: у каждой группы (X-Group-Id) своя база в DB_SHARDS_DIR,
+# запросы без группы работают с прежним data.json
+db = ShardedDatabase(
+    shards_dir=os.getenv('DB_SHARDS_DIR', 'shards'),
+    completed_limit=int(os.getenv('COMPLETED_TASKS_LIMIT', 10)),
+    deleted_retention_days=int(os.getenv('DELETED_RETENTION_DAYS', 30)),
+    lazy_load=os.getenv('DB_LAZY_LOAD', '1') == '1',
+    codec=os.getenv('DB_SNAPSHOT_CODEC', 'json'),
+    # Несколько воркеров gunicorn читают задачи из общего mmap-снимка
+    shared_snapshot=os.getenv('DB_SHARED_SNAPSHOT', '0') == '1'
+)
+# Запрос к несозданной группе - 404 (группы создаются через /api/admin/groups)
+shards.instrument(app, db)
+logger.info("Database loaded", extra={"load_stats": db.load_stats})
+startup.mark('database')
+# Индекс полнотекстового поиска строится в фоне при старте воркера
+# (см. start_workers), чтобы первый запрос ?q= не ждал
+SEARCH_INDEX_WARMUP = os.getenv('SEARCH_INDEX_WARMUP', '1') == '1'
+response_cache = ResponseCache()
 BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN', '')
-notifier = TelegramNotifier(BOT_TOKEN) if BOT_TOKEN else None
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')
+notifier = TelegramNotifier(BOT_TOKEN, TELEGRAM_API_URL) if BOT_TOKEN else None
+# Нажатия inline-кнопок из уведомлений обрабатываются в фоне
+callback_processor = CallbackProcessor(db, notifier) if notifier else None
+# Секрет, заданный при setWebhook (Telegram присылает его в заголовке)
+WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET', '')
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# Планировщик для уведомлений
-scheduler = BackgroundScheduler()
+# Дайджесты: напоминания окна уходят пользователю одним сообщением.
+# Режим выбирается полем notification_digest пользователя (PUT /api/user/<id>),
+# по умолчанию - NOTIFICATION_DIGEST; окно накопления - DIGEST_WINDOW_MINUTES.
+# Окно касается только подписчиков дайджеста: остальные получают напоминания
+# сразу. Накопленные напоминания ждут в отложенном задании send_digest группы,
+# поэтому окно не зависит от того, какой воркер проверяет уведомления
+DIGEST_DEFAULT = os.getenv('NOTIFICATION_DIGEST', '0') == '1'
+
+DIGEST_WINDOW = float(os.getenv('DIGEST_WINDOW_MINUTES', 0)) * 60
 
 def check_notifications():
-    """Проверяет задачи и отправляет уведомления"""
-    try:
-        if not notifier:
-            return
-        
-        tasks_to_notify = db.get_tasks_for_notification()
-        users = db.get_all_users()
+    """Проверяет задачи и отправляет уведомления (каждая группа - отдельно)"""
+    if not notifier:
+        return
+    with metrics.NOTIFICATION_RUNS.time(), profiler.run('check_notifications'):
+        for group in db.groups():
+            try:
+                with db.use(group):
+                    notify_group(group)
+            except Exception:
+                logger.exception("Error in check_notifications", extra={"group": group})
+
+def notify_group(group):
+    """Рассылка напоминаний о задачах группы её пользователям"""
+    tasks_to_notify = db.get_tasks_for_notification()
+    if not tasks_to_notify:
+        return
+    users = db.get_all_users()
+    digest_users = [u for u in users if u.get('notification_digest', DIGEST_DEFAULT)]
+    instant_users = [u for u in users if not u.get('notification_digest', DIGEST_DEFAULT)]
+    # Группа по умолчанию не пишется в кнопки (прежний формат callback_data)
+    button_group = None if group == DEFAULT_GROUP else group
+    
+    for task in tasks_to_notify:
+        notification_type = task['notification_type']
         
+        # Отправляем уведомление
+        notifier.send_task_notification(instant_users, task, notification_type, group=button_group)
+    
+    if digest_users and DIGEST_WINDOW > 0:
+        queue_digest(tasks_to_notify)
+    else:
+        for user in digest_users:
+            notifier.send_digest(user, tasks_to_notify, button_group)
+    
+    # Обновляем флаги уведомлений (одно сохранение на всю рассылку)
+    with db.transaction():
         for task in tasks_to_notify:
-            notification_type = task['notification_type']
-            
-            # Отправляем уведомление
-            notifier.send_task_notification(users, task, notification_type)
-            
-            # Обновляем флаг уведомления
-            if notification_type == 'week_before':
+            if task['notification_type'] == 'week_before':
                 db.update_task(task['id'], {'notified_week_before': True})
             else:
                 db.update_task(task['id'], {'notified_day_before': True})
-    except Exception as e:
-        print(f"Error in check_notifications: {e}")
-        traceback.print_exc()
 
-# Запускаем проверку каждые 10 минут
-try:
-    scheduler.add_job(check_notifications, 'interval', minutes=10)
-    scheduler.start()
-    print("Scheduler started successfully")
-except Exception as e:
-    print(f"Error starting scheduler: {e}")
+def queue_digest(tasks):
+    """Добавляет напоминания в ждущий дайджест группы или начинает новый:
+    он уходит через DIGEST_WINDOW после первого напоминания"""
+    reminders = [[task['id'], task['notification_type']] for task in tasks]
+    key = f"digest:{current_group.get()}"
+    job = jobs.submit('send_digest', {'reminders': reminders}, key=key, delay=DIGEST_WINDOW)
+    if job['payload']['reminders'] == reminders:
+        return
+    if not jobs.amend(job['id'], {'reminders': job['payload']['reminders'] + reminders}):
+        # Дайджест уже рассылается - эти напоминания начинают следующее окно
+        jobs.submit('send_digest', {'reminders': reminders}, delay=DIGEST_WINDOW)
+
+# Фоновые задания (см. jobs.py). Планировщик только ставит их в очередь,
+# выполняют пулы воркеров: рассылка и чистка не занимают поток планировщика,
+# обработка фото идёт в отдельных процессах и не держит GIL воркера
+jobs = JobQueue(
+    os.getenv('JOBS_DB', 'jobs.db'),
+    io_workers=int(os.getenv('JOB_IO_WORKERS', 4)),
+    cpu_workers=int(os.getenv('JOB_CPU_WORKERS', 2))
+)
+EXPORTS_DIR = os.getenv('EXPORTS_DIR', 'exports')
+
+jobs.register('thumbnail', cpu=True)(images.make_thumbnail)
+
+# Повтор рассылки мог бы отправить напоминания дважды - одна попытка
+@jobs.register('check_notifications', max_attempts=1)
+def run_check_notifications(payload):
+    check_notifications()
+
+@jobs.register('send_digest', max_attempts=1)
+def run_send_digest(payload):
+    """Дайджест группы: напоминания, накопленные за окно (см. queue_digest)"""
+    if not notifier:
+        return {"sent": 0}
+    group = current_group.get()
+    items = []
+    for task_id, notification_type in payload['reminders']:
+        # Задачу могли удалить или завершить, пока шло окно
+        task = db.get_task(task_id)
+        if task and not task.get('is_deleted'):
+            items.append({**task, 'notification_type': notification_type})
+    digest_users = [u for u in db.get_all_users() if u.get('notification_digest', DIGEST_DEFAULT)]
+    if items:
+        for user in digest_users:
+            notifier.send_digest(user, items, None if group == DEFAULT_GROUP else group)
+    return {"sent": len(digest_users) if items else 0, "reminders": len(items)}
+
+@jobs.register('cleanup_archive')
+def run_cleanup_archive(payload):
+    """Чистка архивов удалённых и завершённых задач во всех группах"""
+    groups = db.groups()
+    for group in groups:
+        with db.use(group):
+            db.cleanup_old_tasks()
+    return {"groups": len(groups)}
+
+@jobs.register('expire_uploads')
+def run_expire_uploads(payload):
+    """Удаляет брошенные незавершённые загрузки фото"""
+    removed = upload_store.expire()
+    if removed:
+        logger.info("Expired uploads removed", extra={"count": removed})
+    return {"removed": removed}
+
+@jobs.register('export')
+def run_export(payload):
+    """Выгрузка группы задания в EXPORTS_DIR (как GET /api/admin/export, но в фоне)"""
+    os.makedirs(EXPORTS_DIR, exist_ok=True)
+    path = os.path.join(EXPORTS_DIR, f"export-{current_group.get()}-{datetime.now():%Y%m%d-%H%M%S}.ndjson")
+    last = None
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        for chunk in transfer.export_lines(db.shard(), int(payload.get('batch_size', 500))):
+            f.write(chunk)
+            last = chunk
+    os.replace(f"{path}.tmp", path)
+    return {"path": path, "counts": json.loads(last)['counts']}
+
+def queue_thumbnail(photo_url):
+    """Ставит в очередь превью загруженного фото (ошибка очереди не мешает загрузке)"""
+    try:
+        jobs.submit('thumbnail', {'path': os.path.join(db.photos_dir, os.path.basename(photo_url))})
+    except Exception:
+        logger.exception("Error queueing thumbnail", extra={"photo": photo_url})
+
+# Процесс, в котором уже запущены фоновые обработчики (после fork - другой pid)
+_workers_pid = None
+_workers_lock = threading.Lock()
+
+def start_workers():
+    """Запускает фоновую работу в текущем процессе (один раз на процесс).
+    
+    Под gunicorn вызывается при старте каждого воркера (gunicorn.conf.py):
+    задания выполняются и до первого запроса после деплоя. При импорте
+    модуля потоки не запускаются - с --preload он импортируется в мастере.
+    """
+    global _workers_pid
+    if _workers_pid == os.getpid():
+        return
+    with _workers_lock:
+        if _workers_pid == os.getpid():
+            return
+        jobs.start()
+        # База открывается лениво и архивы при старте не чистит (см. Database);
+        # ключ задания не даёт воркерам поставить чистку несколько раз
+        enqueue('cleanup_archive')
+        if SEARCH_INDEX_WARMUP:
+            threading.Thread(target=db.build_search_index, name='search-index', daemon=True).start()
+        threading.Thread(target=run_scheduler, name='scheduler', daemon=True).start()
+        _workers_pid = os.getpid()
+
+@app.before_request
+def _start_jobs():
+    # Для запуска без хука gunicorn (другой сервер, flask run); повторный вызов ничего не делает
+    start_workers()
+
+def enqueue(name, **options):
+    """Задача планировщика: только ставит задание в очередь (одно ждущее на имя)"""
+    try:
+        jobs.submit(name, key=name, **options)
+    except Exception:
+        logger.exception("Error enqueueing job", extra={"job": name})
+
+# Планировщик: проверка уведомлений каждые 10 минут, обслуживание реже.
+# APScheduler импортируется и запускается в фоне (см. run_scheduler) - не задерживает старт
+scheduler = None
+
+def start_scheduler():
+    global scheduler
+    started = time.perf_counter()
+    try:
+        from apscheduler.schedulers.background import BackgroundScheduler
+        scheduler = BackgroundScheduler()
+        scheduler.add_job(enqueue, 'interval', minutes=10, args=['check_notifications'], kwargs={'priority': 10})
+        scheduler.add_job(enqueue, 'interval', minutes=30, args=['expire_uploads'])
+        scheduler.add_job(enqueue, 'interval', hours=6, args=['cleanup_archive'])
+        scheduler.start()
+        logger.info("Scheduler started", extra={"duration_ms": round((time.perf_counter() - started) * 1000, 1)})
+    except Exception:
+        logger.exception("Error starting scheduler")
+
+def run_scheduler():
+    """Держит планировщик в одном процессе из всех воркеров.
+    
+    Планировщик запускает процесс, захвативший файловую блокировку рядом с
+    JOBS_DB; остальные воркеры ждут её и подхватывают планировщик, когда
+    процесс-владелец завершается (блокировка снимается вместе с ним).
+    """
+    with FileLock(f"{jobs.path}.scheduler.lock").hold():
+        start_scheduler()
+        if scheduler is not None:
+            threading.Event().wait()
 
 # === ERROR HANDLERS ===
 @app.errorhandler(404)
@@ -485,8 +749,7 @@ def internal_error(error):
 
 @app.errorhandler(Exception)
 def handle_exception(e):
-    print(f"Unhandled exception: {e}")
-    traceback.print_exc()
+    logger.exception("Unhandled exception")
     return jsonify({"error": "An error occurred", "details": str(e)}), 500
 
 # === API ENDPOINTS ===
@@ -494,6 +757,11 @@ def handle_exception(e):
 def home():
     return jsonify({"status": "Task Manager API Running", "version": "2.0"})
 
+@app.route('/metrics')
+def get_metrics():
+    """Метрики процесса в текстовом формате Prometheus"""
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/ping')
 def ping():
     return jsonify({"status": "pong", "timestamp": datetime.now().isoformat()})
@@ -509,8 +777,7 @@ def register_user():
         user = db.add_user(data)
         return jsonify(user)
     except Exception as e:
-        print(f"Error in register_user: {e}")
-        traceback.print_exc()
+        logger.exception("Error in register_user")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/user/<int:telegram_id>', methods=['GET'])
@@ -521,7 +788,7 @@ def get_user(telegram_id):
             return jsonify(user)
         return jsonify({"error": "User not found"}), 404
     except Exception as e:
-        print(f"Error in get_user: {e}")
+        logger.exception("Error in get_user")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/user/<int:telegram_id>', methods=['PUT'])
@@ -533,7 +800,7 @@ def update_user(telegram_id):
             return jsonify(user)
         return jsonify({"error": "User not found"}), 404
     except Exception as e:
-        print(f"Error in update_user: {e}")
+        logger.exception("Error in update_user")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/users', methods=['GET'])
@@ -542,27 +809,42 @@ def get_all_users():
         users = db.get_all_users()
         return jsonify(users)
     except Exception as e:
-        print(f"Error in get_all_users: {e}")
+        logger.exception("Error in get_all_users")
         return jsonify({"error": str(e)}), 500
 
 # === TASK ENDPOINTS ===
+def build_tasks_response():
+    """Собрать тело ответа /api/tasks и момент, до которого оно актуально"""
+    tasks = db.get_tasks()
+    now = datetime.now(timezones.KYIV)
+    expires_at = None
+    
+    # Добавляем статус к каждой задаче
+    for task in tasks:
+        try:
+            task['status'] = get_task_status(task)
+            change_at = get_next_status_change(task, now)
+        except Exception as e:
+            logger.warning("Error getting status for task", extra={"task_id": task.get('id'), "error": str(e)})
+            task['status'] = 'future'
+            continue
+        if change_at and (expires_at is None or change_at.timestamp() < expires_at):
+            expires_at = change_at.timestamp()
+    
+    return app.json.dumps(tasks).encode('utf-8'), expires_at
+
 @app.route('/api/tasks', methods=['GET'])
 def get_tasks():
     try:
-        tasks = db.get_tasks()
+        # Версию читаем до сборки: если данные изменятся во время неё,
+        # запись просто устареет при следующем запросе
+        entry = response_cache.get(f"tasks:{current_group.get()}", db.version, build_tasks_response)
         
-        # Добавляем статус к каждой задаче
-        for task in tasks:
-            try:
-                task['status'] = get_task_status(task)
-            except Exception as e:
-                print(f"Error getting status for task {task.get('id')}: {e}")
-                task['status'] = 'future'
-        
-        return jsonify(tasks)
+        response = app.response_class(entry.body, mimetype='application/json')
+        response.set_etag(entry.etag)
+        return response.make_conditional(request)
     except Exception as e:
-        print(f"Error in get_tasks: {e}")
-        traceback.print_exc()
+        logger.exception("Error in get_tasks")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/tasks', methods=['POST'])
@@ -582,9 +864,10 @@ def create_task():
         task = db.add_task(data)
         task['status'] = get_task_status(task)
         return jsonify(task), 201
+    except ValueError as e:
+        return jsonify({"error": f"Invalid task data: {e}"}), 400
     except Exception as e:
-        print(f"Error in create_task: {e}")
-        traceback.print_exc()
+        logger.exception("Error in create_task")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/tasks/<task_id>', methods=['GET'])
@@ -596,7 +879,7 @@ def get_task(task_id):
             return jsonify(task)
         return jsonify({"error": "Task not found"}), 404
     except Exception as e:
-        print(f"Error in get_task: {e}")
+        logger.exception("Error in get_task")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/tasks/<task_id>', methods=['PUT'])
@@ -608,9 +891,31 @@ def update_task(task_id):
             task['status'] = get_task_status(task)
             return jsonify(task)
         return jsonify({"error": "Task not found"}), 404
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": f"Invalid task data: {e}"}), 400
+    except Exception as e:
+        logger.exception("Error in update_task")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/tasks/<task_id>', methods=['PATCH'])
+def patch_task(task_id):
+    """Применить операции над полями: [{"op": ..., "path": ..., "value": ...}]"""
+    try:
+        data = request.get_json()
+        ops = data.get('ops') if isinstance(data, dict) else data
+        
+        if not ops:
+            return jsonify({"error": "No operations provided"}), 400
+        
+        task = db.apply_ops(task_id, ops)
+        if task:
+            task['status'] = get_task_status(task)
+            return jsonify(task)
+        return jsonify({"error": "Task not found"}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        print(f"Error in update_task: {e}")
-        traceback.print_exc()
+        logger.exception("Error in patch_task")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/tasks/<task_id>', methods=['DELETE'])
@@ -621,7 +926,7 @@ def delete_task(task_id):
             return jsonify({"success": True})
         return jsonify({"error": "Task not found"}), 404
     except Exception as e:
-        print(f"Error in delete_task: {e}")
+        logger.exception("Error in delete_task")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/tasks/<task_id>/restore', methods=['POST'])
@@ -634,7 +939,7 @@ def restore_task(task_id):
             return jsonify(task)
         return jsonify({"error": "Task not found"}), 404
     except Exception as e:
-        print(f"Error in restore_task: {e}")
+        logger.exception("Error in restore_task")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/tasks/<task_id>/complete', methods=['POST'])
@@ -647,7 +952,7 @@ def complete_preparation(task_id):
             return jsonify(task)
         return jsonify({"error": "Task not found"}), 404
     except Exception as e:
-        print(f"Error in complete_preparation: {e}")
+        logger.exception("Error in complete_preparation")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/tasks/<task_id>/uncomplete', methods=['POST'])
@@ -660,7 +965,7 @@ def uncomplete_preparation(task_id):
             return jsonify(task)
         return jsonify({"error": "Task not found"}), 404
     except Exception as e:
-        print(f"Error in uncomplete_preparation: {e}")
+        logger.exception("Error in uncomplete_preparation")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/tasks/<task_id>/finish', methods=['POST'])
@@ -672,7 +977,7 @@ def finish_task(task_id):
             return jsonify(task)
         return jsonify({"error": "Task not found"}), 404
     except Exception as e:
-        print(f"Error in finish_task: {e}")
+        logger.exception("Error in finish_task")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/tasks/<task_id>/restore-completed', methods=['POST'])
@@ -685,7 +990,7 @@ def restore_completed(task_id):
             return jsonify(task)
         return jsonify({"error": "Task not found"}), 404
     except Exception as e:
-        print(f"Error in restore_completed: {e}")
+        logger.exception("Error in restore_completed")
         return jsonify({"error": str(e)}), 500
 
 # === READY/NOT GOING ===
@@ -698,29 +1003,13 @@ def mark_ready(task_id):
         if not user_id:
             return jsonify({"error": "user_id required"}), 400
         
-        task = db.get_task(task_id)
-        if not task:
+        updated_task = db.mark_ready(task_id, user_id)
+        if not updated_task:
             return jsonify({"error": "Task not found"}), 404
         
-        ready_users = task.get('ready_users', [])
-        not_going_users = task.get('not_going_users', [])
-        
-        # Убираем из "не иду" если там был
-        if user_id in not_going_users:
-            not_going_users.remove(user_id)
-        
-        # Добавляем в "готов"
-        if user_id not in ready_users:
-            ready_users.append(user_id)
-        
-        updated_task = db.update_task(task_id, {
-            'ready_users': ready_users,
-            'not_going_users': not_going_users
-        })
-        
         return jsonify(updated_task)
     except Exception as e:
-        print(f"Error in mark_ready: {e}")
+        logger.exception("Error in mark_ready")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/tasks/<task_id>/not-going', methods=['POST'])
@@ -732,126 +1021,121 @@ def mark_not_going(task_id):
         if not user_id:
             return jsonify({"error": "user_id required"}), 400
         
-        task = db.get_task(task_id)
-        if not task:
+        updated_task = db.mark_not_going(task_id, user_id)
+        if not updated_task:
             return jsonify({"error": "Task not found"}), 404
         
-        ready_users = task.get('ready_users', [])
-        not_going_users = task.get('not_going_users', [])
-        
-        # Убираем из "готов" если там был
-        if user_id in ready_users:
-            ready_users.remove(user_id)
-        
-        # Добавляем в "не иду"
-        if user_id not in not_going_users:
-            not_going_users.append(user_id)
-        
-        updated_task = db.update_task(task_id, {
-            'ready_users': ready_users,
-            'not_going_users': not_going_users
-        })
-        
         return jsonify(updated_task)
     except Exception as e:
-        print(f"Error in mark_not_going: {e}")
+        logger.exception("Error in mark_not_going")
         return jsonify({"error": str(e)}), 500
 
 # === CHECKLIST ===
 @app.route('/api/tasks/<task_id>/checklist', methods=['POST'])
 def add_checklist_item(task_id):
     try:
-        data = request.get_json()
-        task = db.get_task(task_id)
+        data = request.get_json(silent=True)
+        if not data or not isinstance(data.get('text'), str):
+            return jsonify({"error": "No text provided"}), 400
         
-        if not task:
+        updated_task = db.add_checklist_item(task_id, data['text'])
+        if not updated_task:
             return jsonify({"error": "Task not found"}), 404
         
-        import uuid
-        new_item = {
-            'id': str(uuid.uuid4()),
-            'text': data['text'],
-            'is_completed': False,
-            'completed_by': []
-        }
-        
-        checklist = task.get('checklist', [])
-        checklist.append(new_item)
-        
-        updated_task = db.update_task(task_id, {'checklist': checklist})
         return jsonify(updated_task)
     except Exception as e:
-        print(f"Error in add_checklist_item: {e}")
+        logger.exception("Error in add_checklist_item")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/tasks/<task_id>/checklist/<item_id>', methods=['PUT'])
 def update_checklist_item(task_id, item_id):
     try:
-        data = request.get_json()
-        task = db.get_task(task_id)
+        data = request.get_json(silent=True) or {}
         
-        if not task:
+        # Одна операция под блокировкой: задача не пропадёт между проверкой и изменением
+        updated_task = db.update_checklist_item(
+            task_id, item_id,
+            text=data.get('text'),
+            toggle_user=data.get('toggle_user')
+        )
+        if not updated_task:
             return jsonify({"error": "Task not found"}), 404
         
-        checklist = task.get('checklist', [])
-        
-        for item in checklist:
-            if item['id'] == item_id:
-                if 'text' in data:
-                    item['text'] = data['text']
-                
-                if 'toggle_user' in data:
-                    user_id = data['toggle_user']
-                    if user_id in item['completed_by']:
-                        item['completed_by'].remove(user_id)
-                    else:
-                        item['completed_by'].append(user_id)
-                    
-                    # Обновляем is_completed
-                    item['is_completed'] = len(item['completed_by']) > 0
-                
-                break
-        
-        updated_task = db.update_task(task_id, {'checklist': checklist})
         return jsonify(updated_task)
+    except LookupError:
+        return jsonify({"error": "Checklist item not found"}), 404
     except Exception as e:
-        print(f"Error in update_checklist_item: {e}")
+        logger.exception("Error in update_checklist_item")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/tasks/<task_id>/checklist/<item_id>', methods=['DELETE'])
 def delete_checklist_item(task_id, item_id):
     try:
-        task = db.get_task(task_id)
-        
-        if not task:
+        updated_task = db.delete_checklist_item(task_id, item_id)
+        if not updated_task:
             return jsonify({"error": "Task not found"}), 404
         
-        checklist = task.get('checklist', [])
-        checklist = [item for item in checklist if item['id'] != item_id]
-        
-        updated_task = db.update_task(task_id, {'checklist': checklist})
         return jsonify(updated_task)
     except Exception as e:
-        print(f"Error in delete_checklist_item: {e}")
+        logger.exception("Error in delete_checklist_item")
         return jsonify({"error": str(e)}), 500
 
 # === ARCHIVE ===
+ARCHIVE_PAGE_LIMIT = 100
+
+def get_archive_page_args():
+    """Разбирает limit/cursor; None - если клиент просит весь список"""
+    if 'limit' not in request.args and 'cursor' not in request.args:
+        return None
+    limit = request.args.get('limit', 20, type=int)
+    return max(1, min(limit, ARCHIVE_PAGE_LIMIT)), request.args.get('cursor')
+
 @app.route('/api/archive/deleted', methods=['GET'])
 def get_deleted_tasks():
     try:
-        tasks = db.get_deleted_tasks()
-        return jsonify(tasks)
+        page_args = get_archive_page_args()
+        if page_args is None:
+            return jsonify(db.get_deleted_tasks())
+        return jsonify(db.get_deleted_tasks_page(*page_args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
-        print(f"Error in get_deleted_tasks: {e}")
+        logger.exception("Error in get_deleted_tasks")
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/archive/completed', methods=['GET'])
 def get_completed_tasks():
     try:
-        tasks = db.get_completed_tasks()
-        return jsonify(tasks)
+        page_args = get_archive_page_args()
+        if page_args is None:
+            return jsonify(db.get_completed_tasks())
+        return jsonify(db.get_completed_tasks_page(*page_args))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.exception("Error in get_completed_tasks")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/archive/summary', methods=['GET'])
+def get_archive_summary():
+    try:
+        return jsonify(db.get_archive_summary())
+    except Exception as e:
+        logger.exception("Error in get_archive_summary")
+        return jsonify({"error": str(e)}), 500
+
+# === STATS ===
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """Статистика для дашборда; ?rebuild=1 (только админ) пересчитывает её с нуля"""
+    try:
+        if request.args.get('rebuild') in ('1', 'true'):
+            if not is_admin_request():
+                return jsonify({"error": "Forbidden"}), 403
+            return jsonify(db.rebuild_stats())
+        return jsonify(db.get_stats())
     except Exception as e:
-        print(f"Error in get_completed_tasks: {e}")
+        logger.exception("Error in get_stats")
         return jsonify({"error": str(e)}), 500
 
 # === PHOTOS ===
@@ -873,81 +1157,323 @@ def upload_photo(task_id):
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
             photo_url = db.save_photo(file, filename)
+            queue_thumbnail(photo_url)
             
             # Добавляем URL фото к задаче
-            photos = task.get('photos', [])
-            photos.append(photo_url)
-            
-            updated_task = db.update_task(task_id, {'photos': photos})
+            updated_task = db.apply_ops(task_id, [
+                {'op': 'list_append', 'path': 'photos', 'value': photo_url}
+            ])
             return jsonify({"photo_url": photo_url, "task": updated_task})
         
         return jsonify({"error": "Invalid file type"}), 400
     except Exception as e:
-        print(f"Error in upload_photo: {e}")
-        traceback.print_exc()
+        logger.exception("Error in upload_photo")
+        return jsonify({"error": str(e)}), 500
+
+def upload_error(e):
+    """Ответ на ошибку загрузки: 404, 409 с принятым смещением или 400"""
+    if isinstance(e, UploadNotFound):
+        return jsonify({"error": str(e)}), 404
+    if isinstance(e, UploadConflict):
+        return jsonify({"error": str(e), "offset": e.offset}), 409
+    return jsonify({"error": str(e)}), 400
+
+@app.route('/api/tasks/<task_id>/uploads', methods=['POST'])
+def create_upload(task_id):
+    """Начинает загрузку фото частями: {"filename", "size", "sha256"?}"""
+    try:
+        if not db.get_task(task_id):
+            return jsonify({"error": "Task not found"}), 404
+        data = request.get_json(silent=True) or {}
+        filename = data.get('filename') or ''
+        if not allowed_file(filename):
+            return jsonify({"error": "Invalid file type"}), 400
+        upload = upload_store.create(task_id, secure_filename(filename), data.get('size'),
+                                     data.get('sha256'), current_group.get())
+        return jsonify(upload), 201
+    except UploadError as e:
+        return upload_error(e)
+    except Exception as e:
+        logger.exception("Error in create_upload")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload(upload_id):
+    """Сколько байт уже принято - с этого смещения клиент продолжает"""
+    try:
+        return jsonify(upload_store.status(upload_id))
+    except UploadError as e:
+        return upload_error(e)
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+def put_upload_chunk(upload_id):
+    """Часть файла с позиции ?offset= (тело - сырые байты, длина - Content-Length).
+    
+    Необязательный заголовок X-Chunk-SHA256 - контрольная сумма части.
+    """
+    try:
+        offset = request.args.get('offset', type=int)
+        if offset is None or request.content_length is None:
+            return jsonify({"error": "offset and Content-Length are required"}), 400
+        upload = upload_store.write(upload_id, offset, request.stream, request.content_length,
+                                    request.headers.get('X-Chunk-SHA256'))
+        return jsonify(upload)
+    except UploadError as e:
+        return upload_error(e)
+    except ClientDisconnected:
+        # Соединение оборвалось - принятое сохранено, клиент продолжит с offset
+        return upload_error(UploadError('Incomplete chunk'))
+    except Exception as e:
+        logger.exception("Error in put_upload_chunk")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_upload(upload_id):
+    """Проверяет собранный файл и добавляет фото к задаче"""
+    try:
+        meta = upload_store.status(upload_id)
+        with db.use(meta['group'] or DEFAULT_GROUP):
+            if not db.get_task(meta['task_id']):
+                upload_store.cancel(upload_id)
+                return jsonify({"error": "Task not found"}), 404
+            filepath, photo_url = db.new_photo_path(meta['filename'])
+            upload_store.finish(upload_id, filepath)
+            updated_task = db.apply_ops(meta['task_id'], [
+                {'op': 'list_append', 'path': 'photos', 'value': photo_url}
+            ])
+            if not updated_task:
+                # Задачу удалили, пока файл проверялся
+                os.remove(filepath)
+                return jsonify({"error": "Task not found"}), 404
+        queue_thumbnail(photo_url)
+        return jsonify({"photo_url": photo_url, "task": updated_task})
+    except UploadError as e:
+        return upload_error(e)
+    except Exception as e:
+        logger.exception("Error in finalize_upload")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def cancel_upload(upload_id):
+    try:
+        upload_store.cancel(upload_id)
+        return jsonify({"success": True})
+    except UploadError as e:
+        return upload_error(e)
+
 @app.route('/photos/<filename>')
 def serve_photo(filename):
     try:
         return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
     except Exception as e:
-        print(f"Error serving photo: {e}")
+        logger.warning("Error serving photo", extra={"photo": filename, "error": str(e)})
         return jsonify({"error": "Photo not found"}), 404
 
 @app.route('/api/tasks/<task_id>/photos/<int:photo_index>', methods=['DELETE'])
 def delete_photo(task_id, photo_index):
     try:
-        task = db.get_task(task_id)
-        if not task:
+        updated_task = db.remove_photo(task_id, photo_index)
+        if not updated_task:
             return jsonify({"error": "Task not found"}), 404
-        
-        photos = task.get('photos', [])
-        
-        if photo_index >= len(photos):
-            return jsonify({"error": "Photo not found"}), 404
-        
-        # Удаляем файл
-        photo_path = photos[photo_index]
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], os.path.basename(photo_path))
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        
-        # Удаляем из списка
-        photos.pop(photo_index)
-        
-        updated_task = db.update_task(task_id, {'photos': photos})
         return jsonify(updated_task)
+    except IndexError:
+        return jsonify({"error": "Photo not found"}), 404
     except Exception as e:
-        print(f"Error in delete_photo: {e}")
+        logger.exception("Error in delete_photo")
+        return jsonify({"error": str(e)}), 500
+
+# === TELEGRAM WEBHOOK ===
+@app.route('/api/telegram/webhook', methods=['POST'])
+def telegram_webhook():
+    """Принимает обновления бота; нажатия "Готовий / Не йду" уходят в фоновую очередь"""
+    if WEBHOOK_SECRET and not hmac.compare_digest(
+            request.headers.get('X-Telegram-Bot-Api-Secret-Token', ''), WEBHOOK_SECRET):
+        return jsonify({"error": "Forbidden"}), 403
+    
+    update = request.get_json(silent=True) or {}
+    callback = update.get('callback_query')
+    if callback and callback_processor:
+        if not callback_processor.submit(callback):
+            # Очередь переполнена - Telegram повторит доставку позже
+            return jsonify({"error": "Busy"}), 503
+    return jsonify({"ok": True})
+
+# === GROUPS ===
+@app.route('/api/admin/groups', methods=['GET'])
+def list_groups():
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify({"groups": db.groups()})
+
+@app.route('/api/admin/groups', methods=['POST'])
+def create_group():
+    """Создаёт группу (шард базы): {"group": "<id чата или имя>"}"""
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    data = request.get_json(silent=True) or {}
+    try:
+        group = shards.validate_group(data.get('group'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    created = db.create(group)
+    return jsonify({"group": group, "created": created}), 201 if created else 200
+
+# === EXPORT / IMPORT ===
+@app.route('/api/admin/export', methods=['GET'])
+def export_data():
+    """Выгрузка данных группы в NDJSON (потоком, см. transfer.py)"""
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    batch_size = max(1, min(request.args.get('batch_size', 500, type=int), 5000))
+    lines = transfer.export_lines(db.shard(), batch_size)
+    filename = f"export-{current_group.get()}-{datetime.now():%Y%m%d-%H%M%S}.ndjson"
+    return Response(stream_with_context(lines), mimetype='application/x-ndjson',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@app.route('/api/admin/import', methods=['POST'])
+def import_data():
+    """Загрузка NDJSON-выгрузки пачками; в ответе - строки с ходом загрузки.
+    
+    Тело читается потоком, ограничение MAX_CONTENT_LENGTH здесь не действует.
+    """
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    batch_size = max(1, min(request.args.get('batch_size', 1000, type=int), 10000))
+    target = db.shard()
+    stream = get_input_stream(request.environ, max_content_length=None)
+    
+    def run():
+        try:
+            for report in transfer.import_lines(target, iter(stream.readline, b''), batch_size):
+                logger.info("Import progress", extra=report)
+                yield app.json.dumps(report) + '\n'
+        except ValueError as e:
+            yield app.json.dumps({"type": "error", "error": str(e)}) + '\n'
+        except Exception as e:
+            logger.exception("Error in import_data")
+            yield app.json.dumps({"type": "error", "error": str(e)}) + '\n'
+    
+    return Response(stream_with_context(run()), mimetype='application/x-ndjson')
+
+# === PROFILES ===
+@app.route('/api/admin/profiles', methods=['GET'])
+def list_profiles():
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify(profiler.store.list())
+
+@app.route('/api/admin/profiles/<name>', methods=['GET'])
+def download_profile(name):
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    if not profiler.store.path(name):
+        return jsonify({"error": "Profile not found"}), 404
+    return send_from_directory(profiler.store.directory, name, as_attachment=True)
+
+# === JOBS ===
+@app.route('/api/admin/jobs', methods=['GET'])
+def list_jobs():
+    """Последние задания: ?status=, ?name=, ?limit= (до 500)"""
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    status = request.args.get('status')
+    if status and status not in STATUSES:
+        return jsonify({"error": "Invalid status"}), 400
+    limit = max(1, min(request.args.get('limit', 100, type=int), 500))
+    return jsonify({"jobs": jobs.list(status, request.args.get('name'), limit), "counts": jobs.counts()})
+
+@app.route('/api/admin/jobs', methods=['POST'])
+def submit_job():
+    """Ставит задание в очередь: {"name", "payload"?, "priority"?} (группа - X-Group-Id)"""
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    data = request.get_json(silent=True) or {}
+    try:
+        job = jobs.submit(data.get('name'), data.get('payload'), int(data.get('priority', 0)))
+        return jsonify(job), 202
+    except (JobError, TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+
+@app.route('/api/admin/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route('/api/admin/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Отменяет задание, которое ещё не начало выполняться"""
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    if jobs.cancel(job_id):
+        return jsonify(jobs.get(job_id))
+    if not jobs.get(job_id):
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify({"error": "Job is not queued"}), 409
+
+# === BATCH ===
+@app.route('/api/batch', methods=['POST'])
+def run_batch():
+    """Несколько операций за один запрос: {"ops": [{"op": "mark_ready", "args": {...}}], "atomic": false}"""
+    try:
+        data = request.get_json()
+        if not data or not data.get('ops'):
+            return jsonify({"error": "No operations provided"}), 400
+        
+        results = db.run_batch(data['ops'], atomic=bool(data.get('atomic')))
+        return jsonify({"committed": True, "results": results})
+    except BatchError as e:
+        return jsonify({"committed": False, "results": e.results, "error": str(e)}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.exception("Error in run_batch")
         return jsonify({"error": str(e)}), 500
 
 # === SEARCH ===
+SEARCH_LIMIT = 200
+
 @app.route('/api/tasks/search', methods=['GET'])
 def search_tasks():
+    """Фильтр по датам и полнотекстовый поиск (?q=...&include_archived=1&limit=50)"""
     try:
         date_from = request.args.get('date_from')
         date_to = request.args.get('date_to')
+        # Наивные границы - киевское время, как наивные даты задач
+        date_from = datetime.fromisoformat(date_from) if date_from else None
+        date_to = datetime.fromisoformat(date_to) if date_to else None
+        query = request.args.get('q', '').strip()
         
-        tasks = db.get_tasks()
-        
-        if date_from:
-            from_dt = datetime.fromisoformat(date_from)
-            tasks = [t for t in tasks if datetime.fromisoformat(t['event_date']) >= from_dt]
-        
-        if date_to:
-            to_dt = datetime.fromisoformat(date_to)
-            tasks = [t for t in tasks if datetime.fromisoformat(t['event_date']) <= to_dt]
+        if query:
+            limit = max(1, min(request.args.get('limit', 50, type=int), SEARCH_LIMIT))
+            tasks = db.search_tasks(
+                query,
+                include_archived=request.args.get('include_archived') in ('1', 'true'),
+                limit=limit,
+                date_from=date_from,
+                date_to=date_to
+            )
+        else:
+            tasks = db.get_tasks(date_from=date_from, date_to=date_to)
         
         for task in tasks:
             task['status'] = get_task_status(task)
         
         return jsonify(tasks)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid date: {e}"}), 400
     except Exception as e:
-        print(f"Error in search_tasks: {e}")
+        logger.exception("Error in search_tasks")
         return jsonify({"error": str(e)}), 500
 
+startup.mark('app')
+logger.info("Startup complete", extra={"startup": startup.report()})
+
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
-    print(f"Starting server on port {port}...")
+    logger.info("Starting server", extra={"port": port})
+    start_workers()
     app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
@@ -0,0 +1,183 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Sequence, Tuple
+
+
+# Границы корзин по умолчанию: секунды и байты
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple, object] = {}
+
+    def _key(self, labels: dict) -> Tuple:
+        return tuple(labels.get(name, '') for name in self.labels)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        with self._lock:
+            items = sorted(self._values.items())
+            yield from self._render_items(items)
+
+    def _render_items(self, items):
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = TIME_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets) + (float('inf'),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [счётчики по корзинам..., сумма, количество]
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _render_items(self, items):
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(state[-2])}"
+            yield f"{self.name}_count{_format_labels(self.labels, key)} {state[-1]}"
+
+
+class Registry:
+    """Набор метрик процесса в текстовом формате Prometheus.
+
+    Метрики ведутся в каждом процессе отдельно: под gunicorn с несколькими
+    воркерами /metrics отдаёт данные того воркера, что обработал запрос.
+    """
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = TIME_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    'http_requests_total', 'HTTP requests by route, method and status',
+    ('route', 'method', 'status'))
+HTTP_LATENCY = REGISTRY.histogram(
+    'http_request_duration_seconds', 'HTTP request latency', ('route', 'method'))
+HTTP_REQUEST_SIZE = REGISTRY.histogram(
+    'http_request_size_bytes', 'HTTP request body size', ('route', 'method'), SIZE_BUCKETS)
+HTTP_RESPONSE_SIZE = REGISTRY.histogram(
+    'http_response_size_bytes', 'HTTP response body size', ('route', 'method'), SIZE_BUCKETS)
+
+DB_SAVE_SECONDS = REGISTRY.histogram(
+    'db_save_duration_seconds', 'Time to snapshot changed sections in Database._save')
+DB_FLUSH_SECONDS = REGISTRY.histogram(
+    'db_flush_duration_seconds', 'Time to write pending snapshots to disk')
+DB_WRITTEN_BYTES = REGISTRY.counter(
+    'db_written_bytes_total', 'Bytes written to datastore files', ('file',))
+DB_WRITES = REGISTRY.counter(
+    'db_writes_total', 'Datastore file writes', ('file',))
+
+NOTIFICATIONS_SENT = REGISTRY.counter(
+    'telegram_messages_total', 'Telegram sendMessage calls by outcome', ('outcome',))
+NOTIFICATION_LATENCY = REGISTRY.histogram(
+    'telegram_send_duration_seconds', 'Telegram sendMessage latency')
+NOTIFICATION_RUNS = REGISTRY.histogram(
+    'notification_check_duration_seconds', 'Duration of check_notifications runs')
+
+
+def instrument(app):
+    """Подключает к Flask-приложению сбор метрик по запросам"""
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        # Шаблон маршрута, а не путь: иначе каждый task_id - отдельный ряд
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        method = request.method
+        HTTP_REQUESTS.inc(route=route, method=method, status=response.status_code)
+        HTTP_LATENCY.observe(time.perf_counter() - started, route=route, method=method)
+        HTTP_REQUEST_SIZE.observe(request.content_length or 0, route=route, method=method)
+        if not response.is_streamed:
+            HTTP_RESPONSE_SIZE.observe(response.calculate_content_length() or 0,
+                                       route=route, method=method)
+        return response
@@ -0,0 +1,111 @@
+"""Отображаемый в память снимок активных задач (data.tasks.idx).
+
+Снимок публикует процесс-писатель после каждого изменения задач; все
+воркеры отображают один и тот же файл через mmap и читают задачи прямо
+из него, не разбирая секцию целиком при старте. Страницы файла лежат в
+page cache один раз, сколько бы воркеров его ни отображало.
+
+Формат (little-endian):
+    заголовок  HEADER: magic b'MADX', версия формата, models.RECORD_VERSION,
+               версия данных, число записей, смещения таблиц
+    записи     marshal(Task.to_record()) подряд, по возрастанию event_date
+    позиции    count x (offset Q, length I) - в порядке записей
+    ключи      count x (key_offset Q, key_length H, record I),
+               отсортированы по байтам task.id, затем сами id подряд
+"""
+import marshal
+import mmap
+import os
+import struct
+
+from models import Task, RECORD_VERSION
+
+MAGIC = b'MADX'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sBBHQQQQ')
+POSITION = struct.Struct('<QI')
+KEY = struct.Struct('<QHI')
+
+
+def build(tasks, version: int) -> bytes:
+    """Собирает файл снимка из записей Task"""
+    tasks = sorted(tasks, key=lambda task: task.event_date)
+    records = [marshal.dumps(task.to_record()) for task in tasks]
+
+    positions = []
+    offset = HEADER.size
+    for record in records:
+        positions.append(POSITION.pack(offset, len(record)))
+        offset += len(record)
+    positions_offset = offset
+    keys_offset = positions_offset + POSITION.size * len(records)
+
+    ids = sorted((task.id.encode('utf-8'), number) for number, task in enumerate(tasks))
+    key_table = []
+    key_offset = keys_offset + KEY.size * len(ids)
+    for key, number in ids:
+        key_table.append(KEY.pack(key_offset, len(key), number))
+        key_offset += len(key)
+
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, RECORD_VERSION, 0, version,
+                         len(records), positions_offset, keys_offset)
+    return b''.join([header, *records, *positions, *key_table, *(key for key, _ in ids)])
+
+
+class MappedTasks:
+    """Задачи из снимка; интерфейс чтения как у dict task_id -> Task.
+
+    Каждое обращение декодирует запись заново - изменения полученных
+    объектов в снимок не попадают.
+    """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, fmt, records, _, self.version, self._count, self._positions, self._keys = \
+            HEADER.unpack_from(self._mm)
+        if magic != MAGIC or fmt != FORMAT_VERSION or records != RECORD_VERSION:
+            self._mm.close()
+            raise ValueError(f"Incompatible task snapshot: {path}")
+
+    def close(self):
+        self._mm.close()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _record(self, number: int) -> Task:
+        offset, length = POSITION.unpack_from(self._mm, self._positions + number * POSITION.size)
+        with memoryview(self._mm)[offset:offset + length] as view:
+            return Task.from_record(marshal.loads(view))
+
+    def _find(self, task_id: str) -> int:
+        """Номер записи по id (бинарный поиск по таблице ключей) или -1"""
+        key = task_id.encode('utf-8')
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            key_offset, key_length, number = KEY.unpack_from(self._mm, self._keys + middle * KEY.size)
+            candidate = self._mm[key_offset:key_offset + key_length]
+            if candidate == key:
+                return number
+            if candidate < key:
+                low = middle + 1
+            else:
+                high = middle
+        return -1
+
+    def __contains__(self, task_id) -> bool:
+        return isinstance(task_id, str) and self._find(task_id) >= 0
+
+    def get(self, task_id: str, default=None):
+        number = self._find(task_id) if isinstance(task_id, str) else -1
+        return default if number < 0 else self._record(number)
+
+    def values(self):
+        """Задачи по возрастанию event_date"""
+        return (self._record(number) for number in range(self._count))
+
+
+def open_snapshot(path: str):
+    return MappedTasks(path) if os.path.exists(path) else None
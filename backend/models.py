@@ -1,45 +1,322 @@
-from dataclasses import dataclass, field
-from datetime import datetime
-from typing import Optional, List, Dict
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import Optional, List, Dict, Tuple
+
+# Записи хранятся в памяти компактно: __slots__ вместо dict, даты -
+# целые микросекунды от 1970-01-01, булевы статусы - битовые флаги,
+# повторяющиеся строки (язык, часовой пояс, username) - интернированы.
+# В JSON (API и data.json) они кодируются в прежнем виде через
+# to_json/from_json, в бинарных снимках - кортежами через
+# to_record/from_record.
+
+# Версия раскладки кортежей to_record; меняется при любом изменении
+# состава или порядка полей (записывается в заголовок снимка)
+RECORD_VERSION = 1
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def encode_datetime(value: str) -> Tuple[int, bool]:
+    """ISO-строка -> (микросекунды, есть ли часовой пояс).
+
+    Даты с часовым поясом приводятся к UTC, наивные хранятся как есть
+    (по "настенному" времени).
+    """
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        return (dt - _EPOCH) // _MICROSECOND, False
+    dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return (dt - _EPOCH) // _MICROSECOND, True
+
+
+def decode_datetime(value: int, aware: bool = False) -> str:
+    dt = from_micros(value)
+    if aware:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.isoformat()
+
+
+def encode_local_datetime(value: str) -> int:
+    """Служебные отметки (created_at, deleted_at...) - наивное локальное время сервера"""
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is not None:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return (dt - _EPOCH) // _MICROSECOND
+
+
+def to_micros(dt: datetime) -> int:
+    """datetime -> микросекунды (для aware - по UTC, для наивных - по настенному времени)"""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return (dt - _EPOCH) // _MICROSECOND
+
+
+def from_micros(value: int) -> datetime:
+    """Микросекунды -> наивный datetime (обратно to_micros: UTC или настенное время)"""
+    return _EPOCH + value * _MICROSECOND
+
+
+def now_micros() -> int:
+    return to_micros(datetime.now())
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class TaskFlag:
+    """Битовые флаги статусов задачи"""
+    DELETED = 1
+    PREPARATION_COMPLETED = 2
+    NOTIFIED_WEEK_BEFORE = 4
+    NOTIFIED_DAY_BEFORE = 8
+    # Даты события/подготовки были заданы с часовым поясом (хранятся в UTC)
+    EVENT_DATE_AWARE = 16
+    PREPARATION_DATE_AWARE = 32
+
+    # JSON-поле -> флаг
+    FIELDS = {
+        'is_deleted': DELETED,
+        'is_preparation_completed': PREPARATION_COMPLETED,
+        'notified_week_before': NOTIFIED_WEEK_BEFORE,
+        'notified_day_before': NOTIFIED_DAY_BEFORE,
+    }
+
 
-@dataclass
 class User:
-    telegram_id: int
-    username: str
-    first_name: str
-    photo_url: Optional[str]
-    timezone: str
-    language: str  # 'uk' or 'en'
-    created_at: datetime
-
-@dataclass
+    __slots__ = ('telegram_id', 'username', 'first_name', 'photo_url',
+                 'timezone', 'language', 'created_at', 'extra')
+
+    def __init__(self, telegram_id: int, username: str, first_name: str,
+                 photo_url: Optional[str] = None, timezone: str = 'Europe/Kiev',
+                 language: str = 'uk', created_at: Optional[int] = None):
+        self.telegram_id = telegram_id
+        self.username = _intern(username)
+        self.first_name = first_name
+        self.photo_url = photo_url
+        self.timezone = _intern(timezone)
+        self.language = _intern(language)  # 'uk' or 'en'
+        self.created_at = now_micros() if created_at is None else created_at
+        self.extra = None  # незнакомые поля, сохраняются как есть
+
+    def update(self, updates: dict):
+        for key, value in updates.items():
+            if key == 'created_at':
+                self.created_at = encode_local_datetime(value)
+            elif key in ('username', 'timezone', 'language'):
+                setattr(self, key, _intern(value))
+            elif key in ('telegram_id', 'first_name', 'photo_url'):
+                setattr(self, key, value)
+            else:
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[key] = value
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'User':
+        user = cls(data['telegram_id'], data.get('username'), data.get('first_name'))
+        user.update({k: v for k, v in data.items() if k != 'telegram_id'})
+        return user
+
+    def to_json(self) -> dict:
+        data = {
+            'telegram_id': self.telegram_id,
+            'username': self.username,
+            'first_name': self.first_name,
+            'photo_url': self.photo_url,
+            'timezone': self.timezone,
+            'language': self.language,
+            'created_at': decode_datetime(self.created_at)
+        }
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    @classmethod
+    def from_record(cls, record: tuple) -> 'User':
+        user = cls(*record[:7])
+        user.extra = record[7]
+        return user
+
+    def to_record(self) -> tuple:
+        return (self.telegram_id, self.username, self.first_name, self.photo_url,
+                self.timezone, self.language, self.created_at, self.extra)
+
+
 class ChecklistItem:
-    id: str
-    text: str
-    is_completed: bool
-    completed_by: List[int]  # telegram_ids
+    __slots__ = ('id', 'text', 'completed_by')
+
+    def __init__(self, id: str, text: str, completed_by=()):
+        self.id = id
+        self.text = text
+        # Упорядоченное множество telegram_id (dict без значений)
+        self.completed_by: Dict[int, None] = dict.fromkeys(completed_by)
+
+    @property
+    def is_completed(self) -> bool:
+        return len(self.completed_by) > 0
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'ChecklistItem':
+        return cls(data['id'], data.get('text', ''), data.get('completed_by', ()))
+
+    def to_json(self) -> dict:
+        return {
+            'id': self.id,
+            'text': self.text,
+            'is_completed': self.is_completed,
+            'completed_by': list(self.completed_by)
+        }
+
+    @classmethod
+    def from_record(cls, record: tuple) -> 'ChecklistItem':
+        return cls(*record)
+
+    def to_record(self) -> tuple:
+        return (self.id, self.text, list(self.completed_by))
+
 
-@dataclass
 class Task:
-    id: str
-    title: str
-    description: Optional[str]
-    event_date: datetime
-    preparation_date: datetime
-    photos: List[str]  # URLs to uploaded photos
-    checklist: List[Dict]  # ChecklistItems
-    created_by: int  # telegram_id
-    created_by_username: str
-    created_at: datetime
-    
-    # Статусы
-    is_deleted: bool = False
-    is_preparation_completed: bool = False
-    
-    # Уведомления
-    notified_week_before: bool = False
-    notified_day_before: bool = False
-    
-    # Кто готов к событию
-    ready_users: List[int] = field(default_factory=list)  # telegram_ids
-    not_going_users: List[int] = field(default_factory=list)  # telegram_ids
\ No newline at end of file
+    __slots__ = ('id', 'title', 'description', 'event_date', 'preparation_date',
+                 'photos', 'checklist', 'created_by', 'created_by_username',
+                 'created_at', 'flags', 'ready_users', 'not_going_users',
+                 'deleted_at', 'completed_at', 'extra')
+
+    # Поля, которые вычисляются при выдаче и не хранятся
+    COMPUTED_FIELDS = {'status', 'notification_type'}
+
+    def __init__(self, id: str, title: str, event_date: int, preparation_date: int,
+                 created_by: int, created_by_username: str, description: str = '',
+                 created_at: Optional[int] = None, flags: int = 0):
+        self.id = id
+        self.title = title
+        self.description = description
+        self.event_date = event_date
+        self.preparation_date = preparation_date
+        self.photos: List[str] = []  # URLs to uploaded photos
+        # id пункта -> пункт, в порядке добавления
+        self.checklist: Dict[str, ChecklistItem] = {}
+        self.created_by = created_by  # telegram_id
+        self.created_by_username = _intern(created_by_username)
+        self.created_at = now_micros() if created_at is None else created_at
+        self.flags = flags
+        # Упорядоченные множества telegram_id
+        self.ready_users: Dict[int, None] = {}
+        self.not_going_users: Dict[int, None] = {}
+        self.deleted_at: Optional[int] = None
+        self.completed_at: Optional[int] = None
+        self.extra = None  # незнакомые поля, сохраняются как есть
+
+    def has(self, flag: int) -> bool:
+        return bool(self.flags & flag)
+
+    def set_flag(self, flag: int, value: bool):
+        if value:
+            self.flags |= flag
+        else:
+            self.flags &= ~flag
+
+    def update(self, updates: dict):
+        """Применить изменения в JSON-виде (как из API).
+
+        Сначала разбираются все значения (ValueError/TypeError - задача не
+        изменена), затем они присваиваются.
+        """
+        parsed = {}
+        for key, value in updates.items():
+            if key in ('id',) or key in self.COMPUTED_FIELDS:
+                continue
+            if key in ('event_date', 'preparation_date'):
+                value = encode_datetime(value)
+            elif key in ('created_at', 'deleted_at', 'completed_at'):
+                value = None if value is None else encode_local_datetime(value)
+            elif key == 'checklist':
+                try:
+                    items = [ChecklistItem.from_json(item) for item in value or []]
+                except KeyError as e:
+                    raise ValueError(f"Checklist item without {e}") from e
+                value = {item.id: item for item in items}
+            elif key in ('ready_users', 'not_going_users'):
+                value = dict.fromkeys(value or [])
+            elif key == 'photos':
+                value = list(value or [])
+            elif key == 'created_by_username':
+                value = _intern(value)
+            parsed[key] = value
+
+        for key, value in parsed.items():
+            if key == 'event_date':
+                self.event_date, aware = value
+                self.set_flag(TaskFlag.EVENT_DATE_AWARE, aware)
+            elif key == 'preparation_date':
+                self.preparation_date, aware = value
+                self.set_flag(TaskFlag.PREPARATION_DATE_AWARE, aware)
+            elif key in TaskFlag.FIELDS:
+                self.set_flag(TaskFlag.FIELDS[key], bool(value))
+            elif key in ('created_at', 'deleted_at', 'completed_at', 'checklist', 'ready_users',
+                         'not_going_users', 'photos', 'created_by_username',
+                         'title', 'description', 'created_by'):
+                setattr(self, key, value)
+            else:
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[key] = value
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'Task':
+        task = cls(data['id'], data.get('title', ''), 0, 0,
+                   data.get('created_by'), data.get('created_by_username'))
+        task.update(data)
+        return task
+
+    def to_json(self) -> dict:
+        data = {
+            'id': self.id,
+            'title': self.title,
+            'description': self.description,
+            'event_date': decode_datetime(self.event_date, self.has(TaskFlag.EVENT_DATE_AWARE)),
+            'preparation_date': decode_datetime(
+                self.preparation_date, self.has(TaskFlag.PREPARATION_DATE_AWARE)),
+            'photos': list(self.photos),
+            'checklist': [item.to_json() for item in self.checklist.values()],
+            'created_by': self.created_by,
+            'created_by_username': self.created_by_username,
+            'created_at': decode_datetime(self.created_at),
+        }
+        for key, flag in TaskFlag.FIELDS.items():
+            data[key] = self.has(flag)
+        data['ready_users'] = list(self.ready_users)
+        data['not_going_users'] = list(self.not_going_users)
+        if self.deleted_at is not None:
+            data['deleted_at'] = decode_datetime(self.deleted_at)
+        if self.completed_at is not None:
+            data['completed_at'] = decode_datetime(self.completed_at)
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    @classmethod
+    def from_record(cls, record: tuple) -> 'Task':
+        (id, title, description, event_date, preparation_date, photos, checklist,
+         created_by, created_by_username, created_at, flags, ready_users,
+         not_going_users, deleted_at, completed_at, extra) = record
+        task = cls(id, title, event_date, preparation_date, created_by,
+                   created_by_username, description, created_at, flags)
+        task.photos = photos
+        items = map(ChecklistItem.from_record, checklist)
+        task.checklist = {item.id: item for item in items}
+        task.ready_users = dict.fromkeys(ready_users)
+        task.not_going_users = dict.fromkeys(not_going_users)
+        task.deleted_at = deleted_at
+        task.completed_at = completed_at
+        task.extra = extra
+        return task
+
+    def to_record(self) -> tuple:
+        return (self.id, self.title, self.description, self.event_date,
+                self.preparation_date, self.photos,
+                [item.to_record() for item in self.checklist.values()],
+                self.created_by, self.created_by_username, self.created_at,
+                self.flags, list(self.ready_users), list(self.not_going_users),
+                self.deleted_at, self.completed_at, self.extra)
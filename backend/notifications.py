@@ -1,10 +1,25 @@
-import requests
+import logging
+import time
 from typing import List, Dict
 
+from metrics import NOTIFICATIONS_SENT, NOTIFICATION_LATENCY
+
+logger = logging.getLogger(__name__)
+
+def _requests():
+    # requests грузится ~50 мс - только при первой отправке, а не при старте приложения
+    import requests
+    return requests
+
+def callback_data(action: str, task_id: str, group: str = None) -> str:
+    """Данные inline-кнопки: "<действие>_<id задачи>[:<группа>]" (см. webhook.parse_callback_data)"""
+    return f"{action}_{task_id}:{group}" if group else f"{action}_{task_id}"
+
 class TelegramNotifier:
-    def __init__(self, bot_token: str):
+    def __init__(self, bot_token: str, api_url: str = 'https://api.telegram.org'):
         self.bot_token = bot_token
-        self.base_url = f"https://api.telegram.org/bot{bot_token}"
+        # api_url можно подменить (локальный Bot API сервер, заглушка для нагрузочных тестов)
+        self.base_url = f"{api_url.rstrip('/')}/bot{bot_token}"
     
     def send_notification(self, chat_id: int, message: str, buttons=None):
         """Отправить уведомление с кнопками"""
@@ -21,15 +36,33 @@ class TelegramNotifier:
                 'inline_keyboard': buttons
             }
         
+        started = time.perf_counter()
         try:
-            response = requests.post(url, json=data)
+            response = _requests().post(url, json=data)
+            result = response.json()
+            NOTIFICATIONS_SENT.inc(outcome='ok' if result.get('ok') else 'error')
+            return result
+        except Exception as e:
+            NOTIFICATIONS_SENT.inc(outcome='exception')
+            logger.warning("Error sending notification", extra={"chat_id": chat_id, "error": str(e)})
+            return None
+        finally:
+            NOTIFICATION_LATENCY.observe(time.perf_counter() - started)
+    
+    def answer_callback_query(self, callback_query_id: str, text: str = ''):
+        """Ответить на нажатие inline-кнопки (убирает "часики" у кнопки)"""
+        url = f"{self.base_url}/answerCallbackQuery"
+        try:
+            response = _requests().post(url, json={'callback_query_id': callback_query_id, 'text': text},
+                                     timeout=10)
             return response.json()
         except Exception as e:
-            print(f"Error sending notification: {e}")
+            logger.warning("Error answering callback query", extra={"error": str(e)})
             return None
     
-    def send_task_notification(self, users: List[Dict], task: dict, notification_type: str, language='uk'):
-        """Отправить уведомление о задаче всем пользователям"""
+    def send_task_notification(self, users: List[Dict], task: dict, notification_type: str, language='uk',
+                               group: str = None):
+        """Отправить уведомление о задаче всем пользователям (group - группа задачи для кнопок)"""
         
         if language == 'uk':
             if notification_type == 'week_before':
@@ -57,9 +90,9 @@ class TelegramNotifier:
         # Кнопки
         buttons = [[
             {'text': '✅ Готовий' if language == 'uk' else '✅ Ready', 
-             'callback_data': f"ready_{task['id']}"},
+             'callback_data': callback_data('ready', task['id'], group)},
             {'text': '❌ Не йду' if language == 'uk' else '❌ Not going', 
-             'callback_data': f"notgoing_{task['id']}"},
+             'callback_data': callback_data('notgoing', task['id'], group)},
             {'text': '🔗 Відкрити' if language == 'uk' else '🔗 Open', 
              'url': f"https://t.me/YOUR_BOT_USERNAME/YOUR_APP_NAME?startapp=task_{task['id']}"}
         ]]
@@ -71,4 +104,90 @@ class TelegramNotifier:
                 # Переводим сообщение для этого пользователя
                 continue  # Упрощённо - отправляем как есть
             
-            self.send_notification(user['telegram_id'], message, buttons)
\ No newline at end of file
+            self.send_notification(user['telegram_id'], message, buttons)
+
+    def send_digest(self, user: Dict, items: List[dict], group: str = None):
+        """Отправить пользователю одно сообщение со всеми напоминаниями окна.
+        
+        items - задачи из get_tasks_for_notification (с notification_type).
+        Одно напоминание уходит обычным сообщением; больше DIGEST_LIMIT задач
+        или MESSAGE_LIMIT символов - несколькими дайджестами.
+        """
+        language = user.get('language', 'uk')
+        if len(items) == 1:
+            task = items[0]
+            self.send_task_notification([user], task, task['notification_type'], language, group)
+            return
+        # Оба напоминания об одной задаче (за неделю и за день) - в одном дайджесте
+        by_task = {}
+        for task in items:
+            by_task.setdefault(task['id'], []).append(task)
+        for chunk in digest_chunks(list(by_task.values()), language):
+            message, buttons = format_digest(chunk, language, group)
+            self.send_notification(user['telegram_id'], message, buttons)
+
+
+# Задач в одном дайджесте (по строке кнопок на задачу)
+DIGEST_LIMIT = 20
+# Длина текста сообщения Telegram; название задачи в строке дайджеста
+# обрезается до DIGEST_TITLE_LIMIT символов
+MESSAGE_LIMIT = 4096
+DIGEST_TITLE_LIMIT = 200
+
+DIGEST_TEXTS = {
+    'uk': {'title': 'Нагадування: найближчі події', 'week_before': 'через тиждень',
+           'day_before': 'завтра', 'open': '🔗 Відкрити'},
+    'en': {'title': 'Reminder: upcoming events', 'week_before': 'in a week',
+           'day_before': 'tomorrow', 'open': '🔗 Open'},
+}
+
+
+def _digest_header(texts: dict) -> List[str]:
+    return [f"📬 <b>{texts['title']}</b>", '']
+
+
+def _digest_line(task: dict, texts: dict) -> str:
+    emoji = '📅' if task['notification_type'] == 'week_before' else '⏰'
+    title = task['title']
+    if len(title) > DIGEST_TITLE_LIMIT:
+        title = title[:DIGEST_TITLE_LIMIT - 1] + '…'
+    return f"{emoji} <b>{title}</b> — {texts[task['notification_type']]}"
+
+
+def digest_chunks(per_task: List[List[dict]], language: str = 'uk'):
+    """Делит напоминания (списки по задачам) на дайджесты: не больше
+    DIGEST_LIMIT задач и MESSAGE_LIMIT символов текста в каждом"""
+    texts = DIGEST_TEXTS.get(language, DIGEST_TEXTS['uk'])
+    header = len('\n'.join(_digest_header(texts)))
+    chunk, tasks, length = [], 0, header
+    for reminders in per_task:
+        size = sum(len(_digest_line(task, texts)) + 1 for task in reminders)
+        if chunk and (tasks >= DIGEST_LIMIT or length + size > MESSAGE_LIMIT):
+            yield chunk
+            chunk, tasks, length = [], 0, header
+        chunk.extend(reminders)
+        tasks += 1
+        length += size
+    if chunk:
+        yield chunk
+
+
+def format_digest(items: List[dict], language: str = 'uk', group: str = None):
+    """Текст дайджеста и клавиатура: по строке "✅ / ❌" на каждую задачу"""
+    texts = DIGEST_TEXTS.get(language, DIGEST_TEXTS['uk'])
+    lines = _digest_header(texts)
+    buttons = []
+    seen = set()
+    for task in items:
+        lines.append(_digest_line(task, texts))
+        if task['id'] in seen:
+            continue
+        seen.add(task['id'])
+        short = task['title'] if len(task['title']) <= 24 else task['title'][:23] + '…'
+        buttons.append([
+            {'text': f"✅ {short}", 'callback_data': callback_data('ready', task['id'], group)},
+            {'text': '❌', 'callback_data': callback_data('notgoing', task['id'], group)},
+        ])
+    buttons.append([{'text': texts['open'], 'url': "https://t.me/YOUR_BOT_USERNAME/YOUR_APP_NAME"}])
+    return '\n'.join(lines), buttons
+
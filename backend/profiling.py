@@ -0,0 +1,158 @@
+import cProfile
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileStore:
+    """Кольцо .pstats-файлов на диске: хранятся последние keep профилей"""
+
+    def __init__(self, directory: str = 'profiles', keep: int = 50):
+        self.directory = os.path.abspath(directory)
+        self.keep = keep
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def save(self, profile: cProfile.Profile, label: str) -> str:
+        # Метка времени в начале имени - по ней же определяется порядок в кольце
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', label).strip('_')[:60] or 'run'
+        now = time.time()
+        stamp = f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{int(now * 10**6) % 10**6:06d}"
+        name = f"{stamp}-{os.getpid()}-{slug}.pstats"
+        path = os.path.join(self.directory, name)
+        profile.dump_stats(f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+        with self._lock:
+            for stale in self._names()[:-self.keep]:
+                try:
+                    os.remove(os.path.join(self.directory, stale))
+                except FileNotFoundError:
+                    pass
+        return name
+
+    def _names(self) -> List[str]:
+        return sorted(name for name in os.listdir(self.directory) if name.endswith('.pstats'))
+
+    def list(self) -> List[dict]:
+        profiles = []
+        for name in reversed(self._names()):
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            profiles.append({'name': name, 'size': stat.st_size,
+                             'created_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(stat.st_mtime))})
+        return profiles
+
+    def path(self, name: str) -> Optional[str]:
+        """Путь к профилю по имени (только файлы из кольца)"""
+        if name not in self._names():
+            return None
+        return os.path.join(self.directory, name)
+
+
+class Profiler:
+    """Профилирование по запросу.
+
+    Запрос профилируется, если администратор попросил об этом (заголовок
+    X-Profile: 1 или параметр ?profile=1) либо запрос попал в выборку
+    sample_rate. Запуски планировщика - с вероятностью scheduler_rate.
+    """
+
+    def __init__(self, store: ProfileStore, sample_rate: float = 0.0, scheduler_rate: float = 0.0):
+        self.store = store
+        self.sample_rate = sample_rate
+        self.scheduler_rate = scheduler_rate
+
+    def start(self) -> Optional[cProfile.Profile]:
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Другой профилировщик уже активен (в Python 3.12+ он общий на процесс)
+            return None
+        return profile
+
+    def finish(self, profile: cProfile.Profile, label: str) -> Optional[str]:
+        profile.disable()
+        try:
+            return self.store.save(profile, label)
+        except OSError as e:
+            logger.warning("Error saving profile", extra={"error": str(e)})
+            return None
+
+    @contextmanager
+    def run(self, label: str, rate: Optional[float] = None):
+        """Профилирует блок кода с вероятностью rate (по умолчанию scheduler_rate)"""
+        rate = self.scheduler_rate if rate is None else rate
+        profile = self.start() if rate > 0 and random.random() < rate else None
+        try:
+            yield
+        finally:
+            if profile is not None:
+                self.finish(profile, label)
+
+
+class StartupTimer:
+    """Время запуска приложения по этапам - для отчёта в лог при старте"""
+
+    # Тяжёлые модули, которые должны загружаться лениво, а не при старте
+    DEFERRED = ('requests', 'apscheduler', 'PIL', 'multiprocessing')
+
+    def __init__(self, started: Optional[float] = None):
+        self.started = time.perf_counter() if started is None else started
+        self._last = self.started
+        self.phases = {}
+
+    def mark(self, phase: str):
+        """Завершает этап phase (от предыдущей отметки)"""
+        now = time.perf_counter()
+        self.phases[phase] = round((now - self._last) * 1000, 1)
+        self._last = now
+
+    def report(self) -> dict:
+        return {
+            'total_ms': round((self._last - self.started) * 1000, 1),
+            'phases_ms': dict(self.phases),
+            'modules': len(sys.modules),
+            'deferred_loaded': [name for name in self.DEFERRED if name in sys.modules],
+        }
+
+
+def instrument(app, profiler: Profiler, is_admin: Callable[[], bool]):
+    """Подключает к Flask-приложению профилирование запросов"""
+    from flask import g, request
+
+    @app.before_request
+    def _start_profile():
+        asked = request.headers.get('X-Profile') == '1' or request.args.get('profile') == '1'
+        sampled = profiler.sample_rate > 0 and random.random() < profiler.sample_rate
+        if sampled or (asked and is_admin()):
+            g.profile = profiler.start()
+
+    def _finish():
+        profile = g.pop('profile', None)
+        if profile is None:
+            return None
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        return profiler.finish(profile, f"{request.method} {route}")
+
+    @app.after_request
+    def _save_profile(response):
+        name = _finish()
+        if name:
+            response.headers['X-Profile-Id'] = name
+        return response
+
+    @app.teardown_request
+    def _drop_profile(error=None):
+        # Запрос завершился исключением, минуя after_request
+        _finish()
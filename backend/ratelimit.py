@@ -0,0 +1,260 @@
+"""Ограничение частоты изменяющих запросов и сброс нагрузки.
+
+Каждая запись в базу - полное сохранение секции, поэтому клиент, который
+без конца жмёт "Готовий" или отмечает пункты чек-листа, может занять диск
+для всех. Перед изменяющим запросом берётся по жетону из корзин:
+пользователя Telegram, IP-адреса и общей (она держит суммарный поток
+записей предсказуемым). Если жетона нет - 429 с Retry-After.
+
+Кроме того, считается число изменяющих запросов, выполняющихся сейчас во
+всех воркерах. Если очередь на запись глубже limit, новые получают 429
+сразу, а не ждут блокировку базы.
+
+Состояние общее для воркеров gunicorn: таблица корзин и счётчики лежат в
+небольшом файле, отображённом в память (mmap), доступ - под flock.
+"""
+import hashlib
+import math
+import mmap
+import os
+import struct
+import time
+from typing import Dict, Optional, Tuple
+
+from locks import FileLock
+from metrics import REGISTRY
+
+RATE_LIMITED = REGISTRY.counter(
+    'http_rate_limited_total', 'Requests rejected by rate limiting or load shedding', ('reason',))
+
+MAGIC = b'MARL\x00\x00\x00\x01'
+# Воркеры: (pid, запросов на запись в работе)
+WORKER = struct.Struct('<II')
+MAX_WORKERS = 64
+# Корзина: (хэш ключа, жетоны, время последнего пополнения)
+BUCKET = struct.Struct('<Qdd')
+# Сколько соседних ячеек просматривается при поиске корзины ключа
+PROBES = 8
+
+MUTATING_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+# Поля запроса, в которых клиент передаёт telegram id пользователя
+USER_FIELDS = ('user_id', 'toggle_user', 'telegram_id', 'created_by')
+
+
+def _key_hash(key: str) -> int:
+    # 0 - признак пустой ячейки
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+
+
+class RateLimiter:
+    """Корзины жетонов и счётчик записей в работе в общем файле path.
+
+    limits - {вид корзины: (жетонов в секунду, ёмкость)}. Корзины лежат
+    в хэш-таблице на slots ячеек; когда ячейки ключа заняты, вытесняется
+    корзина, дольше всех не пополнявшаяся (полная корзина ничем не
+    отличается от новой).
+    """
+
+    def __init__(self, path: str = 'ratelimit.map', limits: Optional[Dict[str, Tuple[float, float]]] = None,
+                 max_inflight: int = 16, slots: int = 65536):
+        self.path = path
+        self.limits = limits or {}
+        self.max_inflight = max_inflight
+        self.slots = slots
+        self._lock = FileLock(f"{path}.lock")
+        self._workers_offset = len(MAGIC)
+        self._buckets_offset = self._workers_offset + WORKER.size * MAX_WORKERS
+        self._size = self._buckets_offset + BUCKET.size * slots
+        self._map = None
+        self._pid = None
+        self._worker_slot = None
+
+    def _mapped(self) -> mmap.mmap:
+        """Отображение файла (вызывается под блокировкой)"""
+        if self._map is not None and self._pid == os.getpid():
+            return self._map
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != self._size:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, self._size)
+            self._map = mmap.mmap(fd, self._size)
+        finally:
+            os.close(fd)
+        if self._map[:len(MAGIC)] != MAGIC:
+            self._map[:self._size] = bytes(self._size)
+            self._map[:len(MAGIC)] = MAGIC
+        self._pid = os.getpid()
+        self._worker_slot = None
+        return self._map
+
+    # === КОРЗИНЫ ===
+    def take(self, keys: Dict[str, str], cost: float = 1.0, now: Optional[float] = None) -> Tuple[float, Optional[str]]:
+        """Берёт cost жетонов из корзин {вид: ключ}: из всех сразу или ни из одной.
+
+        Возвращает (0, None), если запрос пропущен, иначе (через сколько
+        секунд повторить, вид исчерпанной корзины).
+        """
+        now = time.time() if now is None else now
+        with self._lock.hold():
+            buf = self._mapped()
+            found = {}
+            for kind, key in keys.items():
+                rate, burst = self.limits[kind]
+                hashed = _key_hash(f"{kind}:{key}")
+                offset, tokens = self._find(buf, hashed, rate, burst, now, found)
+                if tokens < cost:
+                    return (cost - tokens) / rate, kind
+                found[offset] = (hashed, tokens)
+            # Ячейки пишутся только для пропущенного запроса: отказ не
+            # заводит новых корзин и не вытесняет чужие
+            for offset, (hashed, tokens) in found.items():
+                BUCKET.pack_into(buf, offset, hashed, tokens - cost, now)
+        return 0.0, None
+
+    def _find(self, buf, hashed: int, rate: float, burst: float, now: float,
+              reserved=()) -> Tuple[int, float]:
+        """Ячейка корзины и её жетоны на момент now (новая корзина - полная).
+
+        Для нового ключа выбирается ячейка под запись, кроме reserved -
+        ячеек, уже выбранных для других корзин того же запроса.
+        """
+        start = hashed % self.slots
+        victim, victim_updated = None, math.inf
+        for probe in range(PROBES):
+            offset = self._buckets_offset + BUCKET.size * ((start + probe) % self.slots)
+            slot_hash, tokens, updated = BUCKET.unpack_from(buf, offset)
+            if slot_hash == hashed:
+                return offset, min(burst, tokens + max(0.0, now - updated) * rate)
+            if offset in reserved:
+                continue
+            if slot_hash == 0:
+                victim, victim_updated = offset, -math.inf
+            elif updated < victim_updated:
+                victim, victim_updated = offset, updated
+        return victim, burst
+
+    # === ЗАПИСИ В РАБОТЕ ===
+    def enter_write(self) -> bool:
+        """Учитывает начало изменяющего запроса; False - очередь на запись переполнена"""
+        with self._lock.hold():
+            buf = self._mapped()
+            workers = self._workers(buf)
+            if sum(count for _, count, _ in workers) >= self.max_inflight:
+                # Счётчики воркеров, убитых посреди запроса, не должны держать очередь
+                for pid, count, offset in workers:
+                    if count and not self._alive(pid):
+                        WORKER.pack_into(buf, offset, 0, 0)
+                if sum(count for _, count, _ in self._workers(buf)) >= self.max_inflight:
+                    return False
+            offset = self._own_slot(buf)
+            pid, count = WORKER.unpack_from(buf, offset)
+            WORKER.pack_into(buf, offset, pid, count + 1)
+        return True
+
+    def exit_write(self):
+        with self._lock.hold():
+            buf = self._mapped()
+            offset = self._own_slot(buf)
+            pid, count = WORKER.unpack_from(buf, offset)
+            WORKER.pack_into(buf, offset, pid, max(0, count - 1))
+
+    def inflight(self) -> int:
+        with self._lock.hold():
+            return sum(count for _, count, _ in self._workers(self._mapped()))
+
+    def _workers(self, buf):
+        result = []
+        for i in range(MAX_WORKERS):
+            offset = self._workers_offset + WORKER.size * i
+            pid, count = WORKER.unpack_from(buf, offset)
+            result.append((pid, count, offset))
+        return result
+
+    def _own_slot(self, buf) -> int:
+        """Ячейка счётчика текущего процесса (занимает свободную или ячейку умершего)"""
+        pid = os.getpid()
+        if self._worker_slot is not None and WORKER.unpack_from(buf, self._worker_slot)[0] == pid:
+            return self._worker_slot
+        free = None
+        for slot_pid, _, offset in self._workers(buf):
+            if slot_pid == pid:
+                self._worker_slot = offset
+                return offset
+            if free is None and (slot_pid == 0 or not self._alive(slot_pid)):
+                free = offset
+        if free is None:
+            raise RuntimeError('Too many worker processes for the rate limiter')
+        WORKER.pack_into(buf, free, pid, 0)
+        self._worker_slot = free
+        return free
+
+    @staticmethod
+    def _alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+
+def instrument(app, limiter: RateLimiter, exempt=lambda: False, streaming=lambda: False,
+               proxy_hops: int = 0):
+    """Подключает ограничение к изменяющим запросам Flask-приложения.
+
+    exempt() -> True пропускает запрос без ограничений (админ, вебхук).
+    streaming() -> True - запрос берёт жетоны, но не считается в очереди
+    на запись: загрузка файла занимает время передачей тела по сети, а не
+    базой, и медленные клиенты не должны отнимать места у записей.
+    proxy_hops - сколько доверенных прокси стоит перед приложением
+    (адрес клиента берётся из X-Forwarded-For).
+    """
+    from flask import g, jsonify, request
+
+    def client_ip() -> str:
+        route = request.access_route
+        if proxy_hops and len(route) > proxy_hops:
+            return route[-proxy_hops - 1]
+        return request.remote_addr or 'unknown'
+
+    def user_key() -> Optional[str]:
+        if request.view_args and 'telegram_id' in request.view_args:
+            return str(request.view_args['telegram_id'])
+        data = request.get_json(silent=True) if request.is_json else None
+        if isinstance(data, dict):
+            for field in USER_FIELDS:
+                if data.get(field) is not None:
+                    return str(data[field])
+        return None
+
+    def reject(message: str, retry_after: float, reason: str):
+        RATE_LIMITED.inc(reason=reason)
+        response = jsonify({"error": message})
+        response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        return response, 429
+
+    @app.before_request
+    def _limit_writes():
+        if request.method not in MUTATING_METHODS or exempt():
+            return None
+        keys = {'ip': client_ip()}
+        user = user_key()
+        if user is not None:
+            keys['user'] = user
+        keys['global'] = '*'
+        wait, kind = limiter.take({kind: key for kind, key in keys.items() if kind in limiter.limits})
+        if kind is not None:
+            return reject('Too many requests', wait, kind)
+        if streaming():
+            return None
+        if not limiter.enter_write():
+            return reject('Server busy', 1, 'busy')
+        g.write_admitted = True
+        return None
+
+    @app.teardown_request
+    def _release_write(error=None):
+        if g.pop('write_admitted', False):
+            limiter.exit_write()
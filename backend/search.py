@@ -0,0 +1,214 @@
+import bisect
+import functools
+import heapq
+import math
+import re
+from collections import Counter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Слово - буквы и цифры любого алфавита; апостроф внутри слова (п'ять, м’ята) не разрывает его
+_WORD = re.compile(r"[^\W_]+(?:['’ʼ`][^\W_]+)*")
+# Апостроф выбрасывается, ґ ищется как г, ё как е (набор без раскладки)
+_FOLD = str.maketrans({"'": None, '’': None, 'ʼ': None, '`': None, 'ґ': 'г', 'ё': 'е'})
+
+# Вес вхождения слова в зависимости от поля задачи
+FIELD_WEIGHTS = {'title': 3.0, 'checklist': 1.5, 'description': 1.0}
+# Совпадение по префиксу весит меньше точного
+PREFIX_FACTOR = 0.5
+# Префиксный поиск - со второй буквы; не больше MAX_EXPANSIONS слов на префикс
+MIN_PREFIX = 2
+MAX_EXPANSIONS = 100
+
+# Где лежит задача: активные ищутся всегда, архивы - по запросу
+ACTIVE, DELETED, COMPLETED = 'active', 'deleted', 'completed'
+
+
+@functools.lru_cache(maxsize=65536)
+def tokenize(text: Optional[str]) -> Tuple[str, ...]:
+    """Текст -> нормализованные слова (casefold, без апострофов).
+
+    Кэшируется: пункты чек-листов и описания часто повторяются.
+    """
+    if not text:
+        return ()
+    return tuple(word.translate(_FOLD) for word in _WORD.findall(text.casefold()))
+
+
+def task_terms(task) -> Dict[str, float]:
+    """Слова задачи с весами: название, описание и текст пунктов чек-листа"""
+    weights = Counter()
+    for word in tokenize(task.title):
+        weights[word] += FIELD_WEIGHTS['title']
+    for word in tokenize(task.description):
+        weights[word] += FIELD_WEIGHTS['description']
+    for item in task.checklist.values():
+        for word in tokenize(item.text):
+            weights[word] += FIELD_WEIGHTS['checklist']
+    # Длинные описания не должны перевешивать название: вес растёт логарифмически
+    return {word: 1 + math.log(weight) for word, weight in weights.items()}
+
+
+class SearchIndex:
+    """Инвертированный индекс задач.
+
+    Слово -> {id задачи: вес}; словарь слов хранится отсортированным для
+    поиска по префиксу. Обновляется по одной задаче (add/remove), так что
+    изменение задачи не требует перестройки индекса.
+
+    Кроме того, задачи каждого слова разложены по корзинам одинакового
+    веса (весов немного - они получаются из числа вхождений). Поиск
+    обходит корзины от тяжёлых к лёгким и останавливается, как только
+    оставшиеся задачи уже не могут попасть в первые limit: на частых
+    словах не приходится считать релевантность всех задач.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[str, float]] = {}
+        # слово -> {вес: {id задачи: None}}
+        self._impacts: Dict[str, Dict[float, dict]] = {}
+        self._vocabulary: List[str] = []
+        # id задачи -> (где лежит, её слова)
+        self._docs: Dict[str, Tuple[str, tuple]] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    @classmethod
+    def build(cls, sections: Iterable[Tuple[str, Iterable]]) -> 'SearchIndex':
+        """Индекс по задачам секций [(где, задачи), ...]"""
+        index = cls()
+        for where, tasks in sections:
+            for task in tasks:
+                index._insert(task.id, where, task_terms(task))
+        index._vocabulary = sorted(index._postings)
+        return index
+
+    def add(self, task, where: str = ACTIVE):
+        """Индексирует задачу (заново, если она уже есть в индексе)"""
+        self.remove(task.id)
+        for word in self._insert(task.id, where, task_terms(task)):
+            bisect.insort(self._vocabulary, word)
+
+    def remove(self, task_id: str):
+        doc = self._docs.pop(task_id, None)
+        if doc is None:
+            return
+        for word in doc[1]:
+            posting = self._postings[word]
+            impacts = self._impacts[word]
+            weight = posting.pop(task_id)
+            bucket = impacts[weight]
+            del bucket[task_id]
+            if not bucket:
+                del impacts[weight]
+            if not posting:
+                del self._postings[word]
+                del self._impacts[word]
+                i = bisect.bisect_left(self._vocabulary, word)
+                del self._vocabulary[i]
+
+    def _insert(self, task_id: str, where: str, terms: Dict[str, float]) -> List[str]:
+        """Добавляет задачу в списки слов; возвращает слова, которых не было в словаре"""
+        new_words = []
+        for word, weight in terms.items():
+            posting = self._postings.get(word)
+            if posting is None:
+                posting = self._postings[word] = {}
+                self._impacts[word] = {}
+                new_words.append(word)
+            posting[task_id] = weight
+            bucket = self._impacts[word].get(weight)
+            if bucket is None:
+                bucket = self._impacts[word][weight] = {}
+            bucket[task_id] = None
+        self._docs[task_id] = (where, tuple(terms))
+        return new_words
+
+    def _expand(self, word: str) -> List[Tuple[str, float]]:
+        """Слова индекса для слова запроса: оно само и слова с этим префиксом.
+
+        Множитель - idf слова (редкие слова весят больше), для префиксных
+        совпадений уменьшенный.
+        """
+        total = len(self._docs)
+        if len(word) < MIN_PREFIX:
+            candidates = [word] if word in self._postings else []
+        else:
+            start = bisect.bisect_left(self._vocabulary, word)
+            candidates = []
+            for i in range(start, min(start + MAX_EXPANSIONS, len(self._vocabulary))):
+                if not self._vocabulary[i].startswith(word):
+                    break
+                candidates.append(self._vocabulary[i])
+        matches = []
+        for candidate in candidates:
+            factor = math.log(1 + total / len(self._postings[candidate]))
+            matches.append((candidate, factor if candidate == word else factor * PREFIX_FACTOR))
+        return matches
+
+    def _score(self, task_id: str, groups) -> float:
+        """Релевантность задачи: по каждому слову запроса - лучшее из совпавших
+        слов индекса; 0, если какое-то слово запроса не найдено"""
+        total = 0.0
+        for group in groups:
+            best = 0.0
+            for posting, factor in group:
+                weight = posting.get(task_id)
+                if weight is not None and weight * factor > best:
+                    best = weight * factor
+            if not best:
+                return 0.0
+            total += best
+        return total
+
+    def top(self, query: str, places=(ACTIVE,), limit: int = 50,
+            accept: Optional[Callable[[str], bool]] = None) -> List[Tuple[str, float]]:
+        """Лучшие limit задач [(id, релевантность)], содержащих все слова запроса.
+
+        accept(id) -> False отбрасывает задачу (фильтры вызывающего кода).
+        """
+        words = list(dict.fromkeys(tokenize(query)))
+        expanded = [self._expand(word) for word in words]
+        if not expanded or not all(expanded):
+            return []
+        groups = [[(self._postings[word], factor) for word, factor in group] for group in expanded]
+        # Кандидатов даёт самое редкое слово запроса, остальные только проверяются
+        sizes = [sum(len(posting) for posting, _ in group) for group in groups]
+        driver = min(range(len(groups)), key=sizes.__getitem__)
+        # Больше этого остальные слова к релевантности добавить не могут
+        rest_bound = sum(
+            max(max(self._impacts[word]) * factor for word, factor in group)
+            for i, group in enumerate(expanded) if i != driver
+        )
+        # Корзины слов-кандидатов от самых весомых
+        buckets = sorted(
+            ((weight * factor, bucket) for word, factor in expanded[driver]
+             for weight, bucket in self._impacts[word].items()),
+            key=lambda item: item[0], reverse=True
+        )
+
+        heap = []  # (релевантность, порядок, id) - худшая из лучших наверху
+        seen = set()
+        docs = self._docs
+        for value, bucket in buckets:
+            if len(heap) >= limit and heap[0][0] >= value + rest_bound:
+                break
+            for task_id in bucket:
+                if task_id in seen:
+                    continue
+                seen.add(task_id)
+                if docs[task_id][0] not in places:
+                    continue
+                score = self._score(task_id, groups)
+                if not score or (len(heap) >= limit and score <= heap[0][0]):
+                    continue
+                if accept is not None and not accept(task_id):
+                    continue
+                item = (score, -len(seen), task_id)
+                if len(heap) < limit:
+                    heapq.heappush(heap, item)
+                else:
+                    heapq.heapreplace(heap, item)
+                if len(heap) >= limit and heap[0][0] >= value + rest_bound:
+                    break
+        return [(task_id, score) for score, _, task_id in sorted(heap, reverse=True)]
@@ -0,0 +1,151 @@
+import contextvars
+import os
+import re
+import threading
+from contextlib import contextmanager
+from typing import Dict, List
+
+from database import Database
+
+# Группа без ключа - прежнее единое хранилище (data.json в рабочем каталоге)
+DEFAULT_GROUP = 'default'
+# Ключ группы - id чата Telegram или короткое имя. Длина ограничена, чтобы
+# "notgoing_<uuid>:<группа>" уложился в 64 байта callback_data
+_GROUP_KEY = re.compile(r'-?[A-Za-z0-9_]{1,18}')
+
+# Группа текущего запроса или фоновой задачи (см. instrument и ShardedDatabase.use)
+current_group = contextvars.ContextVar('current_group', default=DEFAULT_GROUP)
+
+
+def validate_group(group) -> str:
+    group = str(group).strip() if group is not None else ''
+    if not _GROUP_KEY.fullmatch(group):
+        raise ValueError('Invalid group id')
+    return group
+
+
+class UnknownGroup(KeyError):
+    """Группа не создана (404): шарды открываются только для существующих групп"""
+
+
+class ShardedDatabase:
+    """Хранилище, разделённое по группам (сообществам).
+
+    У каждой группы своя Database: свои файлы секций в shards_dir/<группа>/,
+    свои блокировки, индексы и версия данных. Запись в одной группе не
+    перезаписывает и не блокирует данные другой, списки и рассылки
+    строятся по задачам и пользователям одной группы.
+
+    Атрибуты Database берутся у шарда текущей группы (current_group), так
+    что код обработчиков работает с ShardedDatabase как с одной базой.
+
+    Новая группа появляется только через create (админский эндпоинт):
+    каждый шард держит базу в памяти, поэтому ключ группы из запроса
+    не должен сам по себе создавать каталог и Database.
+    """
+
+    def __init__(self, db_file='data.json', shards_dir='shards', photos_dir='photos', **options):
+        self.db_file = db_file
+        self.shards_dir = shards_dir
+        self.photos_dir = photos_dir
+        # Параметры Database (completed_limit, codec, shared_snapshot, ...) - общие для шардов
+        self.options = options
+        self._shards: Dict[str, Database] = {}
+        self._opening: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.shard(DEFAULT_GROUP)
+
+    def _shard_file(self, group: str) -> str:
+        if group == DEFAULT_GROUP:
+            return self.db_file
+        return os.path.join(self.shards_dir, group, 'data.json')
+
+    def exists(self, group: str) -> bool:
+        """Создана ли группа (открыта или есть её каталог на диске)"""
+        if group == DEFAULT_GROUP or group in self._shards:
+            return True
+        return bool(_GROUP_KEY.fullmatch(group)) and os.path.isdir(os.path.join(self.shards_dir, group))
+
+    def shard(self, group: str = None) -> Database:
+        """База группы (по умолчанию - текущей); открывается при первом обращении.
+
+        Для несозданной группы - UnknownGroup.
+        """
+        group = current_group.get() if group is None else group
+        db = self._shards.get(group)
+        if db is not None:
+            return db
+        if not self.exists(group):
+            raise UnknownGroup(group)
+        return self._open(group)
+
+    def create(self, group: str) -> bool:
+        """Создаёт группу; False, если она уже есть"""
+        group = validate_group(group)
+        if self.exists(group):
+            return False
+        os.makedirs(os.path.join(self.shards_dir, group), exist_ok=True)
+        self._open(group)
+        return True
+
+    def _open(self, group: str) -> Database:
+        # Общая блокировка - только на выдачу блокировки группы: пока одна
+        # группа читается с диска, остальные работают
+        with self._lock:
+            opening = self._opening.setdefault(group, threading.Lock())
+        with opening:
+            db = self._shards.get(group)
+            if db is None:
+                path = self._shard_file(group)
+                directory = os.path.dirname(path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                db = Database(path, self.photos_dir, **self.options)
+                self._shards[group] = db
+        return db
+
+    def groups(self) -> List[str]:
+        """Все группы: открытые и имеющие данные на диске"""
+        groups = dict.fromkeys([DEFAULT_GROUP, *self._shards])
+        if os.path.isdir(self.shards_dir):
+            for name in sorted(os.listdir(self.shards_dir)):
+                if _GROUP_KEY.fullmatch(name) and os.path.isdir(os.path.join(self.shards_dir, name)):
+                    groups[name] = None
+        return list(groups)
+
+    @contextmanager
+    def use(self, group: str):
+        """Делает group текущей группой (для фоновых задач вне запроса)"""
+        token = current_group.set(validate_group(group))
+        try:
+            yield self.shard()
+        finally:
+            current_group.reset(token)
+
+    def __getattr__(self, name):
+        return getattr(self.shard(), name)
+
+
+def instrument(app, db: ShardedDatabase):
+    """Группа запроса - из заголовка X-Group-Id или параметра group_id"""
+    from flask import g, jsonify, request
+
+    @app.before_request
+    def _assign_group():
+        group = request.headers.get('X-Group-Id') or request.args.get('group_id')
+        if group is None:
+            return None
+        try:
+            group = validate_group(group)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if not db.exists(group):
+            return jsonify({"error": "Unknown group"}), 404
+        g.group_token = current_group.set(group)
+        return None
+
+    @app.teardown_request
+    def _reset_group(error=None):
+        token = g.pop('group_token', None)
+        if token is not None:
+            current_group.reset(token)
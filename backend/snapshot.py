@@ -0,0 +1,196 @@
+"""Кодеки снимков секций хранилища.
+
+json   - прежний формат: читаемый JSON с отступами (по умолчанию).
+binary - компактный формат: заголовок + marshal кортежей записей
+         (Task.to_record и т.п.), без преобразования дат в строки.
+
+Заголовок бинарного снимка (little-endian, 24 байта):
+    magic      4s  b'MADB'
+    format     B   версия формата заголовка (FORMAT_VERSION)
+    records    B   версия раскладки записей (models.RECORD_VERSION)
+    marshal    B   версия marshal, которой записан снимок
+    flags      B   FLAG_ZLIB - полезная нагрузка сжата
+    length     Q   длина полезной нагрузки в байтах
+    crc32      I   CRC32 полезной нагрузки (как записана на диск)
+    reserved   I
+
+Конвертер для отладки:
+    python snapshot.py convert data.tasks.bin data.tasks.json
+    python snapshot.py info data.tasks.bin
+"""
+import argparse
+import json
+import marshal
+import os
+import struct
+import sys
+import zlib
+
+from models import Task, User, RECORD_VERSION
+
+MAGIC = b'MADB'
+FORMAT_VERSION = 1
+FLAG_ZLIB = 1
+HEADER = struct.Struct('<4sBBBBQII')
+
+
+class SnapshotError(ValueError):
+    """Файл снимка повреждён или записан несовместимой версией"""
+
+
+def records_from_json(name: str, raw):
+    """JSON секции -> записи в памяти"""
+    if name == 'users':
+        return {key: User.from_json(user) for key, user in (raw or {}).items()}
+    if name == 'completed_tasks':
+        return [Task.from_json(task) for task in raw or []]
+    # Ключом служит сам task.id, чтобы не держать вторую копию строки
+    return {task.id: task for task in map(Task.from_json, (raw or {}).values())}
+
+
+def records_to_json(name: str, section):
+    if name == 'completed_tasks':
+        return [task.to_json() for task in section]
+    return {key: record.to_json() for key, record in section.items()}
+
+
+class JsonCodec:
+    name = 'json'
+    extension = '.json'
+
+    def encode(self, name: str, section) -> bytes:
+        raw = records_to_json(name, section)
+        return json.dumps(raw, ensure_ascii=False, indent=2, default=str).encode('utf-8')
+
+    def decode(self, name: str, payload: bytes):
+        return records_from_json(name, json.loads(payload))
+
+
+class BinaryCodec:
+    name = 'binary'
+    extension = '.bin'
+
+    def __init__(self, compress: bool = False):
+        self.compress = compress
+
+    def encode(self, name: str, section) -> bytes:
+        if name == 'users':
+            rows = [(key, user.to_record()) for key, user in section.items()]
+        else:
+            tasks = section if name == 'completed_tasks' else section.values()
+            rows = [task.to_record() for task in tasks]
+        payload = marshal.dumps(rows)
+        flags = 0
+        if self.compress:
+            payload = zlib.compress(payload, 1)
+            flags |= FLAG_ZLIB
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, RECORD_VERSION, marshal.version,
+                             flags, len(payload), zlib.crc32(payload), 0)
+        return header + payload
+
+    def decode(self, name: str, payload: bytes):
+        rows = marshal.loads(unpack(payload))
+        if name == 'users':
+            return {key: User.from_record(record) for key, record in rows}
+        tasks = map(Task.from_record, rows)
+        if name == 'completed_tasks':
+            return list(tasks)
+        return {task.id: task for task in tasks}
+
+
+def read_header(data: bytes) -> dict:
+    if len(data) < HEADER.size or not data.startswith(MAGIC):
+        raise SnapshotError('Not a binary snapshot')
+    _, fmt, records, marshal_version, flags, length, crc, _ = HEADER.unpack_from(data)
+    return {'format': fmt, 'records': records, 'marshal': marshal_version,
+            'flags': flags, 'length': length, 'crc32': crc}
+
+
+def unpack(data: bytes) -> bytes:
+    """Проверяет заголовок и контрольную сумму, возвращает данные marshal"""
+    header = read_header(data)
+    if header['format'] != FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot format {header['format']}")
+    if header['records'] != RECORD_VERSION:
+        raise SnapshotError(f"Unsupported record layout {header['records']}")
+    if header['marshal'] > marshal.version:
+        raise SnapshotError(f"Snapshot written by newer marshal {header['marshal']}")
+    payload = data[HEADER.size:]
+    if len(payload) != header['length'] or zlib.crc32(payload) != header['crc32']:
+        raise SnapshotError('Snapshot checksum mismatch')
+    if header['flags'] & FLAG_ZLIB:
+        payload = zlib.decompress(payload)
+    return payload
+
+
+CODECS = {
+    'json': JsonCodec,
+    'binary': BinaryCodec,
+    'binary+zlib': lambda: BinaryCodec(compress=True),
+}
+EXTENSIONS = ('.json', '.bin')
+
+
+def get_codec(name: str):
+    try:
+        return CODECS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown snapshot codec: {name}")
+
+
+def codec_for(data: bytes):
+    """Кодек, которым записан снимок (по сигнатуре)"""
+    return BinaryCodec() if data.startswith(MAGIC) else JsonCodec()
+
+
+def section_name(path: str) -> str:
+    """data.tasks.bin -> tasks"""
+    return os.path.splitext(os.path.basename(path))[0].rsplit('.', 1)[-1]
+
+
+def convert(src: str, dst: str, section: str = None, codec: str = None):
+    section = section or section_name(src)
+    with open(src, 'rb') as f:
+        data = f.read()
+    records = codec_for(data).decode(section, data)
+    if codec is None:
+        codec = 'binary' if dst.endswith('.bin') else 'json'
+    with open(dst, 'wb') as f:
+        f.write(get_codec(codec).encode(section, records))
+    return len(records)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Snapshot converter')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    convert_cmd = commands.add_parser('convert', help='Convert between JSON and binary')
+    convert_cmd.add_argument('src')
+    convert_cmd.add_argument('dst')
+    convert_cmd.add_argument('--section', choices=('tasks', 'users', 'deleted_tasks', 'completed_tasks'),
+                             help='Section name (default: from file name)')
+    convert_cmd.add_argument('--codec', choices=sorted(CODECS),
+                             help='Target codec (default: from extension)')
+
+    info_cmd = commands.add_parser('info', help='Show binary snapshot header')
+    info_cmd.add_argument('path')
+
+    args = parser.parse_args(argv)
+    try:
+        if args.command == 'convert':
+            count = convert(args.src, args.dst, args.section, args.codec)
+            print(f"{args.src} -> {args.dst}: {count} records")
+        else:
+            with open(args.path, 'rb') as f:
+                data = f.read()
+            header = read_header(data)
+            unpack(data)
+            print(json.dumps(header, indent=2))
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
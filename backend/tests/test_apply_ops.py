@@ -0,0 +1,60 @@
+import pytest
+
+from database import Database
+
+
+def task_data(title='Task', **extra):
+    return {
+        'title': title,
+        'event_date': '2030-01-05T10:00:00',
+        'preparation_date': '2030-01-01T10:00:00',
+        'created_by': 1,
+        'created_by_username': 'user',
+        **extra,
+    }
+
+
+@pytest.fixture
+def db(tmp_path):
+    return Database(str(tmp_path / 'data.json'), str(tmp_path / 'photos'))
+
+
+@pytest.fixture
+def task(db):
+    return db.add_task(task_data(checklist=[{'id': 'a', 'text': 'Item', 'completed_by': []}]))
+
+
+def test_ops_applied_together(db, task):
+    result = db.apply_ops(task['id'], [
+        {'op': 'add_to_set', 'path': 'ready_users', 'value': 5},
+        {'op': 'toggle_in_set', 'path': 'checklist/a/completed_by', 'value': 5},
+        {'op': 'set_field', 'path': 'title', 'value': 'Renamed'},
+    ])
+    assert result['ready_users'] == [5]
+    assert result['checklist'][0]['completed_by'] == [5]
+    assert result['title'] == 'Renamed'
+
+
+@pytest.mark.parametrize('bad_op', [
+    {'op': 'set_field', 'path': 'id', 'value': 'x'},
+    {'op': 'add_to_set', 'path': 'checklist/missing/completed_by', 'value': 1},
+    {'op': 'explode', 'path': 'title', 'value': 1},
+    {'op': 'add_to_set', 'path': 'ready_users'},
+    {'op': 'add_to_set', 'path': 'a/b', 'value': 1},
+    {'op': 'set_field', 'path': 'event_date', 'value': 'garbage'},
+    {'op': 'set_field', 'path': 'event_date', 'value': None},
+    {'op': 'set_field', 'path': 'title', 'value': 5},
+    {'op': 'list_append', 'path': 'photos', 'value': {}},
+])
+def test_invalid_op_changes_nothing(db, task, bad_op, tmp_path):
+    before = db.get_task(task['id'])
+    with pytest.raises(ValueError):
+        db.apply_ops(task['id'], [{'op': 'add_to_set', 'path': 'ready_users', 'value': 5}, bad_op])
+    assert db.get_task(task['id']) == before
+    reopened = Database(str(tmp_path / 'data.json'), str(tmp_path / 'photos'))
+    assert reopened.get_task(task['id']) == before
+
+
+def test_unknown_task(db):
+    assert db.apply_ops('missing', [{'op': 'add_to_set', 'path': 'ready_users', 'value': 1}]) is None
+
@@ -0,0 +1,93 @@
+import pytest
+
+from database import BatchError, Database
+
+
+def task_data(title='Task', **extra):
+    return {
+        'title': title,
+        'event_date': '2030-01-05T10:00:00',
+        'preparation_date': '2030-01-01T10:00:00',
+        'created_by': 1,
+        'created_by_username': 'user',
+        **extra,
+    }
+
+
+@pytest.fixture
+def db(tmp_path):
+    return Database(str(tmp_path / 'data.json'), str(tmp_path / 'photos'))
+
+
+@pytest.fixture
+def task(db):
+    return db.add_task(task_data(checklist=[{'id': 'a', 'text': 'Item', 'completed_by': []}]))
+
+
+def test_atomic_batch_rolls_back(db, task):
+    before = db.get_task(task['id'])
+    with pytest.raises(BatchError) as error:
+        db.run_batch([
+            {'op': 'mark_ready', 'args': {'task_id': task['id'], 'user_id': 7}},
+            {'op': 'update_checklist_item', 'args': {'task_id': task['id'], 'item_id': 'missing'}},
+        ], atomic=True)
+    assert [result['ok'] for result in error.value.results] == [True, False]
+    assert db.get_task(task['id']) == before
+
+
+def test_non_atomic_batch_keeps_successful_ops(db, task):
+    results = db.run_batch([
+        {'op': 'mark_ready', 'args': {'task_id': task['id'], 'user_id': 7}},
+        {'op': 'drop_tables', 'args': {}},
+    ])
+    assert [result['ok'] for result in results] == [True, False]
+    assert db.get_task(task['id'])['ready_users'] == [7]
+
+
+def add_photo_task(db, tmp_path, name):
+    (tmp_path / 'photos' / name).write_bytes(b'jpeg')
+    return db.add_task(task_data(name, photos=[f"/photos/{name}"]))
+
+
+def test_atomic_batch_keeps_photo_files(db, task, tmp_path):
+    with_photo = add_photo_task(db, tmp_path, 'a.jpg')
+    with pytest.raises(BatchError):
+        db.run_batch([
+            {'op': 'remove_photo', 'args': {'task_id': with_photo['id'], 'photo_index': 0}},
+            {'op': 'update_checklist_item', 'args': {'task_id': task['id'], 'item_id': 'missing'}},
+        ], atomic=True)
+    assert (tmp_path / 'photos' / 'a.jpg').exists()
+    assert db.get_task(with_photo['id'])['photos'] == ['/photos/a.jpg']
+
+
+def test_atomic_batch_keeps_trimmed_photo_files(tmp_path):
+    db = Database(str(tmp_path / 'data.json'), str(tmp_path / 'photos'), completed_limit=1)
+    first = add_photo_task(db, tmp_path, 'a.jpg')
+    second = add_photo_task(db, tmp_path, 'b.jpg')
+    db.complete_task(first['id'])
+    with pytest.raises(BatchError):
+        db.run_batch([
+            {'op': 'complete_task', 'args': {'task_id': second['id']}},
+            {'op': 'complete_task', 'args': {'task_id': 'missing'}},
+        ], atomic=True)
+    assert (tmp_path / 'photos' / 'a.jpg').exists()
+    assert [t['id'] for t in db.get_completed_tasks()] == [first['id']]
+
+
+def test_photo_removed_after_commit(db, tmp_path):
+    with_photo = add_photo_task(db, tmp_path, 'a.jpg')
+    results = db.run_batch([{'op': 'remove_photo', 'args': {'task_id': with_photo['id'], 'photo_index': 0}}])
+    assert results[0]['ok']
+    assert not (tmp_path / 'photos' / 'a.jpg').exists()
+
+
+def test_non_atomic_batch_rolls_back_failed_op(db, task, tmp_path):
+    results = db.run_batch([
+        {'op': 'mark_ready', 'args': {'task_id': task['id'], 'user_id': 7}},
+        {'op': 'update_task', 'args': {'task_id': task['id'], 'updates': {'title': 'New', 'event_date': 'garbage'}}},
+    ])
+    assert [result['ok'] for result in results] == [True, False]
+    for current in (db, Database(str(tmp_path / 'data.json'), str(tmp_path / 'photos'))):
+        stored = current.get_task(task['id'])
+        assert stored['title'] == 'Task'
+        assert stored['ready_users'] == [7]
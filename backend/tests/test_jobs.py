@@ -0,0 +1,36 @@
+import os
+import time
+
+from jobs import JobQueue, DONE, FAILED
+
+
+def crash(payload):
+    os._exit(1)
+
+
+def square(payload):
+    return {'value': payload['value'] ** 2}
+
+
+def wait_finished(queue, job_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job['status'] in (DONE, FAILED):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} not finished")
+
+
+def test_broken_process_pool_replaced(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.db'), io_workers=1, cpu_workers=1, poll_interval=0.05)
+    queue.register('crash', cpu=True, max_attempts=1)(crash)
+    queue.register('square', cpu=True)(square)
+    queue.start()
+    crashed = wait_finished(queue, queue.submit('crash')['id'])
+    assert crashed['status'] == FAILED
+    assert 'BrokenProcessPool' in crashed['error']
+    # Следующее cpu-задание выполняется в новом пуле
+    job = wait_finished(queue, queue.submit('square', {'value': 7})['id'])
+    assert job['status'] == DONE
+    assert job['result'] == {'value': 49}
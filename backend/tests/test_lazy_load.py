@@ -0,0 +1,44 @@
+import os
+import signal
+import threading
+
+from database import Database
+
+
+def task_data(title='Task', **extra):
+    return {
+        'title': title,
+        'event_date': '2030-01-05T10:00:00',
+        'preparation_date': '2030-01-01T10:00:00',
+        'created_by': 1,
+        'created_by_username': 'user',
+        **extra,
+    }
+
+
+def open_db(tmp_path):
+    return Database(str(tmp_path / 'data.json'), str(tmp_path / 'photos'), lazy_load=True)
+
+
+def test_lazy_load_starts_no_threads(tmp_path):
+    open_db(tmp_path).add_task(task_data())
+    before = set(threading.enumerate())
+    open_db(tmp_path)
+    assert set(threading.enumerate()) == before
+
+
+def test_write_after_fork(tmp_path):
+    # Как gunicorn --preload: база создаётся в мастере, пишет форкнутый воркер
+    db = open_db(tmp_path)
+    db.add_task(task_data())
+    pid = os.fork()
+    if pid == 0:
+        signal.alarm(10)
+        try:
+            db.add_task(task_data('Child'))
+            code = 0 if len(open_db(tmp_path).get_tasks()) == 2 else 1
+        except BaseException:
+            code = 1
+        os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
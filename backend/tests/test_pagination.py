@@ -0,0 +1,62 @@
+import base64
+
+import pytest
+
+from database import Database
+
+
+def task_data(title='Task', **extra):
+    return {
+        'title': title,
+        'event_date': '2030-01-05T10:00:00',
+        'preparation_date': '2030-01-01T10:00:00',
+        'created_by': 1,
+        'created_by_username': 'user',
+        **extra,
+    }
+
+
+@pytest.fixture
+def db(tmp_path):
+    return Database(str(tmp_path / 'data.json'), str(tmp_path / 'photos'))
+
+
+@pytest.mark.parametrize('key', [(0, ''), (1714557600000000, 'a1b2'), (-5, 'ключ/с+символами')])
+def test_cursor_round_trip(key):
+    assert Database._decode_cursor(Database._encode_cursor(key)) == key
+
+
+@pytest.mark.parametrize('cursor', [
+    'not base64 at all!',
+    base64.urlsafe_b64encode(b'{"a": 1}').decode(),
+    base64.urlsafe_b64encode(b'[1, 2, 3]').decode(),
+    base64.urlsafe_b64encode(b'[{"a": 1}, "id"]').decode(),
+    base64.urlsafe_b64encode(b'[1, null]').decode(),
+    base64.urlsafe_b64encode(b'[true, "id"]').decode(),
+    base64.urlsafe_b64encode(b'\xff\xfe').decode(),
+    'ключ',
+])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError, match='Invalid cursor'):
+        Database._decode_cursor(cursor)
+
+
+def test_pages_cover_archive_newest_first(db):
+    ids = [db.add_task(task_data(f"Task {i}"))['id'] for i in range(25)]
+    for task_id in ids:
+        db.delete_task(task_id)
+
+    seen, cursor = [], None
+    while True:
+        page = db.get_deleted_tasks_page(limit=10, cursor=cursor)
+        seen.extend(task['id'] for task in page['items'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+    assert seen == [task['id'] for task in db.get_deleted_tasks()]
+    assert sorted(seen) == sorted(ids)
+
+
+def test_page_with_invalid_cursor(db):
+    with pytest.raises(ValueError):
+        db.get_completed_tasks_page(cursor='%%%')
@@ -0,0 +1,39 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from database import Database
+
+
+def task_data(title='Task', **extra):
+    return {
+        'title': title,
+        'event_date': '2030-01-05T10:00:00',
+        'preparation_date': '2030-01-01T10:00:00',
+        'created_by': 1,
+        'created_by_username': 'user',
+        **extra,
+    }
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / 'data.json'), str(tmp_path / 'photos'))
+    # 10:00 по Киеву (UTC+2 зимой) = 08:00 UTC - одно и то же время в обеих шкалах
+    db.add_task(task_data('Naive meeting'))
+    db.add_task(task_data('Aware meeting', event_date='2030-01-05T08:00:00+00:00'))
+    return db
+
+
+@pytest.mark.parametrize('bound, inside', [
+    (datetime(2030, 1, 5, 10, 0), True),
+    (datetime(2030, 1, 5, 8, 0, tzinfo=timezone.utc), True),
+    (datetime(2030, 1, 5, 10, 1), False),
+    (datetime(2030, 1, 5, 8, 1, tzinfo=timezone.utc), False),
+])
+def test_bounds_apply_to_naive_and_aware_dates(db, bound, inside):
+    expected = {'Naive meeting', 'Aware meeting'} if inside else set()
+    assert {t['title'] for t in db.get_tasks(date_from=bound)} == expected
+    assert {t['title'] for t in db.search_tasks('meeting', date_from=bound)} == expected
+    # Граница не раньше события: как верхняя она оставляет обе задачи
+    assert {t['title'] for t in db.get_tasks(date_to=bound)} == {'Naive meeting', 'Aware meeting'}
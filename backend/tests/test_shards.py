@@ -0,0 +1,66 @@
+import pytest
+from flask import Flask, jsonify
+
+import shards
+from shards import DEFAULT_GROUP, ShardedDatabase, UnknownGroup, current_group, validate_group
+
+
+@pytest.fixture
+def sharded(tmp_path):
+    return ShardedDatabase(str(tmp_path / 'data.json'), str(tmp_path / 'shards'), str(tmp_path / 'photos'))
+
+
+@pytest.mark.parametrize('group', ['-1001234567890', 'team_b', 'A1', ' padded '])
+def test_valid_group(group):
+    assert validate_group(group) == group.strip()
+
+
+@pytest.mark.parametrize('group', [None, '', '../etc', 'a/b', 'x' * 19, 'группа', '1.2'])
+def test_invalid_group(group):
+    with pytest.raises(ValueError):
+        validate_group(group)
+
+
+def test_unknown_group_is_not_created(sharded, tmp_path):
+    with pytest.raises(UnknownGroup):
+        sharded.shard('abc')
+    with pytest.raises(UnknownGroup):
+        with sharded.use('abc'):
+            pass
+    assert not (tmp_path / 'shards' / 'abc').exists()
+    assert sharded.groups() == [DEFAULT_GROUP]
+
+
+def test_created_group_is_separate(sharded):
+    assert sharded.create('team') is True
+    assert sharded.create('team') is False
+    with sharded.use('team'):
+        sharded.add_user({'telegram_id': 1, 'username': 'u', 'first_name': 'U'})
+    assert sharded.get_all_users() == []
+    assert sharded.shard('team').get_all_users()[0]['telegram_id'] == 1
+    assert sharded.groups() == [DEFAULT_GROUP, 'team']
+
+
+def test_created_group_visible_to_new_instance(sharded, tmp_path):
+    sharded.create('team')
+    reopened = ShardedDatabase(str(tmp_path / 'data.json'), str(tmp_path / 'shards'), str(tmp_path / 'photos'))
+    assert reopened.exists('team')
+    assert 'team' in reopened.groups()
+
+
+def test_request_group_resolution(sharded):
+    sharded.create('team')
+    app = Flask(__name__)
+    shards.instrument(app, sharded)
+
+    @app.route('/group')
+    def group():
+        return jsonify(current_group.get())
+
+    client = app.test_client()
+    assert client.get('/group').get_json() == DEFAULT_GROUP
+    assert client.get('/group', headers={'X-Group-Id': 'team'}).get_json() == 'team'
+    assert client.get('/group?group_id=team').get_json() == 'team'
+    assert client.get('/group', headers={'X-Group-Id': 'abc'}).status_code == 404
+    assert client.get('/group', headers={'X-Group-Id': '../x'}).status_code == 400
+    assert 'abc' not in sharded.groups()
@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+import time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Импорт main как в мастере gunicorn --preload: какие потоки остались после импорта
+IMPORT_SCRIPT = """
+import threading
+import main
+print(sorted(t.name for t in threading.enumerate()))
+"""
+
+# Воркер: запускает фоновую работу и сообщает, достался ли ему планировщик
+WORKER_SCRIPT = """
+import sys, time
+import main
+main.start_workers()
+for line in sys.stdin:
+    time.sleep(0.5)
+    print(main.scheduler is not None, flush=True)
+"""
+
+
+def spawn(script, cwd, **options):
+    env = {**os.environ, 'PYTHONPATH': BACKEND, 'RATE_LIMIT_ENABLED': '0'}
+    return subprocess.Popen([sys.executable, '-c', script], cwd=cwd, env=env, text=True,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, **options)
+
+
+def ask(worker):
+    worker.stdin.write('\n')
+    worker.stdin.flush()
+    return worker.stdout.readline().strip() == 'True'
+
+
+def test_import_starts_no_background_work(tmp_path):
+    out, _ = spawn(IMPORT_SCRIPT, tmp_path).communicate(timeout=60)
+    names = eval(out.strip().splitlines()[-1])
+    assert not {'scheduler', 'scheduler-start', 'search-index', 'db-cleanup'} & set(names)
+    assert not any(name.startswith('jobs') for name in names)
+
+
+def test_single_scheduler_across_workers(tmp_path):
+    workers = [spawn(WORKER_SCRIPT, tmp_path, stdin=subprocess.PIPE) for _ in range(2)]
+    try:
+        deadline = time.monotonic() + 30
+        owners = [ask(worker) for worker in workers]
+        while not any(owners) and time.monotonic() < deadline:
+            owners = [ask(worker) for worker in workers]
+        assert owners.count(True) == 1
+        # Владелец завершился - планировщик подхватывает другой воркер
+        owner, other = (workers[0], workers[1]) if owners[0] else (workers[1], workers[0])
+        owner.kill()
+        owner.wait()
+        while not ask(other) and time.monotonic() < deadline:
+            pass
+        assert ask(other)
+    finally:
+        for worker in workers:
+            worker.kill()
+            worker.wait()
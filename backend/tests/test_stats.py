@@ -0,0 +1,113 @@
+import random
+
+import pytest
+
+from database import Database
+
+WORDS = ['alpha', 'beta', 'gamma', 'delta']
+
+
+def task_data(title='Task', **extra):
+    return {
+        'title': title,
+        'event_date': '2030-01-05T10:00:00',
+        'preparation_date': '2030-01-01T10:00:00',
+        'created_by': 1,
+        'created_by_username': 'user',
+        **extra,
+    }
+
+
+@pytest.fixture
+def db(tmp_path):
+    return Database(str(tmp_path / 'data.json'), str(tmp_path / 'photos'))
+
+
+def random_op(rng, db, ids):
+    task_id = rng.choice(ids)
+    op = rng.randrange(8)
+    if op == 0:
+        db.mark_ready(task_id, rng.randrange(4))
+    elif op == 1:
+        db.mark_not_going(task_id, rng.randrange(4))
+    elif op == 2:
+        db.delete_task(task_id)
+    elif op == 3:
+        db.restore_task(task_id)
+    elif op == 4:
+        db.complete_task(task_id)
+    elif op == 5:
+        db.restore_completed_task(task_id)
+    elif op == 6:
+        db.update_task(task_id, {'title': f"{rng.choice(WORDS)} renamed", 'is_preparation_completed': rng.random() < 0.5})
+    else:
+        task = db.get_task(task_id)
+        if task and task['checklist']:
+            db.update_checklist_item(task_id, task['checklist'][0]['id'], toggle_user=rng.randrange(4))
+
+
+def make_tasks(db, rng, count=30):
+    return [
+        db.add_task(task_data(
+            f"{rng.choice(WORDS)} task {i}",
+            event_date=f"20{20 + i % 15}-01-05T10:00:00",
+            checklist=[{'id': f"c{i}", 'text': rng.choice(WORDS), 'completed_by': []}],
+        ))['id']
+        for i in range(count)
+    ]
+
+
+def test_incremental_stats_match_rebuild(db):
+    rng = random.Random(1)
+    ids = make_tasks(db, rng)
+    db.get_stats()
+    for step in range(300):
+        random_op(rng, db, ids)
+        if step % 25 == 0:
+            assert db.rebuild_stats()['mismatches'] == {}
+    stats = db.rebuild_stats()
+    assert stats['mismatches'] == {}
+    tasks = stats['stats']['tasks']
+    assert tasks['active'] == len(db.get_tasks())
+    assert tasks['deleted'] == len(db.get_deleted_tasks())
+    assert tasks['completed'] == len(db.get_completed_tasks())
+    assert sum(stats['stats']['status'].values()) == tasks['active']
+
+
+def test_rolled_back_transaction_keeps_stats(db):
+    task_id = db.add_task(task_data())['id']
+    before = db.get_stats()
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.mark_ready(task_id, 1)
+            raise RuntimeError
+    assert db.get_stats() == before
+    assert db.rebuild_stats()['mismatches'] == {}
+
+
+def test_other_process_changes_applied_incrementally(tmp_path):
+    # Два экземпляра над одними файлами ведут себя как два воркера gunicorn
+    path, photos = str(tmp_path / 'data.json'), str(tmp_path / 'photos')
+    writer = Database(path, photos, shared_snapshot=True)
+    reader = Database(path, photos, shared_snapshot=True)
+    rng = random.Random(2)
+    ids = make_tasks(writer, rng)
+    reader.get_stats()
+    reader.search_tasks('alpha')
+    stats, index = reader._stats, reader._search
+
+    writer.add_user({'telegram_id': 5, 'username': 'u', 'first_name': 'U'})
+    reader.get_stats()
+    assert reader._stats is stats and reader._search is index
+
+    for step in range(100):
+        random_op(rng, rng.choice([writer, writer, reader]), ids)
+        reader.get_stats()
+        reader.search_tasks(rng.choice(WORDS), include_archived=True)
+    assert reader._stats is stats and reader._search is index
+
+    word = rng.choice(WORDS)
+    incremental = {task['id'] for task in reader.search_tasks(word, include_archived=True)}
+    assert reader.rebuild_stats()['mismatches'] == {}
+    reader._search = None
+    assert {task['id'] for task in reader.search_tasks(word, include_archived=True)} == incremental
@@ -0,0 +1,38 @@
+import pytest
+
+from models import Task
+
+
+def make_task():
+    return Task.from_json({
+        'id': 't1',
+        'title': 'Task',
+        'event_date': '2030-01-05T10:00:00',
+        'preparation_date': '2030-01-01T10:00:00',
+        'created_by': 1,
+        'created_by_username': 'user',
+    })
+
+
+@pytest.mark.parametrize('updates', [
+    {'title': 'New', 'event_date': 'garbage'},
+    {'title': 'New', 'preparation_date': None},
+    {'event_date': '2030-02-01T10:00:00+02:00', 'deleted_at': 5},
+    {'ready_users': [1], 'not_going_users': 3},
+    {'description': 'New', 'checklist': [{'text': 'No id'}]},
+])
+def test_invalid_update_changes_nothing(updates):
+    task = make_task()
+    before = task.to_json()
+    with pytest.raises((ValueError, TypeError)):
+        task.update(updates)
+    assert task.to_json() == before
+
+
+def test_update_applies_all_fields():
+    task = make_task()
+    task.update({'title': 'New', 'event_date': '2030-02-01T10:00:00+02:00', 'ready_users': [1]})
+    data = task.to_json()
+    assert data['title'] == 'New'
+    assert data['event_date'] == '2030-02-01T08:00:00+00:00'
+    assert data['ready_users'] == [1]
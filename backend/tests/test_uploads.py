@@ -0,0 +1,41 @@
+import errno
+import io
+import os
+
+import uploads
+from uploads import UploadStore
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 56
+
+
+def upload(store):
+    upload_id = store.create('task', 'photo.png', len(PNG))['upload_id']
+    store.write(upload_id, 0, io.BytesIO(PNG), len(PNG))
+    return upload_id
+
+
+def test_finish_moves_file(tmp_path):
+    store = UploadStore(str(tmp_path / 'uploads'))
+    destination = tmp_path / 'photo.png'
+    store.finish(upload(store), str(destination))
+    assert destination.read_bytes() == PNG
+    assert os.listdir(store.directory) == []
+
+
+def test_finish_across_filesystems(tmp_path, monkeypatch):
+    store = UploadStore(str(tmp_path / 'uploads'))
+    upload_id = upload(store)
+    replace = os.replace
+
+    def cross_device(src, dst):
+        # Как rename между томами: .part в другом каталоге не переносится
+        if str(src).endswith('.part'):
+            raise OSError(errno.EXDEV, 'Invalid cross-device link')
+        replace(src, dst)
+
+    monkeypatch.setattr(uploads.os, 'replace', cross_device)
+    destination = tmp_path / 'photo.png'
+    store.finish(upload_id, str(destination))
+    assert destination.read_bytes() == PNG
+    assert sorted(os.listdir(tmp_path)) == ['photo.png', 'uploads']
+    assert os.listdir(store.directory) == []
@@ -0,0 +1,34 @@
+"""Часовые пояса на стандартном zoneinfo с кэшем объектов зон.
+
+Наивные даты задач - киевское время (DEFAULT_TIMEZONE). localize делает
+то же, что pytz localize(is_dst=False): в час перевода часов выбирается
+зимнее время.
+
+Где нет системной базы часовых поясов (slim-образы, Windows), zoneinfo
+берёт её из пакета tzdata (requirements.txt).
+"""
+import functools
+from datetime import datetime, tzinfo
+from zoneinfo import ZoneInfo
+
+DEFAULT_TIMEZONE = 'Europe/Kiev'
+
+
+@functools.lru_cache(maxsize=64)
+def get(name: str) -> tzinfo:
+    """Зона по имени IANA; неизвестное имя - ZoneInfoNotFoundError (KeyError)"""
+    return ZoneInfo(name)
+
+
+KYIV = get(DEFAULT_TIMEZONE)
+
+
+def localize(dt: datetime, tz: tzinfo = KYIV) -> datetime:
+    """Наивное время -> время в зоне tz"""
+    aware = dt.replace(tzinfo=tz)
+    # Неоднозначный час (осенний перевод): fold=0 - летнее время, нужно зимнее
+    if aware.dst():
+        later = aware.replace(fold=1)
+        if later.utcoffset() != aware.utcoffset():
+            return later
+    return aware
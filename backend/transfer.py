@@ -0,0 +1,147 @@
+"""Потоковая выгрузка и загрузка данных в NDJSON (резервные копии, переносы).
+
+Одна строка - одна запись:
+    {"type": "meta", "format": 1, "version": ..., "exported_at": ...}
+    {"type": "user", "data": {...}}
+    {"type": "task" | "deleted_task" | "completed_task", "data": {...}}
+    {"type": "end", "counts": {...}}
+
+Выгрузка читает записи пачками под короткими блокировками чтения, загрузка
+применяет их пачками (одна транзакция и одно сохранение на пачку), так что
+ни то ни другое не держит всю базу в памяти и не останавливает запросы.
+Записи с существующими id заменяются.
+
+    python transfer.py export data.json backup.ndjson
+    python transfer.py import data.json backup.ndjson
+"""
+import argparse
+import json
+import os
+import sys
+from collections import Counter
+from datetime import datetime
+from typing import Iterable, Iterator
+
+FORMAT_VERSION = 1
+# Секция хранилища -> тип записи
+RECORD_TYPES = {
+    'users': 'user',
+    'tasks': 'task',
+    'deleted_tasks': 'deleted_task',
+    'completed_tasks': 'completed_task',
+}
+
+
+class TransferError(ValueError):
+    """Некорректная строка выгрузки"""
+
+
+def _line(record: dict) -> str:
+    return json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def export_lines(db, batch_size: int = 500) -> Iterator[str]:
+    """Строки NDJSON со всеми записями db; одна порция текста на пачку записей.
+
+    Ключи записей берутся один раз в начале, сами записи - пачками: запись,
+    изменённая во время выгрузки, попадёт в неё в новом виде, удалённая -
+    пропадёт.
+    """
+    yield _line({'type': 'meta', 'format': FORMAT_VERSION, 'version': db.version,
+                 'exported_at': datetime.now().isoformat()})
+    keys = db.export_keys()
+    counts = Counter()
+    for section, record_type in RECORD_TYPES.items():
+        section_keys = keys[section]
+        for start in range(0, len(section_keys), batch_size):
+            records = db.export_records(section, section_keys[start:start + batch_size])
+            counts[record_type] += len(records)
+            yield ''.join(_line({'type': record_type, 'data': data}) for data in records)
+    yield _line({'type': 'end', 'counts': dict(counts)})
+
+
+def import_lines(db, lines: Iterable, batch_size: int = 1000) -> Iterator[dict]:
+    """Загружает строки выгрузки пачками по batch_size записей.
+
+    После каждой пачки возвращает отчёт о ходе загрузки, в конце -
+    {"type": "done", ...}. Ошибка в строке прерывает загрузку
+    (TransferError), уже применённые пачки остаются.
+    """
+    batch = []
+    counts = Counter()
+    progress = {'type': 'progress', 'lines': 0, 'records': 0, 'batches': 0}
+
+    def apply():
+        try:
+            counts.update(db.import_records(batch))
+        except ValueError as e:
+            raise TransferError(f"Batch ending at line {progress['lines']}: {e}") from e
+        progress['records'] += len(batch)
+        progress['batches'] += 1
+        batch.clear()
+        return dict(progress, counts=dict(counts))
+
+    for number, raw in enumerate(lines, 1):
+        progress['lines'] = number
+        if isinstance(raw, bytes):
+            raw = raw.decode('utf-8')
+        raw = raw.strip()
+        if not raw:
+            continue
+        try:
+            record = json.loads(raw)
+        except ValueError:
+            raise TransferError(f"Line {number}: invalid JSON")
+        record_type = record.get('type') if isinstance(record, dict) else None
+        if record_type == 'meta':
+            if record.get('format') != FORMAT_VERSION:
+                raise TransferError(f"Line {number}: unsupported format {record.get('format')}")
+            continue
+        if record_type == 'end':
+            continue
+        if record_type not in RECORD_TYPES.values() or not isinstance(record.get('data'), dict):
+            raise TransferError(f"Line {number}: unknown record type {record_type!r}")
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield apply()
+    if batch:
+        yield apply()
+    yield dict(progress, type='done', counts=dict(counts))
+
+
+def main(argv=None):
+    from database import Database
+
+    parser = argparse.ArgumentParser(description='NDJSON export/import')
+    parser.add_argument('command', choices=('export', 'import'))
+    parser.add_argument('db_file', help='Database file (data.json)')
+    parser.add_argument('path', help='NDJSON file ("-" for stdout/stdin)')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    db = Database(args.db_file, os.path.join(os.path.dirname(args.db_file) or '.', 'photos'))
+    try:
+        if args.command == 'export':
+            out = sys.stdout if args.path == '-' else open(args.path, 'w', encoding='utf-8')
+            try:
+                for chunk in export_lines(db, args.batch_size):
+                    out.write(chunk)
+            finally:
+                if out is not sys.stdout:
+                    out.close()
+        else:
+            source = sys.stdin if args.path == '-' else open(args.path, 'r', encoding='utf-8')
+            try:
+                for report in import_lines(db, source, args.batch_size):
+                    print(json.dumps(report), file=sys.stderr)
+            finally:
+                if source is not sys.stdin:
+                    source.close()
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
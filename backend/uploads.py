@@ -0,0 +1,275 @@
+"""Возобновляемая загрузка фото частями.
+
+    POST   /api/tasks/<id>/uploads   {"filename", "size", "sha256"?}  -> загрузка
+    GET    /api/uploads/<upload_id>                                   -> сколько принято
+    PUT    /api/uploads/<upload_id>?offset=N   (тело - байты части)   -> новое смещение
+    POST   /api/uploads/<upload_id>/finalize                          -> фото в задаче
+    DELETE /api/uploads/<upload_id>
+
+Части пишутся сразу в файл <upload_id>.part, без буферизации в памяти.
+Принятые байты не теряются и при обрыве посреди части: клиент спрашивает
+смещение и досылает только недостающее. Состояние загрузки - файлы в
+каталоге, поэтому его видят все воркеры и оно переживает перезапуск.
+"""
+import errno
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from contextlib import contextmanager
+from typing import BinaryIO, Optional
+
+COPY_BUFFER = 64 * 1024
+_UPLOAD_ID = re.compile(r'[0-9a-f]{32}')
+_SHA256 = re.compile(r'[0-9a-f]{64}')
+
+# Сигнатуры разрешённых форматов: содержимое должно совпадать с расширением
+_SIGNATURES = {
+    'png': (b'\x89PNG\r\n\x1a\n',),
+    'jpg': (b'\xff\xd8\xff',),
+    'jpeg': (b'\xff\xd8\xff',),
+    'gif': (b'GIF87a', b'GIF89a'),
+}
+
+
+class UploadError(ValueError):
+    """Некорректный запрос загрузки (400)"""
+
+
+class UploadNotFound(UploadError):
+    """Загрузки нет или она истекла (404)"""
+
+
+class UploadConflict(UploadError):
+    """Смещение не совпадает с принятым или загрузку уже пишет другой запрос (409)"""
+
+    def __init__(self, message: str, offset: int):
+        super().__init__(message)
+        self.offset = offset
+
+
+def _matches_type(head: bytes, extension: str) -> bool:
+    if extension == 'webp':
+        return head[:4] == b'RIFF' and head[8:12] == b'WEBP'
+    return any(head.startswith(signature) for signature in _SIGNATURES.get(extension, ()))
+
+
+def _copy_into(source: BinaryIO, destination: str):
+    """Копирует файл во временный рядом с destination и атомарно переименовывает"""
+    staging = f"{destination}.tmp"
+    source.seek(0)
+    try:
+        with open(staging, 'wb') as out:
+            shutil.copyfileobj(source, out, COPY_BUFFER)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(staging, destination)
+    except BaseException:
+        if os.path.exists(staging):
+            os.remove(staging)
+        raise
+
+
+class UploadStore:
+    """Незавершённые загрузки в каталоге directory.
+
+    <id>.json - описание (задача, группа, имя, размер, контрольная сумма),
+    <id>.part - принятые байты; смещение загрузки - размер .part. Запись
+    части идёт под flock на .part, так что два запроса одной загрузки не
+    перемешают данные даже в разных воркерах.
+    """
+
+    def __init__(self, directory: str = 'uploads', max_size: int = 16 * 1024 * 1024,
+                 max_chunk: int = 4 * 1024 * 1024, ttl: float = 24 * 3600):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_chunk = max_chunk
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, upload_id: str, suffix: str) -> str:
+        if not _UPLOAD_ID.fullmatch(upload_id or ''):
+            raise UploadNotFound('Upload not found')
+        return os.path.join(self.directory, f"{upload_id}.{suffix}")
+
+    def _status(self, upload_id: str, meta: dict, offset: int) -> dict:
+        return {
+            'upload_id': upload_id,
+            'task_id': meta['task_id'],
+            'group': meta['group'],
+            'filename': meta['filename'],
+            'size': meta['size'],
+            'offset': offset,
+            'chunk_size': self.max_chunk,
+            'expires_at': self._touched(upload_id, meta) + self.ttl,
+        }
+
+    def _touched(self, upload_id: str, meta: dict) -> float:
+        try:
+            return os.path.getmtime(self._path(upload_id, 'part'))
+        except OSError:
+            return meta['created_at']
+
+    def _meta(self, upload_id: str) -> dict:
+        try:
+            with open(self._path(upload_id, 'json'), 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            raise UploadNotFound('Upload not found')
+        if time.time() - self._touched(upload_id, meta) > self.ttl:
+            self._remove(upload_id)
+            raise UploadNotFound('Upload expired')
+        return meta
+
+    def _remove(self, upload_id: str):
+        for suffix in ('part', 'json'):
+            try:
+                os.remove(self._path(upload_id, suffix))
+            except FileNotFoundError:
+                pass
+
+    @contextmanager
+    def _locked(self, upload_id: str):
+        """Открытый на дозапись .part под эксклюзивной блокировкой"""
+        try:
+            f = open(self._path(upload_id, 'part'), 'r+b')
+        except FileNotFoundError:
+            raise UploadNotFound('Upload not found')
+        try:
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadConflict('Upload is busy', os.fstat(f.fileno()).st_size)
+            yield f
+        finally:
+            f.close()
+
+    def create(self, task_id: str, filename: str, size, sha256: Optional[str] = None,
+               group: Optional[str] = None) -> dict:
+        """Начинает загрузку; filename уже проверен и очищен вызывающим кодом"""
+        if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+            raise UploadError('Invalid size')
+        if size > self.max_size:
+            raise UploadError(f'File too large (max {self.max_size} bytes)')
+        if sha256 is not None:
+            sha256 = str(sha256).lower()
+            if not _SHA256.fullmatch(sha256):
+                raise UploadError('Invalid sha256')
+        upload_id = uuid.uuid4().hex
+        meta = {'task_id': task_id, 'group': group, 'filename': filename, 'size': size,
+                'sha256': sha256, 'created_at': time.time()}
+        open(self._path(upload_id, 'part'), 'xb').close()
+        with open(self._path(upload_id, 'json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        return self._status(upload_id, meta, 0)
+
+    def status(self, upload_id: str) -> dict:
+        meta = self._meta(upload_id)
+        try:
+            offset = os.path.getsize(self._path(upload_id, 'part'))
+        except OSError:
+            raise UploadNotFound('Upload not found')
+        return self._status(upload_id, meta, offset)
+
+    def write(self, upload_id: str, offset: int, stream: BinaryIO, length: int,
+              sha256: Optional[str] = None) -> dict:
+        """Дописывает часть с позиции offset.
+
+        Без контрольной суммы части принятые байты остаются даже при обрыве
+        соединения. С sha256 часть принимается только целиком: при
+        несовпадении суммы или неполном теле файл обрезается до offset.
+        """
+        meta = self._meta(upload_id)
+        if length <= 0:
+            raise UploadError('Empty chunk')
+        if length > self.max_chunk:
+            raise UploadError(f'Chunk too large (max {self.max_chunk} bytes)')
+        with self._locked(upload_id) as f:
+            current = os.fstat(f.fileno()).st_size
+            if offset != current:
+                raise UploadConflict('Offset mismatch', current)
+            if offset + length > meta['size']:
+                raise UploadError('Chunk exceeds declared size')
+            digest = hashlib.sha256()
+            f.seek(offset)
+            received = 0
+            try:
+                while received < length:
+                    block = stream.read(min(COPY_BUFFER, length - received))
+                    if not block:
+                        break
+                    f.write(block)
+                    digest.update(block)
+                    received += len(block)
+            finally:
+                # При обрыве уже полученное остаётся - кроме части с контрольной суммой
+                f.flush()
+                if sha256 is not None and (received < length or digest.hexdigest() != sha256.lower()):
+                    f.truncate(offset)
+            if received < length:
+                raise UploadError(f'Incomplete chunk: received {received} of {length} bytes')
+            if sha256 is not None and digest.hexdigest() != sha256.lower():
+                raise UploadError('Chunk checksum mismatch')
+            os.fsync(f.fileno())
+        return self._status(upload_id, meta, offset + received)
+
+    def finish(self, upload_id: str, destination: str) -> dict:
+        """Проверяет загрузку и переносит файл в destination; возвращает описание.
+
+        Размер должен совпасть с заявленным, sha256 (если задан) - с
+        содержимым, начало файла - с форматом по расширению.
+        """
+        meta = self._meta(upload_id)
+        path = self._path(upload_id, 'part')
+        with self._locked(upload_id) as f:
+            size = os.fstat(f.fileno()).st_size
+            if size != meta['size']:
+                raise UploadConflict(f"Upload incomplete: {size} of {meta['size']} bytes", size)
+            head = f.read(16)
+            extension = meta['filename'].rsplit('.', 1)[-1].lower()
+            if not _matches_type(head, extension):
+                self._remove(upload_id)
+                raise UploadError('File content does not match its type')
+            if meta['sha256']:
+                f.seek(0)
+                digest = hashlib.sha256()
+                for block in iter(lambda: f.read(COPY_BUFFER), b''):
+                    digest.update(block)
+                if digest.hexdigest() != meta['sha256']:
+                    self._remove(upload_id)
+                    raise UploadError('Checksum mismatch')
+            try:
+                os.replace(path, destination)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                # Каталог загрузок на другой файловой системе (отдельный том)
+                _copy_into(f, destination)
+        self._remove(upload_id)
+        return meta
+
+    def cancel(self, upload_id: str):
+        self._meta(upload_id)
+        self._remove(upload_id)
+
+    def expire(self) -> int:
+        """Удаляет загрузки без активности дольше ttl; возвращает их число"""
+        removed = 0
+        now = time.time()
+        for upload_id in {name.partition('.')[0] for name in os.listdir(self.directory)}:
+            if not _UPLOAD_ID.fullmatch(upload_id):
+                continue
+            touched = []
+            for suffix in ('part', 'json'):
+                try:
+                    touched.append(os.path.getmtime(self._path(upload_id, suffix)))
+                except OSError:
+                    pass
+            if touched and now - max(touched) > self.ttl:
+                self._remove(upload_id)
+                removed += 1
+        return removed
@@ -1,20 +1,25 @@
-from datetime import datetime
-import pytz
+from datetime import datetime, timezone
+from typing import Optional
+
+import timezones
+
+def _parse_task_date(value: str) -> datetime:
+    """Дата задачи в UTC; наивные даты считаются киевским временем"""
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = timezones.localize(dt)
+    # В UTC: даты одной зоны zoneinfo сравниваются без учёта fold
+    return dt.astimezone(timezone.utc)
 
 def get_task_status(task: dict) -> str:
     """
     Определить статус задачи по датам
     Возвращает: 'future', 'preparation', 'preparation_completed', 'urgent'
     """
-    now = datetime.now(pytz.timezone('Europe/Kiev'))
+    now = datetime.now(timezone.utc)
     
-    prep_date = datetime.fromisoformat(task['preparation_date'])
-    event_date = datetime.fromisoformat(task['event_date'])
-    
-    if prep_date.tzinfo is None:
-        prep_date = pytz.timezone('Europe/Kiev').localize(prep_date)
-    if event_date.tzinfo is None:
-        event_date = pytz.timezone('Europe/Kiev').localize(event_date)
+    prep_date = _parse_task_date(task['preparation_date'])
+    event_date = _parse_task_date(task['event_date'])
     
     # Завершена подготовка
     if task.get('is_preparation_completed'):
@@ -31,13 +36,24 @@ def get_task_status(task: dict) -> str:
     # Будущая задача
     return 'future'
 
+def get_next_status_change(task: dict, now: Optional[datetime] = None) -> Optional[datetime]:
+    """Ближайший момент, когда get_task_status вернёт другой статус, или None"""
+    if task.get('is_preparation_completed'):
+        return None
+    now = now or datetime.now(timezone.utc)
+    upcoming = [
+        dt for dt in (_parse_task_date(task['preparation_date']), _parse_task_date(task['event_date']))
+        if dt > now
+    ]
+    return min(upcoming) if upcoming else None
+
 def format_datetime_for_timezone(dt_str: str, timezone_str: str, language='uk') -> str:
     """Форматировать дату/время для определённого часового пояса"""
     dt = datetime.fromisoformat(dt_str)
-    tz = pytz.timezone(timezone_str)
+    tz = timezones.get(timezone_str)
     
     if dt.tzinfo is None:
-        dt = pytz.timezone('Europe/Kiev').localize(dt)
+        dt = timezones.localize(dt)
     
     dt_local = dt.astimezone(tz)
     
@@ -0,0 +1,130 @@
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from metrics import REGISTRY
+from shards import DEFAULT_GROUP, validate_group
+
+logger = logging.getLogger(__name__)
+
+CALLBACKS = REGISTRY.counter(
+    'telegram_callbacks_total', 'Inline button callbacks by action and outcome', ('action', 'outcome'))
+
+# Ответы на нажатие кнопки (всплывающее уведомление в Telegram)
+ANSWERS = {
+    'uk': {'ready': '✅ Ви готові!', 'notgoing': '❌ Позначено: не йду',
+           'not_found': 'Подію не знайдено', 'unknown': 'Невідома дія'},
+    'en': {'ready': "✅ You're ready!", 'notgoing': "❌ Marked as not going",
+           'not_found': 'Event not found', 'unknown': 'Unknown action'},
+}
+
+
+def parse_callback_data(data: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """'ready_<id>[:<группа>]' / 'notgoing_<id>[:<группа>]' -> (действие, id задачи, группа)"""
+    action, _, rest = (data or '').partition('_')
+    task_id, _, group = rest.partition(':')
+    if action not in ('ready', 'notgoing') or not task_id:
+        return None, None, None
+    return action, task_id, group or DEFAULT_GROUP
+
+
+class CallbackProcessor:
+    """Фоновая обработка нажатий inline-кнопок "Готовий / Не йду".
+
+    Вебхук только кладёт callback_query в очередь. Поток-обработчик
+    забирает накопившиеся нажатия пачкой, применяет их к базе одной
+    транзакцией (одно сохранение на пачку) и отвечает на них
+    answerCallbackQuery параллельно.
+    """
+
+    def __init__(self, db, notifier, batch_size: int = 50, max_queue: int = 10000,
+                 answer_workers: int = 8):
+        self.db = db
+        self.notifier = notifier
+        self.batch_size = batch_size
+        self.answer_workers = answer_workers
+        self._queue = queue.Queue(max_queue)
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def submit(self, callback_query: dict) -> bool:
+        """Ставит нажатие в очередь; False, если очередь переполнена"""
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(callback_query)
+            return True
+        except queue.Full:
+            CALLBACKS.inc(action='any', outcome='dropped')
+            return False
+
+    def _ensure_worker(self):
+        # Поток запускается в каждом процессе отдельно (gunicorn --preload форкает воркеры)
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(self._queue.maxsize)
+                self._answers = ThreadPoolExecutor(self.answer_workers, thread_name_prefix='tg-answer')
+                threading.Thread(target=self._run, name='tg-callbacks', daemon=True).start()
+                self._pid = os.getpid()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.process(batch)
+            except Exception:
+                logger.exception("Error processing callback batch", extra={"size": len(batch)})
+
+    def process(self, batch: List[dict]):
+        # Нажатия раскладываются по группам: одна транзакция на группу
+        answers = []
+        by_group = {}
+        for callback in batch:
+            group = parse_callback_data(callback.get('data'))[2] or DEFAULT_GROUP
+            try:
+                group = validate_group(group)
+            except ValueError:
+                group = None
+            # Кнопка с несозданной группой не должна заводить новый шард
+            if group is None or not self.db.exists(group):
+                CALLBACKS.inc(action='unknown', outcome='ignored')
+                answers.append((callback.get('id'), ANSWERS['uk']['unknown']))
+                continue
+            by_group.setdefault(group, []).append(callback)
+        for group, callbacks in by_group.items():
+            with self.db.use(group), self.db.transaction():
+                for callback in callbacks:
+                    answers.append((callback.get('id'), self._apply(callback)))
+        for callback_id, text in answers:
+            if callback_id:
+                self._answers.submit(self.notifier.answer_callback_query, callback_id, text)
+
+    def _apply(self, callback: dict) -> str:
+        user_id = (callback.get('from') or {}).get('id')
+        # Внутри транзакции методы базы возвращают сами записи, а не копии
+        user = self.db.get_user(user_id) if user_id else None
+        texts = ANSWERS.get(user.language if user else None, ANSWERS['uk'])
+
+        action, task_id, _ = parse_callback_data(callback.get('data'))
+        if action is None or not user_id:
+            CALLBACKS.inc(action='unknown', outcome='ignored')
+            return texts['unknown']
+        # Та же логика, что у POST /api/tasks/<id>/ready и /not-going
+        if action == 'ready':
+            task = self.db.mark_ready(task_id, user_id)
+        else:
+            task = self.db.mark_not_going(task_id, user_id)
+        if task is None:
+            CALLBACKS.inc(action=action, outcome='not_found')
+            return texts['not_found']
+        CALLBACKS.inc(action=action, outcome='ok')
+        return texts[action]
@@ -982,46 +982,95 @@ async function deleteTask(taskId) {
 }
 
 // === АРХИВ ===
+const ARCHIVE_PAGE_SIZE = 20;
+let archiveState = {
+    deleted: { items: [], nextCursor: null },
+    completed: { items: [], nextCursor: null },
+    summary: { deleted: 0, completed: 0 }
+};
+
+function fetchArchivePage(type, cursor = null) {
+    let url = `${API_URL}/api/archive/${type}?limit=${ARCHIVE_PAGE_SIZE}`;
+    if (cursor) url += `&cursor=${encodeURIComponent(cursor)}`;
+    return fetch(url).then(r => r.json());
+}
+
 async function loadArchive() {
     try {
         showLoader(currentLang === 'uk' ? 'Завантаження архіву...' : 'Loading archive...');
         
+        const summary = await fetch(`${API_URL}/api/archive/summary`).then(r => r.json());
+        
+        // Загружаем только непустые разделы и только первую страницу
         const [deleted, completed] = await Promise.all([
-            fetch(`${API_URL}/api/archive/deleted`).then(r => r.json()),
-            fetch(`${API_URL}/api/archive/completed`).then(r => r.json())
+            summary.deleted > 0 ? fetchArchivePage('deleted') : { items: [], next_cursor: null },
+            summary.completed > 0 ? fetchArchivePage('completed') : { items: [], next_cursor: null }
         ]);
         
+        archiveState = {
+            deleted: { items: deleted.items, nextCursor: deleted.next_cursor },
+            completed: { items: completed.items, nextCursor: completed.next_cursor },
+            summary
+        };
+        
         hideLoader();
-        renderArchive(deleted, completed);
+        renderArchive();
     } catch (error) {
         hideLoader();
         logDebug('Error loading archive:', error);
     }
 }
 
-function renderArchive(deleted, completed) {
-    const container = document.getElementById('archiveContainer');
+async function loadMoreArchive(type) {
+    const section = archiveState[type];
+    if (!section.nextCursor) return;
     
-    let html = `<h3>${t('deletedTasks', currentLang)}</h3>`;
+    try {
+        showLoader(currentLang === 'uk' ? 'Завантаження архіву...' : 'Loading archive...');
+        const page = await fetchArchivePage(type, section.nextCursor);
+        section.items = section.items.concat(page.items);
+        section.nextCursor = page.next_cursor;
+        hideLoader();
+        renderArchive();
+    } catch (error) {
+        hideLoader();
+        logDebug('Error loading archive page:', error);
+    }
+}
+
+function renderArchiveSection(type, emptyKey) {
+    const section = archiveState[type];
     
-    if (deleted.length === 0) {
-        html += `<div class="empty-state">${t('noDeletedTasks', currentLang)}</div>`;
-    } else {
-        deleted.forEach(task => {
-            html += createArchiveCard(task, 'deleted');
-        });
+    if (section.items.length === 0) {
+        return `<div class="empty-state">${t(emptyKey, currentLang)}</div>`;
     }
     
-    html += `<h3 style="margin-top: 30px;">${t('completedTasks', currentLang)}</h3>`;
+    let html = '';
+    section.items.forEach(task => {
+        html += createArchiveCard(task, type);
+    });
     
-    if (completed.length === 0) {
-        html += `<div class="empty-state">${t('noCompletedTasks', currentLang)}</div>`;
-    } else {
-        completed.forEach(task => {
-            html += createArchiveCard(task, 'completed');
-        });
+    if (section.nextCursor) {
+        html += `
+            <button class="btn btn-secondary" onclick="loadMoreArchive('${type}')">
+                ${t('loadMore', currentLang)}
+            </button>
+        `;
     }
     
+    return html;
+}
+
+function renderArchive() {
+    const container = document.getElementById('archiveContainer');
+    const { summary } = archiveState;
+    
+    let html = `<h3>${t('deletedTasks', currentLang)} (${summary.deleted})</h3>`;
+    html += renderArchiveSection('deleted', 'noDeletedTasks');
+    
+    html += `<h3 style="margin-top: 30px;">${t('completedTasks', currentLang)} (${summary.completed})</h3>`;
+    html += renderArchiveSection('completed', 'noCompletedTasks');
+    
     container.innerHTML = html;
 }
 
@@ -62,6 +62,7 @@ const translations = {
         completedTasks: "Завершені завдання",
         noDeletedTasks: "Немає видалених завдань",
         noCompletedTasks: "Немає завершених завдань",
+        loadMore: "Показати ще",
         
         // Настройки
         language: "Мова",
@@ -151,6 +152,7 @@ const translations = {
         completedTasks: "Completed Tasks",
         noDeletedTasks: "No deleted tasks",
         noCompletedTasks: "No completed tasks",
+        loadMore: "Load more",
         
         // Settings
         language: "Language",